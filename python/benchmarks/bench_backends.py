@@ -0,0 +1,108 @@
+"""
+Benchmark các backend suy luận LLM trên CPU (fp32 / bf16 / int8).
+
+Mỗi backend chạy trong 1 process riêng để đo peak RSS độc lập.
+Cách dùng:
+    python benchmarks/bench_backends.py --backends fp32,bf16,int8 --threads 8 --max-new-tokens 64
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from config import Config
+
+DEFAULT_PROMPTS = [
+    "Giá vịt quay Bắc Kinh là bao nhiêu?",
+    "Nhà hàng mở cửa lúc mấy giờ?",
+    "Gợi ý cho tôi vài món cay.",
+    "Xin chào, bạn khỏe không?",
+]
+
+def run_worker(args):
+    """Chạy trong process con: load model theo backend, đo tokens/sec"""
+    Config.INFERENCE_BACKEND = args.backend
+    Config.TORCH_NUM_THREADS = args.threads
+    Config.PREFIX_CACHE = False
+    if args.model:
+        Config.MODEL_ID = args.model
+
+    from llm_wrapper import LLMWrapper
+
+    load_start = time.perf_counter()
+    llm = LLMWrapper()
+    load_time = time.perf_counter() - load_start
+
+    # Warmup (khởi tạo kernel, bộ nhớ đệm)
+    llm.generate(DEFAULT_PROMPTS[0], max_new_tokens=4)
+
+    new_tokens = 0
+    gen_time = 0.0
+    for _ in range(args.rounds):
+        for prompt in DEFAULT_PROMPTS:
+            llm.generate(prompt, max_new_tokens=args.max_new_tokens)
+            new_tokens += llm.last_stats['new_tokens']
+            gen_time += llm.last_stats['total']
+
+    # ru_maxrss trên Linux tính bằng KB
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({
+        'backend': args.backend,
+        'load_s': round(load_time, 2),
+        'new_tokens': new_tokens,
+        'tokens_per_s': round(new_tokens / gen_time, 2) if gen_time else 0.0,
+        'peak_rss_mb': round(peak_rss_mb, 1),
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="fp32,bf16,int8")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--rounds", type=int, default=1)
+    parser.add_argument("--model", default=None, help="Ghi đè Config.MODEL_ID")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    results = []
+    for backend in args.backends.split(","):
+        cmd = [sys.executable, os.path.abspath(__file__), "--worker", "--backend", backend,
+               "--max-new-tokens", str(args.max_new_tokens), "--rounds", str(args.rounds)]
+        if args.threads:
+            cmd += ["--threads", str(args.threads)]
+        if args.model:
+            cmd += ["--model", args.model]
+
+        print(f"--- Backend {backend} ---")
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, universal_newlines=True)
+        lines = [line for line in proc.stdout.splitlines() if line.startswith("{")]
+        if proc.returncode != 0 or not lines:
+            print(f"Backend {backend} lỗi (exit code {proc.returncode})")
+            continue
+        results.append(json.loads(lines[-1]))
+
+    if not results:
+        return
+    baseline = next((r for r in results if r['backend'] == 'fp32'), None)
+    print("\n" + "=" * 72)
+    print(f"{'backend':<8} {'load (s)':>9} {'tokens/s':>10} {'speedup':>8} {'peak RSS (MB)':>14} {'RSS vs fp32':>12}")
+    print("=" * 72)
+    for r in results:
+        speedup = r['tokens_per_s'] / baseline['tokens_per_s'] if baseline and baseline['tokens_per_s'] else float('nan')
+        rss_ratio = r['peak_rss_mb'] / baseline['peak_rss_mb'] if baseline else float('nan')
+        print(f"{r['backend']:<8} {r['load_s']:>9.2f} {r['tokens_per_s']:>10.2f} {speedup:>7.2f}x "
+              f"{r['peak_rss_mb']:>14.1f} {rss_ratio:>11.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Benchmark tra cứu món: DishIndex (n-gram inverted index) so với cách quét tuyến tính cũ
+của OrderManager.find_dish, trên menu thật và menu giả lập nhiều chi nhánh (mặc định 10k món).
+Kết quả tách theo loại truy vấn: quét tuyến tính dừng ở chuỗi con đầu tiên (exact / partial thường
+dừng sớm -> p50 thấp) và không bắt được lỗi chính tả, nên chỉ so trung bình là chưa đủ.
+
+Cách dùng:
+    python benchmarks/bench_dish_index.py --items 10000 --queries 2000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from dish_index import DishIndex
+
+MENU_PATH = os.path.join(SRC_DIR, '..', 'data', 'menu_v2.json')
+
+def load_menu_items(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    items = []
+    for category in data['menu']['categories']:
+        for item in category['items']:
+            items.append({'id': item['id'], 'name_vn': item['name_vn'], 'name_en': item['name_en']})
+    return items
+
+def synthetic_menu(base_items, size, seed=0):
+    """Ghép món gốc với hậu tố chi nhánh/biến thể để tạo menu lớn"""
+    rng = random.Random(seed)
+    styles = ["đặc biệt", "truyền thống", "kiểu Hồng Kông", "sốt cay", "chi nhánh Quận 1",
+              "chi nhánh Thủ Đức", "size lớn", "combo", "phần nhỏ", "thượng hạng"]
+    items = []
+    for i in range(size):
+        base = rng.choice(base_items)
+        style = rng.choice(styles)
+        items.append({
+            'id': f"{base['id']}_{i}",
+            'name_vn': f"{base['name_vn']} {style} {i}",
+            'name_en': f"{base['name_en']} {i}",
+        })
+    return items
+
+def make_queries(items, count, seed=1):
+    """[(loại, câu truy vấn)]: tên đúng, 1 phần tên, sai chính tả, không có trong menu"""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        name = rng.choice(items)['name_vn'].lower()
+        words = name.split()
+        kind = rng.random()
+        if kind < 0.3:
+            queries.append(('exact', name))
+        elif kind < 0.6:
+            queries.append(('partial', ' '.join(words[:max(2, len(words) // 2)])))
+        elif kind < 0.8:
+            chars = list(name)
+            pos = rng.randrange(len(chars))
+            chars[pos] = rng.choice('aeiou')
+            queries.append(('typo', ''.join(chars)))
+        else:
+            queries.append(('miss', rng.choice(["phở bò", "trà sữa", "gà rán", "bún chả", "cà phê sữa đá"])))
+    return queries
+
+def build_menu_dict(items):
+    """Giống OrderManager._load_menu: {tên thường: item}"""
+    menu = {}
+    for item in items:
+        menu[item['name_vn'].lower()] = item
+        menu[item['name_en'].lower()] = item
+    return menu
+
+def linear_find(menu, dish_name):
+    """Cách cũ: exact match rồi quét tuyến tính tìm chuỗi con hai chiều"""
+    dish_name_lower = dish_name.lower().strip()
+    if dish_name_lower in menu:
+        return menu[dish_name_lower]
+    for key, item in menu.items():
+        if dish_name_lower in key or key in dish_name_lower:
+            return item
+    return None
+
+def timed(fn, queries):
+    latencies = []
+    for q in queries:
+        start = time.perf_counter()
+        fn(q)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    latencies.sort()
+    return {
+        'mean_us': sum(latencies) / len(latencies),
+        'p50_us': latencies[len(latencies) // 2],
+        'p95_us': latencies[int(len(latencies) * 0.95)],
+    }
+
+def run(items, queries, label):
+    menu = build_menu_dict(items)
+
+    start = time.perf_counter()
+    index = DishIndex()
+    for item in items:
+        index.add(item, [item['name_vn'], item['name_en']])
+    build_ms = (time.perf_counter() - start) * 1000
+
+    print(f"\n=== {label}: {len(items)} món, {len(queries)} truy vấn (build index: {build_ms:.1f} ms) ===")
+    print(f"{'':<24} {'mean (µs)':>10} {'p50 (µs)':>10} {'p95 (µs)':>10}")
+    groups = [("all", [q for _, q in queries])]
+    for kind in ('exact', 'partial', 'typo', 'miss'):
+        groups.append((kind, [q for k, q in queries if k == kind]))
+    for kind, group in groups:
+        if not group:
+            continue
+        linear = timed(lambda q: linear_find(menu, q), group)
+        indexed = timed(lambda q: index.best(q, 0.6), group)
+        for name, r in (("linear scan", linear), ("DishIndex", indexed)):
+            print(f"{kind + ' / ' + name:<24} {r['mean_us']:>10.1f} {r['p50_us']:>10.1f} {r['p95_us']:>10.1f}")
+        print(f"{kind + ' speedup (mean)':<24} {linear['mean_us'] / indexed['mean_us']:>10.1f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    base_items = load_menu_items(MENU_PATH)
+    run(base_items, make_queries(base_items, args.queries), "Menu thật")
+    big = synthetic_menu(base_items, args.items)
+    run(big, make_queries(big, args.queries), "Menu giả lập")
+
+if __name__ == "__main__":
+    main()
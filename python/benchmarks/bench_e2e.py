@@ -0,0 +1,241 @@
+"""
+Benchmark end-to-end UniMSRAG.process: phát lại bộ câu hỏi sinh từ menu_v2.json (tên món + mẫu câu)
+qua toàn bộ pipeline (planner, find_dish, giỏ hàng, lịch sử đơn, embed, Qdrant, reader),
+báo cáo throughput và p50/p95/p99 theo từng intent + thời gian từng bước (Tracer).
+
+Mặc định dùng StubLLM / StubEncoder (benchmarks/stub_models.py) để đo phần chi phí ngoài model
+trên máy CI; --real dùng model thật theo Config. Dữ liệu đơn hàng ghi vào thư mục tạm.
+
+Cách dùng:
+    python benchmarks/bench_e2e.py --queries 2000 --users 50 --history 100000
+    python benchmarks/bench_e2e.py --stub-latency-ms 20 --concurrency 4
+    python benchmarks/bench_e2e.py --real --queries 100
+    python benchmarks/bench_e2e.py --corpus my_queries.txt     # mỗi dòng 1 câu (hoặc "user_id<TAB>câu")
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, '..', 'src')
+sys.path.insert(0, SRC_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from config import Config
+
+# Mẫu câu theo intent mong đợi: {dish} = tên món, {qty} = số lượng
+TEMPLATES = {
+    "ORDER": ["Cho tôi {qty} phần {dish}", "Tôi muốn đặt {qty} {dish}", "Đặt {dish}", "Lấy {qty} phần {dish} nhé"],
+    "VIEW_ORDER": ["Xem đơn hàng", "Giỏ hàng của tôi", "Xem lại đơn hiện tại"],
+    "ORDER_HISTORY": ["Lịch sử đơn hàng", "Tôi đã đặt những gì?", "Các đơn cũ của tôi"],
+    "CANCEL_ITEM": ["Hủy món {dish}", "Bỏ {dish} đi", "Xóa {dish} khỏi đơn"],
+    "UPDATE_QUANTITY": ["Đổi {dish} thành {qty} phần", "Thêm {qty} phần {dish}"],
+    "CONFIRM_ORDER": ["Xác nhận đặt hàng", "Chốt đơn", "OK đặt hàng giao lúc 12 giờ"],
+    "SEARCH": ["Giá {dish} là bao nhiêu?", "{dish} có cay không?", "Nhà hàng mở cửa lúc mấy giờ?",
+               "Có món chay không?", "Gợi ý cho tôi vài món cay", "Địa chỉ nhà hàng ở đâu?"],
+    "NO_SEARCH": ["Xin chào", "Cảm ơn bạn", "Tạm biệt nhé"],
+}
+DEFAULT_MIX = {
+    "ORDER": 25, "VIEW_ORDER": 8, "ORDER_HISTORY": 7, "CANCEL_ITEM": 5,
+    "UPDATE_QUANTITY": 5, "CONFIRM_ORDER": 5, "SEARCH": 35, "NO_SEARCH": 10
+}
+
+def load_dishes(menu_path):
+    with open(menu_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return [item for category in data['menu']['categories'] for item in category['items']]
+
+def generate_corpus(dishes, count, users, seed=0, mix=None):
+    """[(user_id, intent mong đợi, câu hỏi)]"""
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    intents, weights = zip(*mix.items())
+    corpus = []
+    for _ in range(count):
+        intent = rng.choices(intents, weights)[0]
+        dish = rng.choice(dishes)
+        query = rng.choice(TEMPLATES[intent]).format(
+            dish=rng.choice([dish['name_vn'], dish['name_vn'].lower(), dish['name_en']]),
+            qty=rng.randint(1, 4)
+        )
+        corpus.append((f"user_{rng.randrange(users)}", intent, query))
+    return corpus
+
+def load_corpus(path):
+    corpus = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            user_id, query = line.split('\t', 1) if '\t' in line else (Config.DEFAULT_USER_ID, line)
+            corpus.append((user_id, None, query))
+    return corpus
+
+def seed_history(log_path, dishes, orders, users, seed=0):
+    """Ghi sẵn `orders` đơn cũ vào log (để đo lịch sử đơn hàng khi log lớn)"""
+    from order_store import OrderStore
+    rng = random.Random(seed)
+    store = OrderStore(log_path)
+    for start in range(0, orders, 1000):
+        batch = []
+        for i in range(start, min(orders, start + 1000)):
+            dish = rng.choice(dishes)
+            batch.append({
+                "order_id": f"seed_{i}",
+                "user_id": f"user_{rng.randrange(users * 20)}",
+                "timestamp": f"2025-01-01 {i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}",
+                "items": [{"id": dish['id'], "name_vn": dish['name_vn'], "quantity": 1}],
+                "total_payment": dish['price'],
+                "status": "confirmed"
+            })
+        store.append_many(batch, fsync=False)
+    store.close()
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+def build_bot(args):
+    from ingest import DataIngestor, create_qdrant_client
+    from rag_engine import UniMSRAG
+
+    if args.real:
+        from llm_wrapper import LLMWrapper
+        llm = None
+    else:
+        from stub_models import install_stubs
+        llm = install_stubs(args.stub_latency_ms)
+        # Artifact dựng bằng model thật không dùng được với StubEncoder
+        Config.EMBEDDINGS_DIR = None
+
+    client = create_qdrant_client()
+    DataIngestor(client).ingest()
+    if llm is None:
+        llm = LLMWrapper()
+    return UniMSRAG(llm, client)
+
+def run(bot, corpus, concurrency):
+    """Chạy corpus, mỗi user được 1 thread xử lý tuần tự (giữ thứ tự giỏ hàng); trả về [(intent mong đợi, turn)]"""
+    by_user = defaultdict(list)
+    for user_id, expected, query in corpus:
+        by_user[user_id].append((expected, query))
+    users = list(by_user)
+    results = []
+    lock = threading.Lock()
+
+    def worker(worker_users):
+        local = []
+        for user_id in worker_users:
+            for expected, query in by_user[user_id]:
+                start = time.perf_counter()
+                try:
+                    bot.process(user_id, query)
+                    turn = dict(bot.tracer.last_turn)
+                except Exception as e:
+                    turn = {'intent': 'ERROR', 'error': repr(e)}
+                turn['latency_ms'] = (time.perf_counter() - start) * 1000
+                local.append((expected, turn))
+        with lock:
+            results.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(users[i::concurrency],)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, time.perf_counter() - start
+
+def report(results, wall):
+    by_intent = defaultdict(list)
+    for _, turn in results:
+        by_intent[turn.get('intent', 'ERROR')].append(turn['latency_ms'])
+
+    print("\n" + "=" * 78)
+    print(f"{'intent':<16} {'count':>6} {'turns/s':>9} {'mean (ms)':>10} {'p50':>8} {'p95':>8} {'p99':>8}")
+    print("=" * 78)
+    for intent, latencies in sorted(by_intent.items(), key=lambda kv: -len(kv[1])):
+        mean = sum(latencies) / len(latencies)
+        print(f"{intent:<16} {len(latencies):>6} {1000 / mean if mean else 0:>9.1f} {mean:>10.2f} "
+              f"{percentile(latencies, 50):>8.2f} {percentile(latencies, 95):>8.2f} {percentile(latencies, 99):>8.2f}")
+    all_latencies = [turn['latency_ms'] for _, turn in results]
+    print("-" * 78)
+    print(f"{'ALL':<16} {len(results):>6} {len(results) / wall:>9.1f} {sum(all_latencies) / len(all_latencies):>10.2f} "
+          f"{percentile(all_latencies, 50):>8.2f} {percentile(all_latencies, 95):>8.2f} {percentile(all_latencies, 99):>8.2f}")
+    print(f"(ALL turns/s = throughput theo wall-clock {wall:.2f}s; theo intent = 1 / latency trung bình)")
+
+    labelled = [(expected, turn.get('intent')) for expected, turn in results if expected]
+    if labelled:
+        agree = sum(expected == intent for expected, intent in labelled)
+        print(f"Intent khớp mẫu câu: {agree}/{len(labelled)} ({agree / len(labelled):.1%})")
+    errors = [turn['error'] for _, turn in results if 'error' in turn]
+    if errors:
+        print(f"Lỗi: {len(errors)} lượt, ví dụ: {errors[0]}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--history", type=int, default=10000, help="Số đơn cũ ghi sẵn vào log")
+    parser.add_argument("--concurrency", type=int, default=1, help="Số thread (mỗi user do 1 thread xử lý)")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus", default=None, help="File câu hỏi thay cho corpus sinh tự động")
+    parser.add_argument("--dump-corpus", default=None, help="Ghi corpus sinh ra vào file (user_id<TAB>câu)")
+    parser.add_argument("--data-dir", default=os.path.join(BENCH_DIR, '..', 'data'))
+    parser.add_argument("--real", action="store_true", help="Dùng model thật thay cho stub")
+    parser.add_argument("--stub-latency-ms", type=float, default=0.0, help="Thời gian giả lập mỗi lần gọi StubLLM")
+    parser.add_argument("--verbose", action="store_true", help="Giữ log in ra của pipeline")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench_e2e_")
+    Config.DATA_DIR = os.path.abspath(args.data_dir)
+    Config.QDRANT_PATH = ":memory:"
+    Config.QUERY_CACHE_PATH = None
+    Config.ORDER_LOG_PATH = os.path.join(tmp_dir, "orders_log.jsonl")
+    Config.TRACE_ENABLED = True
+    Config.TRACE_PATH = os.devnull
+
+    dishes = load_dishes(os.path.join(Config.DATA_DIR, 'menu_v2.json'))
+    if args.corpus:
+        corpus = load_corpus(args.corpus)
+    else:
+        corpus = generate_corpus(dishes, args.queries + args.warmup, args.users, args.seed)
+    if args.dump_corpus:
+        with open(args.dump_corpus, 'w', encoding='utf-8') as f:
+            f.writelines(f"{user_id}\t{query}\n" for user_id, _, query in corpus)
+    if args.history:
+        seed_history(Config.ORDER_LOG_PATH, dishes, args.history, args.users, args.seed)
+
+    try:
+        bot = build_bot(args)
+        out = sys.stdout if args.verbose else open(os.devnull, 'w')
+        with contextlib.redirect_stdout(out):
+            warmup = [(f"warmup_{u}", e, q) for u, e, q in corpus[:args.warmup]]
+            run(bot, warmup, 1)
+            bot.tracer = type(bot.tracer)()  # bỏ số liệu warmup
+            results, wall = run(bot, corpus[args.warmup:], args.concurrency)
+            bot.order_manager.close()
+
+        mode = "model thật" if args.real else f"stub (LLM latency {args.stub_latency_ms} ms)"
+        print(f"Benchmark E2E - {mode}, {len(results)} lượt, {args.users} user, "
+              f"{args.history} đơn cũ, concurrency {args.concurrency}")
+        report(results, wall)
+        print()
+        print(bot.tracer.summary())
+        if not args.real:
+            print(f"StubLLM calls: {bot.llm.calls}, StubEncoder calls: {bot.encoder.calls}")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark speculative decoding (assisted generation với draft model) so với generate thường.
+
+Prompt là prompt reader thật: câu hỏi về menu + 3 document liên quan nhất trong menu_v2.json (BM25),
+ngữ cảnh rút gọn qua ContextBuilder như UniMSRAG.
+Với greedy decoding, kết quả của 2 chế độ phải giống nhau; báo cáo tokens/sec, latency,
+tỉ lệ chấp nhận token nháp và tỉ lệ câu trả lời trùng khớp.
+Cách dùng:
+    python benchmarks/bench_speculative.py --draft Qwen/Qwen2.5-0.5B-Instruct --max-new-tokens 128
+    python benchmarks/bench_speculative.py --model Qwen/Qwen2.5-1.5B-Instruct --draft Qwen/Qwen2.5-0.5B-Instruct --num-draft-tokens 4
+"""
+import argparse
+import os
+import sys
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+from config import Config
+
+DEFAULT_QUESTIONS = [
+    "Vịt quay Bắc Kinh có gì đặc biệt?",
+    "Gợi ý cho tôi vài món cay.",
+    "Há cảo bách hoa làm từ gì?",
+    "Nhà hàng có món chay nào?",
+    "Món nào hợp để uống cùng bia?",
+    "Mô tả món bò tay cầm Hòa Viên.",
+]
+
+def build_prompts(questions, tokenizer=None):
+    """
+    Prompt reader giống UniMSRAG: câu hỏi + 3 document menu liên quan nhất (BM25),
+    ngữ cảnh dựng qua ContextBuilder như pipeline thật, prompt qua UniMSRAG.reader_prompt (classmethod)
+    """
+    from context_builder import ContextBuilder
+    from hybrid_retriever import BM25Index
+    from ingest import DataIngestor
+    from rag_engine import UniMSRAG
+
+    docs = DataIngestor(None).load_menu(os.path.join(Config.DATA_DIR, "menu_v2.json"))
+    index = BM25Index([(i, doc['text']) for i, doc in enumerate(docs)])
+    builder = ContextBuilder(tokenizer)
+    prompts = []
+    for question in questions:
+        contexts = builder.build(question, [docs[i] for i, _ in index.search(question, 3)])
+        prompts.append(UniMSRAG.reader_prompt(question, contexts))
+    return prompts
+
+def run(llm, prompts, max_new_tokens, rounds):
+    outputs, latencies = [], []
+    stats = {'new_tokens': 0, 'total': 0.0, 'draft_tokens': 0, 'accepted_tokens': 0}
+    for _ in range(rounds):
+        for prompt in prompts:
+            outputs.append(llm.generate(prompt, max_new_tokens=max_new_tokens))
+            latencies.append(llm.last_stats['total'])
+            for key in stats:
+                stats[key] += llm.last_stats.get(key, 0)
+    return outputs, latencies, stats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=None, help="LLM chính (mặc định Config.MODEL_ID)")
+    parser.add_argument("--draft", default=Config.DRAFT_MODEL_ID, help="Draft model (mặc định Config.DRAFT_MODEL_ID)")
+    parser.add_argument("--num-draft-tokens", type=int, default=Config.DRAFT_NUM_TOKENS)
+    parser.add_argument("--max-new-tokens", type=int, default=128)
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--data-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data'))
+    args = parser.parse_args()
+    if not args.draft:
+        parser.error("Cần --draft hoặc Config.DRAFT_MODEL_ID")
+
+    if args.model:
+        Config.MODEL_ID = args.model
+    Config.DRAFT_MODEL_ID = args.draft
+    Config.DRAFT_NUM_TOKENS = args.num_draft_tokens
+    Config.TORCH_NUM_THREADS = args.threads
+    Config.DATA_DIR = os.path.abspath(args.data_dir)
+
+    from llm_wrapper import LLMWrapper
+    llm = LLMWrapper()
+    if llm.draft is None:
+        sys.exit("Không dùng được draft model (xem log ở trên).")
+    draft = llm.draft
+    prompts = build_prompts(DEFAULT_QUESTIONS, llm.tokenizer)
+
+    # Warmup cả 2 chế độ
+    llm.generate(prompts[0], max_new_tokens=8)
+    llm.draft = None
+    llm.generate(prompts[0], max_new_tokens=8)
+
+    results = {}
+    for mode in ("plain", "speculative"):
+        llm.draft = draft if mode == "speculative" else None
+        results[mode] = run(llm, prompts, args.max_new_tokens, args.rounds)
+
+    print(f"\nModel: {Config.MODEL_ID}, draft: {args.draft}, {len(prompts)} prompt x {args.rounds} vòng, "
+          f"max_new_tokens={args.max_new_tokens}")
+    print("=" * 78)
+    print(f"{'mode':<12} {'tokens':>7} {'tokens/s':>9} {'mean (s)':>9} {'p95 (s)':>8} {'acceptance':>11}")
+    print("=" * 78)
+    for mode, (_, latencies, stats) in results.items():
+        latencies = sorted(latencies)
+        p95 = latencies[min(len(latencies) - 1, int(round(0.95 * (len(latencies) - 1))))]
+        acceptance = f"{stats['accepted_tokens'] / stats['draft_tokens']:.1%}" if stats['draft_tokens'] else "-"
+        print(f"{mode:<12} {stats['new_tokens']:>7} {stats['new_tokens'] / stats['total']:>9.2f} "
+              f"{sum(latencies) / len(latencies):>9.2f} {p95:>8.2f} {acceptance:>11}")
+
+    plain, speculative = results["plain"], results["speculative"]
+    same = sum(a == b for a, b in zip(plain[0], speculative[0]))
+    speedup = (speculative[2]['new_tokens'] / speculative[2]['total']) / (plain[2]['new_tokens'] / plain[2]['total'])
+    print(f"\nSpeedup: {speedup:.2f}x, câu trả lời trùng khớp: {same}/{len(plain[0])}")
+
+if __name__ == "__main__":
+    main()
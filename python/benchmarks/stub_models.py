@@ -0,0 +1,116 @@
+"""
+Model giả lập (deterministic) thay cho SentenceTransformer và LLMWrapper khi benchmark,
+để đo phần chi phí không phải model (planner rule, find_dish, giỏ hàng, lịch sử đơn, Qdrant...)
+trên máy CI không có GPU / không tải được model.
+
+    from stub_models import install_stubs
+    llm = install_stubs(llm_latency_ms=0)   # đăng ký StubEncoder vào ModelRegistry, trả về StubLLM
+"""
+import hashlib
+import re
+import threading
+import time
+import unicodedata
+import numpy as np
+
+class StubEncoder:
+    """
+    Encoder giả: băm từng từ (bỏ dấu) vào 1 vector `dim` chiều rồi chuẩn hóa,
+    câu có nhiều từ chung sẽ có cosine cao -> Qdrant vẫn trả kết quả hợp lý
+    """
+    def __init__(self, dim=128):
+        self.dim = dim
+        self.calls = 0
+
+    def _embed(self, text):
+        text = unicodedata.normalize('NFD', text.lower()).replace('đ', 'd')
+        text = ''.join(c for c in text if unicodedata.category(c) != 'Mn')
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in re.findall(r'\w+', text):
+            bucket = int.from_bytes(hashlib.md5(word.encode('utf-8')).digest()[:4], 'little')
+            vector[bucket % self.dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, sentences, **kwargs):
+        self.calls += 1
+        if isinstance(sentences, str):
+            return self._embed(sentences)
+        return np.stack([self._embed(s) for s in sentences])
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+class StubLLM:
+    """
+    Thay cho LLMWrapper (cùng interface generate/generate_batch/generate_stream/classify/register_prefix):
+    - Câu trả lời cố định sinh từ prompt, không phụ thuộc model
+    - latency_ms: thời gian giả lập cho mỗi lần gọi model (0 = không chờ)
+    - Planner LLM luôn trả SEARCH (các câu rõ ràng đã được bộ luật IntentClassifier xử lý)
+    """
+    PLANNER_ANSWER = "[SEARCH]"
+
+    def __init__(self, latency_ms=0.0, tokens_per_answer=32):
+        self.latency = latency_ms / 1000
+        self.tokens_per_answer = tokens_per_answer
+        self.calls = 0
+        self.prefix_stats = {'hits': 0, 'misses': 0}
+        self._local = threading.local()
+
+    @property
+    def last_stats(self):
+        return getattr(self._local, "stats", {})
+
+    def register_prefix(self, name, prompt_prefix=""):
+        pass
+
+    def _call(self, prompts, max_new_tokens=512):
+        self.calls += 1
+        start = time.perf_counter()
+        if self.latency:
+            time.sleep(self.latency)
+        total = time.perf_counter() - start
+        new_tokens = min(self.tokens_per_answer, max_new_tokens)
+        row = {'new_tokens': new_tokens, 'hit_cap': new_tokens >= max_new_tokens, 'raw_chars': 0, 'stop_chars': 0}
+        self._local.stats = {
+            'total': total,
+            'prefill': total / 2,
+            'decode': total / 2,
+            'prompt_tokens': sum(len(p.split()) for p in prompts),
+            **row,
+            'new_tokens': new_tokens * len(prompts),
+            'rows': [row] * len(prompts)
+        }
+
+    def _answer(self, prompt):
+        if "Phân loại ý định" in prompt:
+            return self.PLANNER_ANSWER
+        digest = hashlib.md5(prompt.encode('utf-8')).hexdigest()[:8]
+        return f"Câu trả lời mẫu {digest}."
+
+    def generate(self, prompt, max_new_tokens=512, stop=None):
+        self._call([prompt], max_new_tokens)
+        return self._answer(prompt)
+
+    def generate_batch(self, prompts, max_new_tokens=512, batch_size=None, stop=None):
+        self._call(prompts, max_new_tokens)
+        return [self._answer(p) for p in prompts]
+
+    def generate_stream(self, prompt, max_new_tokens=512, stop=None):
+        answer = self.generate(prompt, max_new_tokens, stop)
+        for word in answer.split(' '):
+            yield word + ' '
+
+    def classify(self, prompt, labels):
+        self._call([prompt])
+        intent = self.PLANNER_ANSWER.strip('[]')
+        return intent, {label: float(label == intent) for label in labels}
+
+    def classify_batch(self, prompts, labels, batch_size=None):
+        return [self.classify(p, labels) for p in prompts]
+
+def install_stubs(llm_latency_ms=0.0, dim=128):
+    """Đăng ký StubEncoder vào ModelRegistry (phải gọi trước khi tạo DataIngestor/UniMSRAG), trả về StubLLM"""
+    from model_registry import ModelRegistry
+    ModelRegistry.register("encoder", StubEncoder(dim))
+    return StubLLM(llm_latency_ms)
@@ -0,0 +1,78 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+from config import Config
+
+class SemanticAnswerCache:
+    """
+    Cache câu trả lời cho nhánh SEARCH:
+    - Key = embedding câu hỏi (so khớp theo cosine >= threshold)
+      + danh sách (point_id, content_hash) của các document Qdrant đã truy xuất
+    - Document đổi nội dung -> content_hash đổi -> entry cũ không còn khớp
+    - clear() được gọi khi DataIngestor.ingest thay đổi dữ liệu
+    """
+    def __init__(self, max_size=None, threshold=None):
+        self.max_size = Config.ANSWER_CACHE_SIZE if max_size is None else max_size
+        self.threshold = Config.ANSWER_CACHE_THRESHOLD if threshold is None else threshold
+        self._entries = OrderedDict()  # {entry_id: (context_key, vector, answer)}
+        self._buckets = {}             # {context_key: set(entry_id)}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def context_key(hits):
+        """Chữ ký của ngữ cảnh truy xuất (không phụ thuộc thứ tự kết quả)"""
+        return tuple(sorted((str(hit.id), (hit.payload or {}).get('content_hash')) for hit in hits))
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, query_vector, context_key):
+        """Trả câu trả lời đã cache nếu có câu hỏi tương đương với cùng ngữ cảnh, ngược lại None"""
+        query = self._unit(query_vector)
+        with self._lock:
+            best_id, best_score = None, self.threshold
+            for entry_id in self._buckets.get(context_key, ()):
+                score = float(np.dot(self._entries[entry_id][1], query))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+
+            if best_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id][2]
+
+    def store(self, query_vector, context_key, answer):
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (context_key, self._unit(query_vector), answer)
+            self._buckets.setdefault(context_key, set()).add(entry_id)
+
+            while len(self._entries) > self.max_size:
+                old_id, (old_key, _, _) = self._entries.popitem(last=False)
+                bucket = self._buckets[old_key]
+                bucket.discard(old_id)
+                if not bucket:
+                    del self._buckets[old_key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
@@ -0,0 +1,97 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+
+class QueueFullError(Exception):
+    """Hàng đợi request đã đầy - server trả 503 để client thử lại sau"""
+
+class MicroBatchScheduler:
+    """
+    Gom các request đồng thời thành batch cho UniMSRAG.process_batch:
+    - Request đầu tiên mở cửa sổ max_wait_ms, các request tới trong cửa sổ được gom chung (tối đa max_batch)
+    - Cả batch chạy 1 lần process_batch: 1 lần encode + 1 lần generate_batch cho reader / chitchat
+    - Mọi tác vụ dùng model (batch, stream) chạy tuần tự trên 1 thread riêng nên event loop không bị chặn
+    - Số request đang chờ vượt max_queue -> QueueFullError (backpressure)
+    """
+    def __init__(self, bot, max_batch=None, max_wait_ms=None, max_queue=None):
+        self.bot = bot
+        self.max_batch = Config.SERVER_MAX_BATCH if max_batch is None else max_batch
+        self.max_wait = (Config.SERVER_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms) / 1000
+        self.max_queue = Config.SERVER_MAX_QUEUE if max_queue is None else max_queue
+        # 1 thread duy nhất chạy model (thay cho model lock)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model")
+        self._queue = None
+        self._task = None
+        self.depth = 0
+        self.batches = 0
+        self.requests = 0
+        self.rejected = 0
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=True)
+
+    async def submit(self, user_id, query):
+        """Đưa 1 câu hỏi vào hàng đợi và chờ câu trả lời"""
+        if self.depth >= self.max_queue:
+            self.rejected += 1
+            raise QueueFullError(f"Hàng đợi đầy ({self.depth} request đang chờ)")
+        future = asyncio.get_event_loop().create_future()
+        self.depth += 1
+        self._queue.put_nowait((user_id, query, future))
+        return await future
+
+    async def run_exclusive(self, fn, *args):
+        """Chạy fn trên thread model, tuần tự với các batch (dùng cho stream)"""
+        return await asyncio.get_event_loop().run_in_executor(self._executor, fn, *args)
+
+    async def _collect(self):
+        loop = asyncio.get_event_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            self.depth -= len(batch)
+            try:
+                responses = await self.run_exclusive(self.bot.process_batch, [(u, q) for u, q, _ in batch])
+            except Exception as e:
+                responses = [e] * len(batch)
+            self.batches += 1
+            self.requests += len(batch)
+
+            for (_, _, future), response in zip(batch, responses):
+                if future.done():  # client đã ngắt kết nối
+                    continue
+                if isinstance(response, Exception):
+                    future.set_exception(response)
+                else:
+                    future.set_result(response)
+
+    def stats(self):
+        return {
+            'queue_depth': self.depth,
+            'batches': self.batches,
+            'requests': self.requests,
+            'avg_batch': self.requests / self.batches if self.batches else 0.0,
+            'rejected': self.rejected
+        }
@@ -6,10 +6,22 @@ class Config:
     
     # Embedding Model (Nhẹ, hiệu quả cho tiếng Việt/Anh)
     EMBEDDING_MODEL = "AITeamVN/Vietnamese_Embedding"
-    
-    # Qdrant settings (Local memory mode cho chấm bài)
-    QDRANT_PATH = ":memory:"
-    COLLECTION_NAME = "hoa_vien_data"
+
+    # Backend suy luận LLM trên CPU (GPU luôn dùng fp16):
+    # "fp32" (mặc định cũ), "bf16" (giảm 1/2 RAM), "int8" (dynamic quantization các lớp Linear)
+    # Chạy benchmarks/bench_backends.py để chọn backend phù hợp cho từng máy
+    INFERENCE_BACKEND = "fp32"
+    # Số thread torch dùng cho suy luận (None = mặc định của torch)
+    TORCH_NUM_THREADS = None
+
+    # Load LLM ở thread nền trong lúc ingest dữ liệu (encoder) để rút ngắn thời gian khởi động
+    PARALLEL_MODEL_LOADING = True
+
+    # Planner: ngưỡng tin cậy để bộ luật quyết định intent mà không cần gọi LLM
+    INTENT_RULE_THRESHOLD = 0.8
+    # Cách LLM planner phân loại:
+    # "classify" = 1 lần forward, chấm điểm token nhãn (1-8); "generate" = sinh tag [INTENT] rồi parse
+    PLANNER_MODE = "classify"
     
     # Paths (Tương thích với Docker volume mount trong util.sh)
     INPUT_DIR = "/nlp/input"
@@ -33,4 +45,108 @@ class Config:
     # OUTPUT_DIR = os.path.join(ROOT_DIR, "2211522/output")
     
     # # Đường dẫn tới thư mục data (chứa menu.json, v.v.)
-    # DATA_DIR = os.path.join(PYTHON_DIR, "data")
\ No newline at end of file
+    # DATA_DIR = os.path.join(PYTHON_DIR, "data")
+
+    # Qdrant settings (đặt sau DATA_DIR để theo đúng đường dẫn data đang dùng)
+    # Lưu index xuống đĩa để lần khởi động sau chỉ embed lại các document đã thay đổi.
+    # Đặt ":memory:" để dùng chế độ in-memory như cũ (ingest lại toàn bộ mỗi lần chạy)
+    QDRANT_PATH = os.path.join(DATA_DIR, "qdrant_storage")
+    COLLECTION_NAME = "hoa_vien_data"
+
+    # Cache embedding cho câu hỏi lặp lại (retriever)
+    QUERY_CACHE_SIZE = 1024
+    # Đường dẫn file .npy để giữ cache qua các lần khởi động (None = chỉ cache trong RAM)
+    # Ví dụ: os.path.join(DATA_DIR, "query_cache.npy")
+    QUERY_CACHE_PATH = None
+
+    # Cache câu trả lời SEARCH theo ngữ nghĩa (cosine giữa embedding câu hỏi + cùng ngữ cảnh truy xuất)
+    ANSWER_CACHE_SIZE = 512
+    ANSWER_CACHE_THRESHOLD = 0.95
+
+    # Truy xuất: "hybrid" = BM25 (bỏ dấu) + vector, gộp bằng Reciprocal Rank Fusion; "dense" = chỉ vector
+    RETRIEVAL_MODE = "hybrid"
+    # Số ứng viên lấy từ mỗi nguồn (BM25, vector) trước khi gộp
+    HYBRID_CANDIDATES = 10
+    RRF_K = 60
+    # Lọc theo giá ("dưới 100k"), loại món, chay, cay trích từ câu hỏi (Qdrant payload filter)
+    RETRIEVAL_FILTERS = True
+
+    # Trả lời theo mẫu câu hỏi giá món / giờ mở cửa / địa chỉ / liên hệ (bỏ qua retriever + reader LLM)
+    FAST_ANSWERS = True
+
+    # Chế độ file input: xử lý theo batch (planner/encoder/Qdrant/reader mỗi bước 1 lần cho cả batch)
+    BATCH_MODE = True
+    BATCH_SIZE = 8
+
+    # Giữ sẵn KV-cache cho phần đầu cố định của prompt (system message, hướng dẫn planner)
+    PREFIX_CACHE = True
+
+    # Điểm tối thiểu (0-1) để OrderManager.find_dish chấp nhận món gần đúng
+    DISH_MATCH_THRESHOLD = 0.6
+
+    # File log đơn hàng đã xác nhận (None = python/data/orders_log.jsonl)
+    ORDER_LOG_PATH = None
+    # Ghi log đơn hàng (group commit): gom các đơn xác nhận trong khoảng thời gian này thành 1 lần ghi
+    ORDER_FLUSH_INTERVAL_MS = 5
+    # Số đơn tối đa trong 1 lần ghi
+    ORDER_MAX_BATCH = 64
+    # fsync sau mỗi lần ghi (False = để hệ điều hành tự flush, nhanh hơn nhưng có thể mất đơn khi mất điện)
+    ORDER_FSYNC = True
+    # File log vượt quá kích thước này (byte) sẽ được rotate thành segment lưu trữ
+    ORDER_LOG_MAX_BYTES = 64 * 1024 * 1024
+
+    # Phiên khách hàng: giỏ hàng không hoạt động quá SESSION_TTL giây sẽ bị xóa
+    SESSION_TTL = 30 * 60
+    # Số phiên tối đa giữ trong bộ nhớ (vượt quá thì xóa phiên ít dùng nhất)
+    MAX_SESSIONS = 10000
+    # user_id dùng cho chế độ terminal / file input (1 khách hàng)
+    DEFAULT_USER_ID = "demo_user"
+
+    # Server HTTP/WebSocket (server.py)
+    SERVER_HOST = "0.0.0.0"
+    SERVER_PORT = 8080
+    # Micro-batching: gom các request tới trong SERVER_MAX_WAIT_MS thành 1 batch (tối đa SERVER_MAX_BATCH)
+    SERVER_MAX_BATCH = 8
+    SERVER_MAX_WAIT_MS = 10
+    # Số request tối đa đang chờ trong hàng đợi, vượt quá trả 503
+    SERVER_MAX_QUEUE = 64
+    # Số kết nối WebSocket được stream cùng lúc
+    SERVER_MAX_STREAMS = 4
+    # Số worker process (fork sau khi load model, dùng chung trọng số), 1 = chạy trong 1 process
+    SERVER_WORKERS = 1
+    # Số thread torch mỗi worker (None = số CPU / SERVER_WORKERS)
+    SERVER_WORKER_THREADS = None
+    # Ghim mỗi worker vào nhóm CPU riêng (Linux)
+    SERVER_PIN_CPUS = True
+
+    # Đo thời gian từng bước (planner, embed, search, reader, order...) của mỗi lượt hỏi-đáp
+    TRACE_ENABLED = False
+    # File JSON lines ghi kết quả đo (None = in ra stderr)
+    TRACE_PATH = None
+    # Lưu cProfile của lượt chậm hơn ngưỡng này (ms), None = tắt
+    PROFILE_SLOW_TURN_MS = None
+    PROFILE_DIR = os.path.join(OUTPUT_DIR, "profiles")
+
+    # Embedding dựng sẵn lúc build image (python src/embedding_artifact.py), ingest dùng lại thay vì chạy encoder
+    # None = luôn encode lúc khởi động
+    EMBEDDINGS_DIR = os.path.join(DATA_DIR, "embeddings")
+
+    # Speculative decoding: model nháp nhỏ cùng tokenizer với MODEL_ID (vd. "Qwen/Qwen2.5-0.5B-Instruct")
+    # đề xuất trước nhiều token, LLM chính kiểm tra 1 lần forward. None = generate thường
+    DRAFT_MODEL_ID = None
+    # Số token nháp mỗi bước (None = mặc định của transformers, tự điều chỉnh theo tỉ lệ chấp nhận)
+    DRAFT_NUM_TOKENS = None
+
+    # Ngân sách max_new_tokens cho từng loại generate (reader = trả lời thông tin, recommend = gợi ý món)
+    GENERATION_BUDGETS = {"planner": 30, "chitchat": 30, "reader": 300, "recommend": 300}
+    # Tự hạ max_new_tokens theo độ dài thực tế gần đây của từng loại (p95 x 1.25, không vượt ngân sách)
+    ADAPTIVE_GENERATION_CAP = True
+
+    # Ngữ cảnh của reader: chỉ lấy các trường liên quan tới loại câu hỏi + bỏ ý trùng (False = ghép nguyên text)
+    CONTEXT_COMPRESSION = True
+    # Số token tối đa của phần ngữ cảnh trong prompt reader (None = không giới hạn)
+    READER_CONTEXT_TOKENS = 256
+
+    # Kiểm tra menu_v2.json mỗi MENU_WATCH_INTERVAL giây, đổi thì cập nhật menu + Vector DB không cần khởi động lại
+    # None = tắt
+    MENU_WATCH_INTERVAL = 2.0
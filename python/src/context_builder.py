@@ -0,0 +1,200 @@
+import re
+import threading
+from collections import Counter
+from config import Config
+from hybrid_retriever import tokenize
+
+class ContextBuilder:
+    """
+    Dựng ngữ cảnh cho prompt reader từ payload của các document truy xuất được:
+    - Chỉ lấy các trường liên quan tới loại câu hỏi (hỏi giá -> tên + giá, hỏi món chay -> tên + chế độ ăn...)
+    - Bỏ các ý trùng lặp giữa FAQ / thông tin nhà hàng / menu (ý mới gần như nằm trọn trong 1 ý đã có)
+    - Giới hạn tổng số token của ngữ cảnh (đếm bằng tokenizer thật của LLM), bỏ bớt ý cuối khi vượt
+    - Thống kê số token prompt tiết kiệm được so với ghép nguyên text của document
+    """
+    # (loại câu hỏi, từ khóa) - loại đầu tiên khớp được chọn
+    QUESTION_TYPES = [
+        ("price", ['giá', 'bao nhiêu tiền', 'bao tiền', 'đắt', 'rẻ']),
+        ("prep_time", ['bao lâu', 'thời gian chuẩn bị', 'lâu không', 'có nhanh']),
+        ("dietary", ['chay', 'ăn kiêng', 'dị ứng', 'gluten', 'vegan']),
+        ("spicy", ['cay']),
+        ("hours", ['giờ mở', 'mở cửa', 'đóng cửa', 'mấy giờ']),
+        ("location", ['địa chỉ', 'ở đâu', 'chỗ nào']),
+        ("contact", ['số điện thoại', 'sđt', 'liên hệ', 'hotline', 'zalo', 'đặt bàn']),
+        ("recommend", ['gợi ý', 'nên ăn', 'muốn ăn', 'ăn gì', 'món nào', 'ngọt', 'chua', 'đặc sản', 'signature']),
+        ("describe", ['là gì', 'làm từ', 'có gì', 'mô tả', 'thành phần', 'như thế nào', 'ra sao', 'hương vị']),
+    ]
+    # Trường của document menu theo loại câu hỏi (trường đầu = tên món, luôn giữ)
+    MENU_FIELDS = {
+        "price": ("name", "price"),
+        "prep_time": ("name", "preparation_time"),
+        "dietary": ("name", "dietary", "description"),
+        "spicy": ("name", "spicy_level", "description"),
+        "recommend": ("name", "category", "price", "description", "tags"),
+        "describe": ("name", "description", "tags", "category"),
+        "general": ("name", "category", "price", "description"),
+    }
+    # Trường của thông tin nhà hàng theo loại câu hỏi
+    INFO_FIELDS = {
+        "hours": ("name", "hours"),
+        "location": ("name", "address"),
+        "contact": ("name", "phone", "address"),
+        "general": ("name", "address", "hours", "phone", "description"),
+    }
+    # Ý mới có >= DEDUP_OVERLAP số từ nằm trong 1 ý đã chọn -> bỏ. Chỉ xét ý dài từ DEDUP_MIN_WORDS từ:
+    # ý ngắn là thuộc tính của từng món (giá, độ cay...), trùng chữ nhưng không trùng nghĩa
+    DEDUP_OVERLAP = 0.8
+    DEDUP_MIN_WORDS = 6
+    _SENTENCE = re.compile(r'(?<=[.!?])\s+')
+
+    def __init__(self, tokenizer=None, budget=None, enabled=None):
+        self.tokenizer = tokenizer
+        self.budget = Config.READER_CONTEXT_TOKENS if budget is None else budget
+        self.enabled = Config.CONTEXT_COMPRESSION if enabled is None else enabled
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats = Counter()  # turns, full_tokens, context_tokens, dropped_facts
+
+    @property
+    def last_stats(self):
+        """Thống kê của lần build gần nhất trong thread hiện tại (question_type, full/context/saved_tokens)"""
+        return getattr(self._local, 'stats', {})
+
+    def count_tokens(self, text):
+        """Số token theo tokenizer của LLM (không có tokenizer -> đếm từ)"""
+        if self.tokenizer is None:
+            return len(text.split())
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    @classmethod
+    def question_type(cls, user_query):
+        query = user_query.lower()
+        for qtype, keywords in cls.QUESTION_TYPES:
+            if any(keyword in query for keyword in keywords):
+                return qtype
+        return "general"
+
+    @staticmethod
+    def _menu_fact(payload, field):
+        value = payload.get(field)
+        if field == "name":
+            name_en = payload.get('name_en')
+            return f"Món: {value} ({name_en})" if name_en else f"Món: {value}"
+        if field == "category":
+            return f"Loại: {value}" if value else None
+        if field == "price":
+            return f"Giá: {value} VND" if value is not None else None
+        if field == "description":
+            return f"Mô tả: {value}" if value else None
+        if field == "tags":
+            return f"Đặc điểm: {', '.join(value)}" if value else None
+        if field == "dietary":
+            return f"Chế độ ăn: {', '.join(value) if value else 'không có ghi chú'}"
+        if field == "spicy_level":
+            return f"Độ cay: {value}/3" if value else "Không cay"
+        if field == "preparation_time":
+            return f"Thời gian chuẩn bị: {value} phút" if value else None
+        return None
+
+    @staticmethod
+    def _info_fact(payload, field):
+        labels = {"name": "Nhà hàng", "address": "Địa chỉ", "hours": "Giờ mở cửa", "phone": "SĐT", "description": "Mô tả"}
+        value = payload.get(field)
+        return f"{labels[field]}: {value}" if value else None
+
+    def facts(self, payload, qtype):
+        """Các ý (câu ngắn) của 1 document theo loại câu hỏi; ý đầu tiên là ý chính (tên món / câu hỏi FAQ)"""
+        source = payload.get('source')
+        if source == "menu" and 'description' in payload:
+            fields = self.MENU_FIELDS.get(qtype, self.MENU_FIELDS["general"])
+            facts = [self._menu_fact(payload, field) for field in fields]
+        elif source == "info" and 'address' in payload:
+            fields = self.INFO_FIELDS.get(qtype, self.INFO_FIELDS["general"])
+            facts = [self._info_fact(payload, field) for field in fields]
+        elif source == "faq" and 'question' in payload:
+            facts = [f"Hỏi: {payload['question']}"] + self._SENTENCE.split(payload['answer'])
+        else:
+            # Payload cũ (chưa có trường riêng) -> giữ nguyên text
+            facts = [payload.get('text', '')]
+        return [fact for fact in facts if fact]
+
+    @staticmethod
+    def render(payload, facts):
+        if payload.get('source') == "faq" and 'question' in payload:
+            return f"{facts[0]} - Trả lời: {' '.join(facts[1:])}"
+        return ". ".join(facts) + "."
+
+    def _is_duplicate(self, words, seen, anchor=False):
+        if not words:
+            return True
+        if anchor:
+            # Ý chính (tên món / câu hỏi) chỉ trùng khi giống hệt: "Vịt quay (Nửa con)" khác "Vịt quay (Cả con)"
+            return words in seen
+        if len(words) < self.DEDUP_MIN_WORDS:
+            return False
+        return any(len(words & other) >= self.DEDUP_OVERLAP * len(words) for other in seen)
+
+    def build(self, user_query, payloads):
+        """Danh sách ngữ cảnh (mỗi document 1 dòng) cho reader_prompt, theo thứ tự truy xuất"""
+        full = [payload.get('text', '') for payload in payloads]
+        if not self.enabled:
+            self._local.stats = {}
+            return full
+
+        qtype = self.question_type(user_query)
+        contexts, seen, used, dropped = [], [], 0, 0
+        for payload in payloads:
+            kept = []
+            for i, fact in enumerate(self.facts(payload, qtype)):
+                words = set(tokenize(fact))
+                if self._is_duplicate(words, seen, anchor=i == 0):
+                    dropped += 1
+                    if i == 0:
+                        # Ý chính đã có (cùng món / cùng câu hỏi) -> bỏ cả document
+                        break
+                    continue
+                kept.append((fact, words))
+            # FAQ cần cả câu hỏi lẫn ít nhất 1 câu trả lời
+            min_facts = 2 if payload.get('source') == "faq" and 'question' in payload else 1
+            if len(kept) < min_facts:
+                continue
+
+            # Giới hạn token: bỏ dần các ý cuối của document cho tới khi vừa ngân sách
+            facts = [fact for fact, _ in kept]
+            line = self.render(payload, facts)
+            tokens = self.count_tokens(f"- {line}\n")
+            while self.budget and used + tokens > self.budget and len(facts) > min_facts:
+                facts.pop()
+                dropped += 1
+                line = self.render(payload, facts)
+                tokens = self.count_tokens(f"- {line}\n")
+            if self.budget and used + tokens > self.budget and contexts:
+                break
+            contexts.append(line)
+            seen.extend(words for _, words in kept[:len(facts)])
+            used += tokens
+
+        full_tokens = self.count_tokens("\n".join(f"- {c}" for c in full))
+        context_tokens = self.count_tokens("\n".join(f"- {c}" for c in contexts))
+        self._local.stats = {
+            'question_type': qtype,
+            'full_tokens': full_tokens,
+            'context_tokens': context_tokens,
+            'saved_tokens': full_tokens - context_tokens,
+        }
+        with self._lock:
+            self.stats['turns'] += 1
+            self.stats['full_tokens'] += full_tokens
+            self.stats['context_tokens'] += context_tokens
+            self.stats['dropped_facts'] += dropped
+        return contexts
+
+    def summary(self):
+        with self._lock:
+            s = Counter(self.stats)
+        if not s['turns']:
+            return "[Context] Chưa có dữ liệu."
+        saved = s['full_tokens'] - s['context_tokens']
+        return (f"[Context] {s['turns']} lượt, token ngữ cảnh trung bình {s['context_tokens'] / s['turns']:.1f} "
+                f"(gốc {s['full_tokens'] / s['turns']:.1f}), tiết kiệm {saved / s['turns']:.1f} token/lượt "
+                f"({saved / s['full_tokens'] if s['full_tokens'] else 0:.1%}), bỏ {s['dropped_facts']} ý")
@@ -0,0 +1,268 @@
+import re
+import unicodedata
+from bisect import bisect_right
+from collections import Counter, defaultdict
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+def _strip_marks(text: str) -> str:
+    text = unicodedata.normalize('NFD', text).replace('đ', 'd')
+    return ''.join(c for c in text if unicodedata.category(c) != 'Mn')
+
+# Bảng bỏ dấu dựng sẵn cho chữ Latin có dấu (dựng sẵn 1 lần, str.translate nhanh hơn normalize từng ký tự)
+_FOLD_TABLE = {
+    code: _strip_marks(chr(code))
+    for code in list(range(0xC0, 0x250)) + list(range(0x1E00, 0x1F00))
+    if chr(code).islower() and _strip_marks(chr(code)) != chr(code)
+}
+_NON_WORD = re.compile(r'[^\w\s]')
+
+def fold_accents(text: str) -> str:
+    """Bỏ dấu tiếng Việt + chữ thường: 'Vịt quay Bắc Kinh' -> 'vit quay bac kinh'"""
+    text = text.lower().translate(_FOLD_TABLE)
+    if not text.isascii():
+        # Dấu dạng tổ hợp (chuỗi NFD) hoặc ký tự ngoài bảng
+        text = _strip_marks(text)
+    return ' '.join(_NON_WORD.sub(' ', text).split())
+
+def _ngrams(text: str, n: int):
+    padded = f" {text} "
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+class DishIndex:
+    """
+    Chỉ mục tra cứu món ăn theo tên (thay cho quét tuyến tính menu_items):
+    - Mỗi món có nhiều tên: name_vn, name_en, alias, và tên bỏ phần trong ngoặc
+    - Tên được bỏ dấu, tách thành character n-gram, lưu inverted index n-gram -> tên
+    - search() chỉ chấm điểm các tên có chung n-gram hiếm với câu truy vấn; menu nhỏ
+      (<= LINEAR_SCAN_MAX_NAMES tên) thì duyệt hết posting list, chấm mọi tên có n-gram chung
+    - best() khớp nguyên tên (cả dấu) trả về ngay bằng 1 lần tra dict, không bỏ dấu / chấm điểm;
+      menu nhỏ thì tìm tên chứa / nằm trong câu truy vấn (tra dict + str.find) trước khi chấm n-gram
+    """
+    # Số n-gram hiếm nhất của câu truy vấn dùng để lấy ứng viên
+    CANDIDATE_NGRAMS = 4
+    # Số ứng viên (nhiều n-gram chung nhất) được chấm điểm đầy đủ
+    MAX_CANDIDATES = 32
+    # Giới hạn tổng độ dài posting list được duyệt (n-gram quá phổ biến thì bỏ qua)
+    MAX_POSTINGS = 1024
+    # Phần đầu tên món được coi là nhắc tới món ('gà hấp muối' -> 'Gà hấp muối Đông Quang'):
+    # ít nhất MIN_MENTION_WORDS từ và ít nhất 1 nửa số từ của tên
+    MIN_MENTION_WORDS = 2
+    # Số tên tối đa để search() duyệt hết posting list, best() tìm tên chứa / nằm trong câu trước (menu thật ~50 tên)
+    LINEAR_SCAN_MAX_NAMES = 256
+
+    def __init__(self, n: int = 3):
+        self.n = n
+        self._names = []            # [(folded, lower, ngram set, item, order, ' folded ')]
+        self._exact = {}            # {folded name: [name_id]}
+        self._lower = {}            # {tên chữ thường (cả dấu): name_id đầu tiên}
+        self._arrays = {}           # {ngram: posting list dạng numpy} (menu lớn)
+        self._joined = None         # (' tên 1 \n tên 2 \n...', [vị trí bắt đầu của từng tên]) cho _contained
+        self._postings = defaultdict(list)  # {ngram: [name_id]}
+        self._mentions = defaultdict(set)   # {tên / phần đầu tên đã bỏ dấu: {order}}
+        self._by_order = []                 # [item] theo thứ tự thêm vào
+        self._items = 0
+
+    def add(self, item: Dict, names: Iterable[str]):
+        """Thêm 1 món với danh sách tên gọi của món đó"""
+        order = self._items
+        self._items += 1
+        self._by_order.append(item)
+        self._arrays.clear()
+        self._joined = None
+
+        variants = set()
+        for name in names:
+            if not name:
+                continue
+            lower = name.lower().strip()
+            variants.add(lower)
+            # 'Vịt quay Bắc Kinh (Nửa con)' -> thêm biến thể 'vịt quay bắc kinh'
+            short = re.sub(r'\s*\(.*?\)\s*', ' ', lower).strip()
+            if short:
+                variants.add(short)
+
+        for lower in sorted(variants):
+            folded = fold_accents(lower)
+            if not folded:
+                continue
+            name_id = len(self._names)
+            grams = _ngrams(folded, self.n)
+            self._names.append((folded, lower, grams, item, order, f" {folded} "))
+            self._exact.setdefault(folded, []).append(name_id)
+            self._lower.setdefault(lower, name_id)
+            for gram in grams:
+                self._postings[gram].append(name_id)
+            words = folded.split()
+            for size in range(max(self.MIN_MENTION_WORDS, (len(words) + 1) // 2), len(words) + 1):
+                self._mentions[' '.join(words[:size])].add(order)
+            if len(words) < self.MIN_MENTION_WORDS:
+                self._mentions[folded].add(order)
+
+    def __len__(self):
+        return self._items
+
+    def _score(self, name_id, shared, query_folded, padded_q, query_lower, query_size):
+        """Điểm của 1 tên; shared = số n-gram chung với câu truy vấn (None = khớp nguyên tên)"""
+        folded, lower, grams, _, _, padded_name = self._names[name_id]
+        if shared is None:
+            score = 1.0
+        else:
+            score = 2.0 * shared / (query_size + len(grams))
+
+        # Chứa trọn tên (theo ranh giới từ): 'cho tôi cam ép' chứa 'cam ép',
+        # hoặc câu truy vấn là 1 phần tên: 'vịt quay' nằm trong 'vịt quay bắc kinh'.
+        # Chỉ xảy ra khi mọi n-gram của tên (hoặc của câu truy vấn) đều là n-gram chung
+        if shared is None or shared == len(grams) or shared == query_size:
+            if padded_name in padded_q:
+                score = max(score, 0.9 + 0.1 * len(folded) / len(query_folded))
+            elif padded_q in padded_name:
+                score = max(score, 0.8 + 0.1 * len(query_folded) / len(folded))
+
+        # Ưu tiên tên khớp cả dấu
+        if lower == query_lower or lower in query_lower or query_lower in lower:
+            score += 0.01
+        return score
+
+    def _shared_counts(self, query_grams, exact_ids):
+        """{name_id: số n-gram chung} của các tên được chấm điểm"""
+        known = [g for g in query_grams if g in self._postings]
+        if len(self._names) <= self.LINEAR_SCAN_MAX_NAMES:
+            # Menu nhỏ: duyệt hết posting list -> số n-gram chung chính xác của mọi tên, không cần chọn ứng viên
+            return Counter(chain.from_iterable(self._postings[gram] for gram in known))
+
+        # Menu lớn: ứng viên = các tên có nhiều n-gram hiếm chung nhất, rồi đếm chính xác
+        known.sort(key=lambda g: len(self._postings[g]))
+        selected = []
+        budget = self.MAX_POSTINGS
+        for gram in known[:self.CANDIDATE_NGRAMS]:
+            size = len(self._postings[gram])
+            if selected and size > budget:
+                break
+            selected.append(gram)
+            budget -= size
+        candidate_ids = set(exact_ids or ())
+        if len(selected) == 1:
+            # 1 posting list (n-gram hiếm nhất đã vượt ngân sách): mọi tên đồng hạng -> lấy MAX_CANDIDATES tên đầu
+            candidate_ids.update(self._postings[selected[0]][:self.MAX_CANDIDATES])
+        elif selected:
+            # Đếm bằng numpy (posting list dài hàng trăm - hàng nghìn tên); đồng hạng -> name_id nhỏ trước
+            ids, counts = np.unique(np.concatenate([self._posting_array(g) for g in selected]), return_counts=True)
+            top = np.argsort(-counts, kind='stable')[:self.MAX_CANDIDATES]
+            candidate_ids.update(ids[top].tolist())
+        return {name_id: len(query_grams & self._names[name_id][2]) for name_id in candidate_ids}
+
+    def _posting_array(self, gram):
+        """Posting list dạng numpy (dựng lần đầu cần dùng, xóa khi add() thêm tên)"""
+        array = self._arrays.get(gram)
+        if array is None:
+            array = self._arrays[gram] = np.asarray(self._postings[gram], dtype=np.int64)
+        return array
+
+    def search(self, query: str, limit: int = 5, min_score: float = 0.0) -> List[Tuple[Dict, float]]:
+        """Trả về tối đa `limit` món phù hợp nhất có điểm >= min_score [(item, score)], score giảm dần"""
+        query_lower = ' '.join(query.lower().split())
+        query_folded = fold_accents(query_lower)
+        if not query_folded:
+            return []
+        return self._search(query_lower, query_folded, limit, min_score)
+
+    def _search(self, query_lower, query_folded, limit, min_score):
+        padded_q = f" {query_folded} "
+
+        exact_ids = self._exact.get(query_folded)
+        if exact_ids and limit == 1:
+            # Khớp nguyên tên (bỏ dấu) -> không cần chấm điểm ứng viên khác
+            return [max(((self._names[i][3], self._score(i, None, query_folded, padded_q, query_lower, 0))
+                         for i in exact_ids), key=lambda r: r[1])]
+
+        query_grams = _ngrams(query_folded, self.n)
+        query_size = len(query_grams)
+        best = {}  # {order: (score, item)} - mỗi món chỉ giữ tên có điểm cao nhất
+        for name_id, shared in self._shared_counts(query_grams, exact_ids).items():
+            grams_size = len(self._names[name_id][2])
+            if shared != grams_size and shared != query_size and \
+                    2.0 * shared / (query_size + grams_size) + 0.01 < min_score:
+                # Không chứa / nằm trong tên được -> điểm tối đa là Dice + 0.01, chưa tới min_score
+                continue
+            score = self._score(name_id, shared, query_folded, padded_q, query_lower, query_size)
+            order, item = self._names[name_id][4], self._names[name_id][3]
+            if order not in best or score > best[order][0]:
+                best[order] = (score, item)
+
+        # Điểm bằng nhau -> giữ thứ tự món trong menu
+        ranked = sorted(best.items(), key=lambda kv: (-kv[1][0], kv[0]))
+        return [(item, score) for _, (score, item) in ranked[:limit] if score >= min_score]
+
+    def mentions(self, text: str) -> List[Dict]:
+        """
+        Các món được nhắc tới trong câu (tên đầy đủ hoặc phần đầu tên nằm nguyên văn trong câu, bỏ dấu):
+        'Gà hấp muối có cay không?' -> [Gà hấp muối Đông Quang (Nửa con)]. Cụm dài nhất được ưu tiên.
+        """
+        words = fold_accents(text).split()
+        for size in range(len(words), 0, -1):
+            found = set()
+            for start in range(len(words) - size + 1):
+                found.update(self._mentions.get(' '.join(words[start:start + size]), ()))
+            if found:
+                return [self._by_order[order] for order in sorted(found)]
+        return []
+
+    def _joined_names(self):
+        """Mọi tên (đã bỏ dấu, có khoảng trắng 2 đầu) nối thành 1 chuỗi, dựng lần đầu cần dùng"""
+        if self._joined is None:
+            starts, position = [], 0
+            for name in self._names:
+                starts.append(position)
+                position += len(name[5]) + 1
+            self._joined = ('\n'.join(name[5] for name in self._names), starts)
+        return self._joined
+
+    def _contained(self, query_lower, query_folded):
+        """
+        Menu nhỏ: tên nằm trong câu truy vấn / chứa câu truy vấn (theo ranh giới từ, bỏ dấu), điểm như _score:
+        tra các cụm từ liên tiếp của câu trong _exact + str.find trên chuỗi nối mọi tên, không quét từng tên.
+        Return (item, score) của tên điểm cao nhất (đồng điểm -> món đứng trước), (None, 0.0) nếu không có
+        """
+        found = {}  # {name_id: điểm chứa}
+        words = query_folded.split()
+        for size in range(1, len(words) + 1):
+            for start in range(len(words) - size + 1):
+                span = ' '.join(words[start:start + size])
+                for name_id in self._exact.get(span, ()):
+                    found[name_id] = 0.9 + 0.1 * len(span) / len(query_folded)
+        joined, starts = self._joined_names()
+        padded_q = f" {query_folded} "
+        position = joined.find(padded_q)
+        while position != -1:
+            name_id = bisect_right(starts, position) - 1
+            found.setdefault(name_id, 0.8 + 0.1 * len(query_folded) / len(self._names[name_id][0]))
+            position = joined.find(padded_q, position + 1)
+        best, best_key = None, None
+        for name_id, score in found.items():
+            _, lower, _, item, order, _ = self._names[name_id]
+            if lower in query_lower or query_lower in lower:
+                score += 0.01
+            if best_key is None or (score, -order) > best_key:
+                best, best_key = item, (score, -order)
+        return (best, best_key[0]) if best is not None else (None, 0.0)
+
+    def best(self, query: str, min_score: float) -> Optional[Dict]:
+        """Món phù hợp nhất nếu điểm >= min_score, ngược lại None"""
+        query_lower = ' '.join(query.lower().split())
+        name_id = self._lower.get(query_lower)
+        if name_id is not None and min_score <= 1.0:
+            # Khớp nguyên tên cả dấu = điểm cao nhất có thể
+            return self._names[name_id][3]
+        query_folded = fold_accents(query_lower)
+        if not query_folded:
+            return None
+        if len(self._names) <= self.LINEAR_SCAN_MAX_NAMES:
+            # Menu nhỏ: tên chứa / nằm trong câu truy vấn rẻ hơn đếm n-gram; chỉ chấm n-gram khi không có tên nào như vậy
+            # (menu lớn: str.find trên chuỗi nối mọi tên chậm hơn chọn ứng viên khi không tên nào khớp)
+            item, score = self._contained(query_lower, query_folded)
+            if item is not None and score >= min_score:
+                return item
+        results = self._search(query_lower, query_folded, 1, min_score)
+        return results[0][0] if results else None
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+import numpy as np
+from config import Config
+
+def model_fingerprint(model_name: Optional[str] = None) -> str:
+    """Tên model embedding + revision trong HF cache (nếu có) - không cần load model"""
+    model_name = model_name or Config.EMBEDDING_MODEL
+    if os.path.isdir(model_name):
+        return os.path.abspath(model_name)
+    try:
+        from huggingface_hub import snapshot_download
+        return f"{model_name}@{os.path.basename(snapshot_download(model_name, local_files_only=True))}"
+    except Exception:
+        return model_name
+
+class EmbeddingArtifact:
+    """
+    Embedding dựng sẵn cho các document của menu (tạo lúc build Docker image):
+    - vectors.npy: ma trận float16 (n, dim), mở dạng memory-mapped (không copy vào RAM)
+    - payloads.json: [{point_id, content_hash, doc}] theo đúng thứ tự hàng của vectors.npy
+    - manifest.json: phiên bản định dạng, model fingerprint, hash dữ liệu, kích thước
+    DataIngestor lấy vector theo content_hash của từng document; document đổi nội dung
+    (hoặc model khác) không có trong artifact -> chạy encoder như cũ.
+    """
+    FORMAT_VERSION = 1
+    MANIFEST = "manifest.json"
+    VECTORS = "vectors.npy"
+    PAYLOADS = "payloads.json"
+
+    def __init__(self, manifest: Dict, vectors: np.ndarray, payloads: List[Dict]):
+        self.manifest = manifest
+        self.vectors = vectors
+        self.payloads = payloads
+        self._rows = {p['content_hash']: i for i, p in enumerate(payloads)}
+
+    @property
+    def dim(self) -> int:
+        return int(self.manifest['dim'])
+
+    def vector(self, content_hash: str) -> Optional[np.ndarray]:
+        """Vector float32 của document có content_hash, None nếu không có trong artifact"""
+        row = self._rows.get(content_hash)
+        return None if row is None else np.asarray(self.vectors[row], dtype=np.float32)
+
+    @staticmethod
+    def data_hash(content_hashes: List[str]) -> str:
+        return hashlib.sha256("\n".join(sorted(content_hashes)).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def build(cls, docs: List[Dict], encoder, out_dir: str) -> "EmbeddingArtifact":
+        """Encode toàn bộ document rồi ghi artifact vào out_dir (manifest ghi sau cùng)"""
+        from ingest import DataIngestor
+        vectors = np.asarray(encoder.encode([doc['text'] for doc in docs]), dtype=np.float16)
+        payloads = [
+            {"point_id": DataIngestor.point_id(doc), "content_hash": DataIngestor.content_hash(doc), "doc": doc}
+            for doc in docs
+        ]
+        manifest = {
+            "format_version": cls.FORMAT_VERSION,
+            "model": Config.EMBEDDING_MODEL,
+            "model_fingerprint": model_fingerprint(),
+            "data_hash": cls.data_hash([p['content_hash'] for p in payloads]),
+            "count": len(docs),
+            "dim": int(vectors.shape[1]),
+            "dtype": "float16",
+            "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+        os.makedirs(out_dir, exist_ok=True)
+        # Ghi ra file tạm rồi đổi tên, manifest cuối cùng -> không bao giờ đọc phải artifact ghi dở
+        np.save(os.path.join(out_dir, cls.VECTORS + ".tmp.npy"), vectors)
+        os.replace(os.path.join(out_dir, cls.VECTORS + ".tmp.npy"), os.path.join(out_dir, cls.VECTORS))
+        for name, content in ((cls.PAYLOADS, payloads), (cls.MANIFEST, manifest)):
+            tmp_path = os.path.join(out_dir, name + ".tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(content, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, os.path.join(out_dir, name))
+        return cls(manifest, vectors, payloads)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["EmbeddingArtifact"]:
+        """Mở artifact (vectors memory-mapped); None nếu không có hoặc không dùng được (model khác, hỏng...)"""
+        manifest_path = os.path.join(path, cls.MANIFEST)
+        if not os.path.exists(manifest_path):
+            return None
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get('format_version') != cls.FORMAT_VERSION:
+                print(f"Embedding artifact: định dạng {manifest.get('format_version')} không hỗ trợ, bỏ qua.")
+                return None
+            fingerprint = model_fingerprint()
+            if manifest.get('model_fingerprint') != fingerprint:
+                print(f"Embedding artifact: model không khớp ({manifest.get('model_fingerprint')} != {fingerprint}), bỏ qua.")
+                return None
+            vectors = np.load(os.path.join(path, cls.VECTORS), mmap_mode='r')
+            with open(os.path.join(path, cls.PAYLOADS), 'r', encoding='utf-8') as f:
+                payloads = json.load(f)
+            if vectors.shape != (manifest['count'], manifest['dim']) or len(payloads) != manifest['count']:
+                print("Embedding artifact: kích thước không khớp manifest, bỏ qua.")
+                return None
+            return cls(manifest, vectors, payloads)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Embedding artifact: không đọc được ({e}), bỏ qua.")
+            return None
+
+if __name__ == "__main__":
+    # Dựng artifact lúc build image: python src/embedding_artifact.py [thư mục output]
+    import sys
+    from ingest import DataIngestor
+    from model_registry import ModelRegistry
+    out_dir = sys.argv[1] if len(sys.argv) > 1 else Config.EMBEDDINGS_DIR
+    docs = DataIngestor(None).load_menu(os.path.join(Config.DATA_DIR, "menu_v2.json"))
+    if not docs:
+        sys.exit("Không có dữ liệu để dựng embedding artifact.")
+    artifact = EmbeddingArtifact.build(docs, ModelRegistry.get_encoder(), out_dir)
+    print(f"Đã ghi {artifact.manifest['count']} vector ({artifact.dim} chiều, float16) -> {out_dir}")
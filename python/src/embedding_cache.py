@@ -0,0 +1,174 @@
+import json
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+from config import Config
+from embedding_artifact import model_fingerprint
+
+class QueryEmbeddingCache:
+    """
+    LRU cache cho embedding của câu hỏi người dùng:
+    - Key là câu hỏi đã chuẩn hóa (NFC, chữ thường, gộp khoảng trắng, bỏ dấu câu cuối)
+    - Giới hạn số phần tử, tự loại bỏ phần tử ít dùng nhất khi đầy
+    - Có thể lưu xuống file .npy và mở lại dạng memory-mapped khi khởi động; file .keys.json ghi kèm
+      model (fingerprint), số chiều, backend encoder -> đổi model / backend thì bỏ cache cũ
+    """
+    # Đổi khi thay đổi định dạng file .keys.json -> cache cũ bị bỏ qua
+    FORMAT_VERSION = 1
+    def __init__(self, encoder, max_size=None, persist_path=None):
+        self.encoder = encoder
+        self.max_size = Config.QUERY_CACHE_SIZE if max_size is None else max_size
+        self.persist_path = persist_path
+        self._entries = OrderedDict()  # {normalized_query: vector}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if persist_path:
+            self.load(persist_path)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Chuẩn hóa câu hỏi để các câu gần giống nhau dùng chung 1 key"""
+        text = unicodedata.normalize('NFC', text).lower()
+        text = ' '.join(text.split())
+        return re.sub(r'[\s?!.,;:…]+$', '', text)
+
+    def _put(self, key, vector):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def encode(self, query: str):
+        """Trả embedding của câu hỏi, chỉ chạy encoder khi cache miss"""
+        key = self.normalize(query)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+            self.misses += 1
+
+        vector = self.encoder.encode(query)
+        with self._lock:
+            self._put(key, vector)
+        return vector
+
+    def encode_batch(self, queries):
+        """Encode nhiều câu hỏi, các câu miss được encode chung trong 1 lần gọi encoder"""
+        keys = [self.normalize(q) for q in queries]
+        vectors = [None] * len(queries)
+        missing = OrderedDict()  # {key: query} - câu trùng nhau chỉ encode 1 lần
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    vectors[i] = vector
+                else:
+                    self.misses += 1
+                    missing.setdefault(key, queries[i])
+
+        if missing:
+            encoded = dict(zip(missing.keys(), self.encoder.encode(list(missing.values()))))
+            with self._lock:
+                for key, vector in encoded.items():
+                    self._put(key, vector)
+            vectors = [encoded[key] if v is None else v for key, v in zip(keys, vectors)]
+        return vectors
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+    @staticmethod
+    def _keys_path(path):
+        return path + ".keys.json"
+
+    def _backend(self):
+        """Lớp encoder + backend của sentence-transformers (torch / onnx / openvino) nếu có"""
+        cls = type(self.encoder)
+        name = f"{cls.__module__}.{cls.__name__}"
+        backend = getattr(self.encoder, 'backend', None)
+        return f"{name}:{backend}" if isinstance(backend, str) else name
+
+    def _encoder_dim(self):
+        get_dim = getattr(self.encoder, 'get_sentence_embedding_dimension', None)
+        return get_dim() if get_dim is not None else None
+
+    def load(self, path):
+        """Mở cache đã lưu (vector đọc dạng memory-mapped, không copy vào RAM)"""
+        keys_path = self._keys_path(path)
+        if not (os.path.exists(path) and os.path.exists(keys_path)):
+            return 0
+        try:
+            with open(keys_path, 'r', encoding='utf-8') as f:
+                header = json.load(f)
+            vectors = np.load(path, mmap_mode='r')
+        except (OSError, ValueError) as e:
+            print(f"Không thể đọc query cache: {e}")
+            return 0
+        if not isinstance(header, dict) or header.get('format_version') != self.FORMAT_VERSION:
+            # File cũ (chỉ có danh sách key) không biết được tạo bằng model nào
+            print("Query cache không có thông tin model, bỏ qua.")
+            return 0
+
+        expected = {'model': model_fingerprint(), 'dim': self._encoder_dim() or header.get('dim'),
+                    'backend': self._backend()}
+        saved = {key: header.get(key) for key in expected}
+        if saved != expected:
+            print(f"Query cache của model khác ({saved} != {expected}), bỏ qua.")
+            return 0
+        keys = header.get('keys') or []
+        if vectors.ndim != 2 or vectors.shape != (len(keys), header['dim']):
+            print("Query cache không khớp số lượng key/vector, bỏ qua.")
+            return 0
+
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                self._put(key, vector)
+        return len(keys)
+
+    def save(self, path=None):
+        """Ghi cache xuống file .npy (ghi file tạm rồi os.replace để không hỏng file cũ)"""
+        path = path or self.persist_path
+        if not path:
+            return
+        with self._lock:
+            keys = list(self._entries.keys())
+            vectors = [np.asarray(v, dtype=np.float32) for v in self._entries.values()]
+        if not keys:
+            return
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # File tạm riêng cho từng process (nhiều worker server có thể cùng lưu)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        matrix = np.stack(vectors)
+        header = {
+            "format_version": self.FORMAT_VERSION,
+            "model": model_fingerprint(),
+            "dim": int(matrix.shape[1]),
+            "backend": self._backend(),
+            "keys": keys,
+        }
+        with open(tmp_path, 'wb') as f:
+            np.save(f, matrix)
+        with open(tmp_path + ".keys", 'w', encoding='utf-8') as f:
+            json.dump(header, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        os.replace(tmp_path + ".keys", self._keys_path(path))
@@ -0,0 +1,146 @@
+import json
+import re
+from typing import Dict, Iterable, List, Optional
+from config import Config
+
+class FastAnswerer:
+    """
+    Trả lời theo mẫu cho câu hỏi tra cứu 1 trường dữ liệu (không cần retriever + reader LLM):
+    - Giá món: tên món tra qua DishIndex của MenuCatalog -> 'price'
+    - Giờ mở cửa / địa chỉ / liên hệ: block 'restaurant' trong menu_v2.json
+    - Từ khóa lấy từ block `chatbot_intents` (price_inquiry, hours, location, contact)
+    Câu hỏi gợi ý / mở (món nào ngon, nên ăn gì...) hoặc không xác định được món -> None (để LLM trả lời)
+    """
+    EXTRA_KEYWORDS = {
+        'price_inquiry': ['bao nhiêu tiền', 'giá tiền'],
+        'hours': [],
+        'location': [],
+        'contact': ['sđt', 'hotline', 'zalo', 'email', 'điện thoại'],
+    }
+    # Giờ mở cửa / địa chỉ chỉ nhận cụm từ chặt, không dùng từ khóa lỏng của chatbot_intents
+    # ('mấy giờ', 'open'...): 'Giao hàng tới mấy giờ?' không phải hỏi giờ mở cửa
+    STRICT_KEYWORDS = {
+        'hours': ['mở cửa', 'đóng cửa', 'giờ mở cửa', 'giờ làm việc', 'giờ hoạt động', 'opening hours'],
+        'location': ['địa chỉ', 'ở đâu', 'address'],
+    }
+    # Dịch vụ / đối tượng khác nhà hàng và món ăn: có trong câu thì câu hỏi không còn là tra cứu 1 trường
+    # ('Chỗ đậu xe ở đâu?', 'Phí giao hàng bao nhiêu?') -> để LLM trả lời
+    SERVICE_KEYWORDS = ['giao hàng', 'giao tận', 'ship', 'shipper', 'delivery', 'mang về', 'takeaway',
+                        'đậu xe', 'đỗ xe', 'gửi xe', 'bãi xe', 'parking', 'chuẩn bị', 'đặt bàn', 'đặt tiệc',
+                        'phòng riêng', 'wifi', 'nhà vệ sinh', 'toilet', 'thanh toán', 'chuyển khoản',
+                        'khuyến mãi', 'giảm giá', 'hóa đơn', 'phí', 'vat']
+    # Nhiều món khác nhau có điểm trong khoảng này so với món khớp nhất ('gà' -> 3 món gà) -> để LLM trả lời
+    AMBIGUITY_MARGIN = 0.05
+    OPEN_ENDED_KEYWORDS = ['gợi ý', 'nên ăn', 'nên gọi', 'món nào', 'ngon', 'rẻ nhất', 'đắt nhất',
+                           'so sánh', 'khác nhau', 'dưới', 'trên', 'khoảng', 'những món', 'các món']
+    # Từ không thuộc tên món trong câu hỏi giá
+    PRICE_FILLER = ['giá', 'tiền', 'bao nhiêu', 'là', 'của', 'món', 'một', '1', 'phần', 'đĩa', 'ly', 'suất',
+                    'vậy', 'thế', 'ạ', 'nhỉ', 'nhé', 'cho hỏi', 'hỏi', 'price', 'cost', 'how much', 'is', 'the', 'of']
+
+    def __init__(self, menu_path: str, menu):
+        """menu: MenuCatalog (hoặc OrderManager) - tra cứu món + thông tin nhà hàng"""
+        self.menu = menu
+        self.restaurant = menu.restaurant
+        intents = self._load_intent_keywords(menu_path)
+        self._topics = {
+            topic: self._compile(self.STRICT_KEYWORDS.get(topic) or intents.get(topic, []) + extra)
+            for topic, extra in self.EXTRA_KEYWORDS.items()
+        }
+        self._recommend = self._compile(intents.get('recommendation', []) + self.OPEN_ENDED_KEYWORDS)
+        self._services = self._compile(self.SERVICE_KEYWORDS)
+        self._filler = self._compile(self.PRICE_FILLER)
+        # Thống kê số câu trả lời theo mẫu / chuyển cho LLM
+        self.hits = 0
+        self.misses = 0
+
+    def _load_intent_keywords(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return {k: [w.lower() for w in v] for k, v in data.get('chatbot_intents', {}).items()}
+        except FileNotFoundError as e:
+            print(f"Error loading chatbot intents: {e}")
+            return {}
+
+    @staticmethod
+    def _compile(keywords: Iterable[str]):
+        words = sorted({k for k in keywords if k}, key=len, reverse=True)
+        if not words:
+            return None
+        return re.compile(r'(?<!\w)(?:' + '|'.join(re.escape(w) for w in words) + r')(?!\w)')
+
+    def answer(self, user_query: str) -> Optional[str]:
+        """Câu trả lời theo mẫu, None nếu không phải câu hỏi tra cứu đơn giản"""
+        text = ' '.join(re.sub(r'[?!.,]', ' ', user_query.lower()).split())
+        topics = [topic for topic, regex in self._topics.items() if regex is not None and regex.search(text)]
+        if not topics or (self._recommend is not None and self._recommend.search(text)) or \
+                (self._services is not None and self._services.search(text)):
+            self.misses += 1
+            return None
+        # Giờ mở cửa / địa chỉ / liên hệ mà câu có nhắc tới món ('Vịt quay mở cửa bán tới mấy giờ?') -> LLM
+        if topics != ['price_inquiry'] and self.menu.mentioned_dishes(text):
+            self.misses += 1
+            return None
+
+        parts = []
+        for topic in topics:
+            part = getattr(self, f"_answer_{topic}")(text)
+            if part is None:
+                self.misses += 1
+                return None
+            parts.append(part)
+        self.hits += 1
+        return "\n".join(parts)
+
+    def _answer_price_inquiry(self, text: str) -> Optional[str]:
+        dishes = self._find_dishes(self._filler.sub(' ', text))
+        if not dishes:
+            return None
+        lines = [
+            f"{dish['name_vn']} có giá {dish['price']:,}đ/phần." if dish.get('available', True)
+            else f"{dish['name_vn']} có giá {dish['price']:,}đ/phần (hiện đang tạm hết)."
+            for dish in dishes
+        ]
+        if self.restaurant.get('pricing_note'):
+            lines.append(f"({self.restaurant['pricing_note']})")
+        return "\n".join(lines)
+
+    def _find_dishes(self, dish_text: str) -> List[Dict]:
+        """
+        Món khớp nhất kèm các biến thể cùng tên (vd. vịt quay nửa con / nguyên con).
+        Nhiều món khác nhau điểm gần bằng nhau ('gà' -> Gà Cung Bảo, Gỏi gà, Gà hấp muối) -> []
+        """
+        dish_text = ' '.join(dish_text.split())
+        if not dish_text:
+            return []
+        candidates = self.menu.find_dish_candidates(dish_text)
+        if not candidates or candidates[0][1] < Config.DISH_MATCH_THRESHOLD:
+            return []
+        top = candidates[0][1]
+        close = [dish for dish, score in candidates if score >= top - self.AMBIGUITY_MARGIN]
+        if len({re.sub(r'\s*\(.*?\)', '', dish['name_vn']).strip().lower() for dish in close}) > 1:
+            return []
+        return close
+
+    def _answer_hours(self, text: str) -> Optional[str]:
+        hours = self.restaurant.get('business_hours', {}).get('display')
+        if not hours:
+            return None
+        return f"Nhà hàng {self.restaurant.get('name', '')} mở cửa từ {hours}."
+
+    def _answer_location(self, text: str) -> Optional[str]:
+        address = self.restaurant.get('contact', {}).get('address')
+        if not address:
+            return None
+        return f"Nhà hàng {self.restaurant.get('name', '')} ở địa chỉ: {address}."
+
+    def _answer_contact(self, text: str) -> Optional[str]:
+        contact = self.restaurant.get('contact', {})
+        if not contact.get('phone'):
+            return None
+        answer = f"Quý khách có thể liên hệ nhà hàng qua số điện thoại {contact['phone']}"
+        if contact.get('email'):
+            answer += f", email {contact['email']}"
+        if contact.get('zalo'):
+            answer += f" hoặc {contact['zalo']}"
+        return answer + "."
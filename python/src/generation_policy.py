@@ -0,0 +1,99 @@
+import math
+import re
+import threading
+from collections import Counter, defaultdict, deque
+from config import Config
+
+class GenerationPolicy:
+    """
+    Tham số generate theo loại câu trả lời (planner / chitchat / reader / recommend):
+    - Ngân sách max_new_tokens tối đa cho từng loại (Config.GENERATION_BUDGETS)
+    - Chuỗi dừng: prompt kết thúc bằng 'Khách hàng: ... Trả lời:' nên model hay lặp lại 'Khách hàng:'
+    - Cap thích ứng: p95 độ dài thực tế gần đây x HEADROOM (không vượt ngân sách)
+    - Câu trả lời chạm cap -> cắt về cuối câu hoàn chỉnh gần nhất
+    - Thống kê token lãng phí (sinh ra nhưng bị cắt bỏ), ước lượng theo tỉ lệ ký tự bị cắt
+    """
+    STOP_STRINGS = {
+        "planner": ["\n"],
+        "chitchat": ["Khách hàng:", "\n\n"],
+        "reader": ["Khách hàng:", "Câu hỏi:"],
+        "recommend": ["Khách hàng:", "Câu hỏi:"],
+    }
+    # Số mẫu gần nhất dùng để tính cap, số mẫu tối thiểu trước khi bắt đầu hạ cap
+    WINDOW = 500
+    MIN_SAMPLES = 20
+    HEADROOM = 1.25
+    MIN_CAP = 16
+    _SENTENCE_END = re.compile(r'[.!?…](?=\s|$)|\n')
+
+    def __init__(self, budgets=None, adaptive=None):
+        self.budgets = dict(Config.GENERATION_BUDGETS if budgets is None else budgets)
+        self.adaptive = Config.ADAPTIVE_GENERATION_CAP if adaptive is None else adaptive
+        self._lengths = defaultdict(lambda: deque(maxlen=self.WINDOW))  # {kind: deque[số token cần]}
+        self._lock = threading.Lock()
+        self.stats = defaultdict(Counter)  # {kind: Counter(calls, new_tokens, wasted_tokens, truncated)}
+
+    def max_new_tokens(self, kind):
+        budget = self.budgets[kind]
+        if not self.adaptive:
+            return budget
+        with self._lock:
+            lengths = sorted(self._lengths[kind])
+        if len(lengths) < self.MIN_SAMPLES:
+            return budget
+        p95 = lengths[int(round(0.95 * (len(lengths) - 1)))]
+        return max(self.MIN_CAP, min(budget, math.ceil(p95 * self.HEADROOM)))
+
+    def params(self, *kinds):
+        """Tham số cho llm.generate / generate_batch (nhiều loại trong 1 batch -> lấy cap lớn nhất)"""
+        stop = []
+        for kind in kinds:
+            stop.extend(s for s in self.STOP_STRINGS.get(kind, ()) if s not in stop)
+        return {'max_new_tokens': max(self.max_new_tokens(kind) for kind in kinds), 'stop': stop}
+
+    @classmethod
+    def trim_to_sentence(cls, text):
+        """Bỏ phần câu dở dang ở cuối (giữ nguyên nếu không có câu hoàn chỉnh nào)"""
+        ends = [m.end() for m in cls._SENTENCE_END.finditer(text)]
+        return text[:ends[-1]].rstrip() if ends else text
+
+    def finish(self, kind, text, stats, trim=True):
+        """
+        Hậu xử lý câu trả lời theo thống kê của LLMWrapper (new_tokens, hit_cap, raw_chars, stop_chars)
+        và ghi nhận độ dài cho cap thích ứng. trim=False: không cắt về cuối câu (stream đã gửi hết)
+        """
+        new_tokens = stats.get('new_tokens', 0)
+        hit_cap = stats.get('hit_cap', False)
+        removed = stats.get('stop_chars', 0)
+        raw_chars = stats.get('raw_chars') or len(text)
+
+        if hit_cap and trim:
+            trimmed = self.trim_to_sentence(text)
+            removed += len(text) - len(trimmed)
+            text = trimmed
+        wasted = min(new_tokens, round(new_tokens * removed / raw_chars)) if raw_chars else 0
+
+        with self._lock:
+            # Chạm cap: độ dài cần thật sự >= cap -> ghi nhận cả cap để p95 tăng lại khi bị cắt nhiều
+            self._lengths[kind].append(new_tokens if hit_cap else new_tokens - wasted)
+            counter = self.stats[kind]
+            counter['calls'] += 1
+            counter['new_tokens'] += new_tokens
+            counter['wasted_tokens'] += wasted
+            counter['truncated'] += int(hit_cap)
+        return text
+
+    def summary(self):
+        with self._lock:
+            stats = {kind: Counter(counter) for kind, counter in self.stats.items()}
+        if not stats:
+            return "[Generation] Chưa có dữ liệu."
+        lines = [f"[Generation] {'kind':<10} {'calls':>6} {'avg tok':>8} {'cap':>9} {'truncated':>10} {'wasted':>8}"]
+        for kind, s in sorted(stats.items()):
+            calls = s['calls']
+            lines.append(
+                f"[Generation] {kind:<10} {calls:>6} {s['new_tokens'] / calls:>8.1f} "
+                f"{self.max_new_tokens(kind):>4}/{self.budgets[kind]:<4} {s['truncated'] / calls:>10.1%} "
+                f"{s['wasted_tokens'] / s['new_tokens'] if s['new_tokens'] else 0:>8.1%}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,290 @@
+import math
+import re
+from collections import Counter, defaultdict
+from qdrant_client.models import FieldCondition, Filter, MatchAny, MatchValue, Range, ScoredPoint, SearchRequest
+from dish_index import fold_accents
+from config import Config
+
+# Từ khóa loại món (đã bỏ dấu) -> giá trị payload "category"
+CATEGORY_ALIASES = {
+    "khai vi": "Khai vị", "appetizer": "Khai vị",
+    "diem tam": "Điểm tâm", "dimsum": "Điểm tâm", "dim sum": "Điểm tâm",
+    "thuc uong": "Thức uống", "do uong": "Thức uống", "nuoc uong": "Thức uống", "beverage": "Thức uống",
+}
+# Giá trị payload "dietary" được coi là món chay
+VEGETARIAN_DIETARY = ["vegetarian", "vegan"]
+
+_UNIT = r'\s*(k|nghin|ngan|tr|trieu|d|dong|vnd)?\b'
+_PRICE_RANGE = re.compile(r'\btu\s*(\d+)' + _UNIT + r'\s*(?:den|toi)\s*(\d+)' + _UNIT)
+_PRICE_MAX = re.compile(r'\b(?:duoi|nho hon|it hon|re hon|khong qua|toi da)\s*(\d+)' + _UNIT)
+_PRICE_MIN = re.compile(r'\b(?:tren|lon hon|dat hon|toi thieu)\s*(\d+)' + _UNIT)
+_NOT_SPICY = re.compile(r'\b(?:không|khong|ko|chẳng|đừng)\s+(?:ăn\s+)?cay\b')
+_SPICY = re.compile(r'\bcay\b')
+_VEGETARIAN = re.compile(r'\b(?:chay|vegetarian|vegan)\b')
+
+def _price(number, unit):
+    """'100' + 'k' -> 100000; không có đơn vị và số nhỏ thì hiểu là nghìn đồng"""
+    value = int(number)
+    if unit in ('tr', 'trieu'):
+        return value * 1_000_000
+    if unit in ('k', 'nghin', 'ngan') or (not unit and value < 1000):
+        return value * 1000
+    return value
+
+def parse_filters(query):
+    """
+    Trích điều kiện lọc từ câu hỏi:
+    {'min_price', 'max_price', 'category', 'vegetarian': True, 'spicy': True/False}
+    ('dưới 100k', 'từ 100k đến 200k', 'món khai vị', 'món chay', 'không cay'...)
+    """
+    lower = query.lower()
+    # '100.000đ' -> '100000đ' trước khi bỏ dấu câu
+    folded = fold_accents(re.sub(r'(\d)[.,](?=\d{3}(?!\d))', r'\1', lower))
+    filters = {}
+
+    match = _PRICE_RANGE.search(folded)
+    if match:
+        low, high = _price(match.group(1), match.group(2) or match.group(4)), _price(match.group(3), match.group(4))
+        filters['min_price'], filters['max_price'] = min(low, high), max(low, high)
+    else:
+        match = _PRICE_MAX.search(folded)
+        if match:
+            filters['max_price'] = _price(match.group(1), match.group(2))
+        match = _PRICE_MIN.search(folded)
+        if match:
+            filters['min_price'] = _price(match.group(1), match.group(2))
+
+    padded = f" {folded} "
+    for alias, category in CATEGORY_ALIASES.items():
+        if f" {alias} " in padded:
+            filters['category'] = category
+            break
+
+    # Chay / cay so khớp trên chữ có dấu ('chạy', 'cây' không tính)
+    if _VEGETARIAN.search(lower):
+        filters['vegetarian'] = True
+    if _NOT_SPICY.search(lower):
+        filters['spicy'] = False
+    elif _SPICY.search(lower):
+        filters['spicy'] = True
+    return filters
+
+def to_qdrant_filter(filters):
+    """Điều kiện lọc -> Qdrant Filter (chỉ áp dụng cho document món ăn), None nếu không có điều kiện"""
+    if not filters:
+        return None
+    must = [FieldCondition(key="source", match=MatchValue(value="menu"))]
+    if 'min_price' in filters or 'max_price' in filters:
+        must.append(FieldCondition(key="price", range=Range(gte=filters.get('min_price'), lte=filters.get('max_price'))))
+    if 'category' in filters:
+        must.append(FieldCondition(key="category", match=MatchValue(value=filters['category'])))
+    if filters.get('vegetarian'):
+        must.append(FieldCondition(key="dietary", match=MatchAny(any=VEGETARIAN_DIETARY)))
+    if 'spicy' in filters:
+        spicy_range = Range(gte=1) if filters['spicy'] else Range(lte=0)
+        must.append(FieldCondition(key="spicy_level", range=spicy_range))
+    return Filter(must=must)
+
+def matches(payload, filters):
+    """Kiểm tra payload theo điều kiện lọc (giống to_qdrant_filter, dùng cho phía BM25)"""
+    if not filters:
+        return True
+    if payload.get('source') != "menu":
+        return False
+    price = payload.get('price')
+    if 'min_price' in filters and (price is None or price < filters['min_price']):
+        return False
+    if 'max_price' in filters and (price is None or price > filters['max_price']):
+        return False
+    if 'category' in filters and payload.get('category') != filters['category']:
+        return False
+    if filters.get('vegetarian') and not set(payload.get('dietary') or ()) & set(VEGETARIAN_DIETARY):
+        return False
+    if 'spicy' in filters and ((payload.get('spicy_level') or 0) >= 1) != filters['spicy']:
+        return False
+    return True
+
+def tokenize(text):
+    return fold_accents(text).split()
+
+class BM25Index:
+    """BM25 trên văn bản đã bỏ dấu (inverted index term -> [(doc, tf)])"""
+    def __init__(self, docs, k1=1.2, b=0.75):
+        """docs: [(doc_id, text)]"""
+        self.k1 = k1
+        self.b = b
+        self.ids = []
+        self._postings = defaultdict(list)
+        lengths = []
+        for doc_id, text in docs:
+            index = len(self.ids)
+            self.ids.append(doc_id)
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                self._postings[term].append((index, tf))
+        avg = sum(lengths) / len(lengths) if lengths else 0.0
+        self._norm = [k1 * (1 - b + b * length / avg) if avg else k1 for length in lengths]
+        n = len(self.ids)
+        self._idf = {term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for term, p in self._postings.items()}
+
+    def search(self, query, limit, allowed=None):
+        """[(doc_id, score)] giảm dần; allowed(doc_id) -> bool để lọc"""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for index, tf in self._postings[term]:
+                scores[index] += idf * tf * (self.k1 + 1) / (tf + self._norm[index])
+        ranked = sorted(scores.items(), key=lambda kv: -kv[1])
+        results = []
+        for index, score in ranked:
+            doc_id = self.ids[index]
+            if allowed is None or allowed(doc_id):
+                results.append((doc_id, score))
+                if len(results) == limit:
+                    break
+        return results
+
+class RetrievalIndex:
+    """
+    Dữ liệu truy xuất của 1 phiên bản menu: tên collection Qdrant + payload, tên món và BM25 dựng từ collection đó.
+    Không sửa sau khi dựng - menu thay đổi thì ingest vào collection mới và dựng index mới (MenuWatcher)
+    """
+    def __init__(self, collection_name, payloads=None):
+        self.collection_name = collection_name
+        self.payloads = payloads or {}  # {point_id: payload}
+        # Tên món bỏ phần trong ngoặc: 'Vịt quay Bắc Kinh (Nửa con)' -> 'vit quay bac kinh'
+        self.names = {pid: fold_accents(re.sub(r'\(.*?\)', ' ', p['name']))
+                      for pid, p in self.payloads.items() if p.get('name')}
+        self.bm25 = BM25Index([(pid, p.get('text', '')) for pid, p in self.payloads.items()])
+
+    @classmethod
+    def load(cls, client, collection_name):
+        """Đọc toàn bộ document của collection (alias cũng được) và dựng BM25"""
+        payloads = {}
+        if client.collection_exists(collection_name=collection_name):
+            offset = None
+            while True:
+                points, offset = client.scroll(
+                    collection_name=collection_name,
+                    limit=256,
+                    offset=offset,
+                    with_payload=True,
+                    with_vectors=False
+                )
+                for point in points:
+                    payloads[str(point.id)] = point.payload or {}
+                if offset is None:
+                    break
+        return cls(collection_name, payloads)
+
+class HybridRetriever:
+    """
+    Truy xuất kết hợp cho nhánh SEARCH:
+    - Điều kiện lọc trích từ câu hỏi (giá, loại món, chay, cay) đẩy xuống Qdrant dạng payload filter
+    - BM25 (bỏ dấu) trên text của các document + vector search, gộp thứ hạng bằng Reciprocal Rank Fusion
+    - Document món ăn có tên xuất hiện nguyên văn trong câu hỏi được xếp lên đầu
+    - Lọc không còn kết quả -> tìm lại không lọc
+    - Câu hỏi nhắc tới 1 món cụ thể ('Bò tay cầm có cay không?') thì không lọc: 'cay', 'chay'... là
+      thuộc tính đang hỏi về món đó, lọc theo sẽ loại mất chính món được hỏi
+    Collection + BM25 lấy từ RetrievalIndex: index=None -> dựng 1 lần từ Config.COLLECTION_NAME,
+    gọi refresh() sau khi ingest thay đổi dữ liệu.
+    """
+    def __init__(self, client, mode=None, candidates=None, rrf_k=None, use_filters=None, catalog=None, index=None):
+        """
+        catalog: hàm trả về MenuCatalog đang dùng (nhận ra món được nhắc tới); None = luôn lọc
+        index: hàm trả về RetrievalIndex đang dùng (menu thay nóng); None = index tĩnh
+        """
+        self.client = client
+        self.catalog = catalog
+        self.mode = Config.RETRIEVAL_MODE if mode is None else mode
+        self.candidates = Config.HYBRID_CANDIDATES if candidates is None else candidates
+        self.rrf_k = Config.RRF_K if rrf_k is None else rrf_k
+        self.use_filters = Config.RETRIEVAL_FILTERS if use_filters is None else use_filters
+        self._index = index
+        self._static = None
+        if index is None:
+            self.refresh()
+
+    @property
+    def index(self):
+        return self._index() if self._index is not None else self._static
+
+    def refresh(self):
+        """Đọc lại toàn bộ document từ Qdrant và dựng lại BM25 (index tĩnh)"""
+        self._static = RetrievalIndex.load(self.client, Config.COLLECTION_NAME)
+
+    def filters_for(self, query):
+        """Điều kiện lọc cho câu hỏi mở ('món chay dưới 100k'); câu hỏi về 1 món cụ thể -> không lọc"""
+        if not self.use_filters:
+            return {}
+        filters = parse_filters(query)
+        if filters and self.catalog is not None and self.catalog().mentioned_dishes(query):
+            return {}
+        return filters
+
+    def search(self, query, query_vector, top_k=3):
+        return self.search_batch([query], [query_vector], top_k)[0]
+
+    def search_batch(self, queries, vectors, top_k=3):
+        """1 request search_batch Qdrant cho cả batch (kèm filter từng câu); trả về [hits]"""
+        # Cả batch dùng 1 index: collection Qdrant và BM25 cùng 1 phiên bản dữ liệu
+        index = self.index
+        filters = [self.filters_for(q) for q in queries]
+        limit = top_k if self.mode == "dense" else max(top_k, self.candidates)
+        dense = self._dense_batch(index, vectors, filters, limit)
+
+        results, retry = [], []
+        for i, (query, hits) in enumerate(zip(queries, dense)):
+            fused = self._fuse(index, query, filters[i], hits, top_k)
+            if not fused and filters[i]:
+                retry.append(i)
+            results.append(fused)
+
+        # Lọc quá chặt (vd. 'món chay dưới 10k') -> tìm lại không lọc
+        if retry:
+            dense = self._dense_batch(index, [vectors[i] for i in retry], [{}] * len(retry), limit)
+            for i, hits in zip(retry, dense):
+                results[i] = self._fuse(index, queries[i], {}, hits, top_k)
+        return results
+
+    def _dense_batch(self, index, vectors, filters, limit):
+        return self.client.search_batch(
+            collection_name=index.collection_name,
+            requests=[
+                SearchRequest(vector=list(map(float, v)), filter=to_qdrant_filter(f), limit=limit, with_payload=True)
+                for v, f in zip(vectors, filters)
+            ]
+        )
+
+    def _fuse(self, index, query, filters, dense_hits, top_k):
+        if self.mode == "dense":
+            return dense_hits[:top_k]
+
+        payloads, names = index.payloads, index.names
+        allowed = (lambda pid: matches(payloads[pid], filters)) if filters else None
+        lexical = index.bm25.search(query, self.candidates, allowed)
+
+        scores = defaultdict(float)
+        for rank, hit in enumerate(dense_hits):
+            scores[str(hit.id)] += 1.0 / (self.rrf_k + rank + 1)
+        for rank, (pid, _) in enumerate(lexical):
+            scores[pid] += 1.0 / (self.rrf_k + rank + 1)
+
+        # Tên món xuất hiện nguyên văn trong câu hỏi -> ưu tiên (tên dài hơn trước)
+        padded = f" {fold_accents(query)} "
+        exact = {pid: len(names[pid]) for pid in scores if pid in names and f" {names[pid]} " in padded}
+
+        ranked = sorted(scores, key=lambda pid: (-exact.get(pid, 0), -scores[pid]))[:top_k]
+        dense_by_id = {str(hit.id): hit for hit in dense_hits}
+        hits = []
+        for pid in ranked:
+            hit = dense_by_id.get(pid)
+            payload = hit.payload if hit is not None else payloads.get(pid)
+            if payload is None:  # document mới chưa có trong snapshot BM25
+                continue
+            hits.append(ScoredPoint(id=pid, version=hit.version if hit is not None else 0,
+                                    score=scores[pid], payload=payload))
+        return hits
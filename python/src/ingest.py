@@ -1,14 +1,64 @@
+import hashlib
 import json
 import os
-from sentence_transformers import SentenceTransformer
-from qdrant_client.models import PointStruct, VectorParams, Distance
+import uuid
+from qdrant_client import QdrantClient
+from qdrant_client.models import (
+    PointStruct, VectorParams, Distance, PointIdsList, PayloadSchemaType,
+    CreateAlias, CreateAliasOperation, DeleteAlias, DeleteAliasOperation
+)
+from model_registry import ModelRegistry
+from embedding_artifact import EmbeddingArtifact
 from config import Config
 
+# Các trường payload dùng để lọc khi truy xuất (HybridRetriever) -> tạo payload index
+PAYLOAD_INDEXES = {
+    "source": PayloadSchemaType.KEYWORD,
+    "category": PayloadSchemaType.KEYWORD,
+    "dietary": PayloadSchemaType.KEYWORD,
+    "price": PayloadSchemaType.INTEGER,
+    "spicy_level": PayloadSchemaType.INTEGER,
+}
+
+def create_qdrant_client():
+    """Tạo Qdrant client: in-memory nếu QDRANT_PATH = ':memory:', ngược lại lưu xuống đĩa"""
+    if Config.QDRANT_PATH == ":memory:":
+        return QdrantClient(location=":memory:")
+    os.makedirs(Config.QDRANT_PATH, exist_ok=True)
+    return QdrantClient(path=Config.QDRANT_PATH)
+
+def resolve_collection(client, name=None):
+    """Collection thật mà alias `name` (mặc định Config.COLLECTION_NAME) trỏ tới; không phải alias -> name"""
+    name = name or Config.COLLECTION_NAME
+    for alias in client.get_aliases().aliases:
+        if alias.alias_name == name:
+            return alias.collection_name
+    return name
+
 class DataIngestor:
     def __init__(self, qdrant_client):
         self.client = qdrant_client
-        self.encoder = SentenceTransformer(Config.EMBEDDING_MODEL)
-        print("✅ Model đã sẵn sàng!\n")
+        self._change_listeners = []
+
+    def on_change(self, callback):
+        """Đăng ký callback(stats) được gọi khi ingest thêm/sửa/xóa document"""
+        self._change_listeners.append(callback)
+
+    @property
+    def encoder(self):
+        # Chỉ load encoder khi thực sự cần embed (không có thay đổi thì không cần load)
+        return ModelRegistry.get_encoder()
+
+    @staticmethod
+    def content_hash(doc):
+        """Hash nội dung document (kèm tên model embedding để đổi model thì embed lại)"""
+        raw = json.dumps(doc, ensure_ascii=False, sort_keys=True) + Config.EMBEDDING_MODEL
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def point_id(doc):
+        """ID cố định cho mỗi document (Qdrant chỉ nhận int/UUID)"""
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"hoa_vien/{doc['id']}"))
     
     def load_menu(self, path):
         """Load dữ liệu info và menu món ăn của nhà hàng"""
@@ -27,12 +77,23 @@ class DataIngestor:
                 f"SĐT: {info['contact']['phone']}. "
                 f"Mô tả: {info['description']}."
             )
-            docs.append({"text": info_text, "source": "info", "id": "rest_info"})
+            # Các trường riêng để ContextBuilder chỉ lấy phần liên quan tới câu hỏi
+            docs.append({
+                "text": info_text, "source": "info", "id": "rest_info",
+                "name": info['name'],
+                "address": info['contact']['address'],
+                "hours": info['business_hours']['display'],
+                "phone": info['contact']['phone'],
+                "description": info['description']
+            })
             
             # 2. Xử lý Menu (Quan trọng: Ghép description và tags vào text)
             for category in data['menu']['categories']:
                 cat_name = category['name_vn']
                 for item in category['items']:
+                    # Món tạm hết không đưa vào Vector DB (không gợi ý cho khách)
+                    if not item.get('available', True):
+                        continue
                     # Lấy danh sách tags và dietary
                     tags = ", ".join(item.get('tags', []))
                     dietary = ", ".join(item.get('dietary', []))
@@ -53,16 +114,23 @@ class DataIngestor:
                         "text": content,
                         "source": "menu",
                         "id": item['id'],
+                        "name": item['name_vn'],
+                        "name_en": item['name_en'],
                         "price": item['price'],
                         "category": cat_name,
-                        "tags": item.get('tags', [])
+                        "tags": item.get('tags', []),
+                        "dietary": item.get('dietary', []),
+                        "spicy_level": item.get('spicy_level', 0),
+                        "description": item.get('description', ''),
+                        "preparation_time": item.get('preparation_time', 0)
                     }
                     docs.append(metadata)
 
             # 3. Xử lý FAQ (Common Questions)
             for idx, qa in enumerate(data.get('common_questions', [])):
                 qa_text = f"Hỏi: {qa['question']} - Trả lời: {qa['answer']}"
-                docs.append({"text": qa_text, "source": "faq", "id": f"faq_{idx}"})
+                docs.append({"text": qa_text, "source": "faq", "id": f"faq_{idx}",
+                             "question": qa['question'], "answer": qa['answer']})
                 
             return docs
 
@@ -70,38 +138,242 @@ class DataIngestor:
             print("Error: Menu file not found.")
             return []
 
-    def ingest(self):
-        """Nạp dữ liệu vào Vector DB"""
+    def _points(self, collection_name, with_vectors=False):
+        """Duyệt toàn bộ điểm của collection (payload chỉ gồm content_hash)"""
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=collection_name,
+                limit=256,
+                offset=offset,
+                with_payload=["content_hash"],
+                with_vectors=with_vectors
+            )
+            yield from points
+            if offset is None:
+                return
+
+    def _existing_hashes(self, collection_name):
+        """Đọc {point_id: content_hash} của các điểm đang có trong collection"""
+        return {str(point.id): (point.payload or {}).get("content_hash") for point in self._points(collection_name)}
+
+    def _create_collection(self, collection_name, dim):
+        """Tạo collection kèm payload index cho các trường lọc"""
+        self.client.create_collection(
+            collection_name=collection_name,
+            vectors_config=VectorParams(size=dim, distance=Distance.COSINE),
+        )
+        # Qdrant local (path / :memory:) không hỗ trợ payload index, chỉ tạo khi dùng Qdrant server
+        options = getattr(self.client, "init_options", {})
+        if options.get("path") or options.get("location") == ":memory:":
+            return
+        for field, schema in PAYLOAD_INDEXES.items():
+            self.client.create_payload_index(
+                collection_name=collection_name, field_name=field, field_schema=schema
+            )
+
+    def _ensure_collection(self, collection_name, dim):
+        """
+        Tạo collection nếu chưa có, tạo lại nếu kích thước vector không khớp.
+        Return True nếu collection cũ bị xóa (cần embed lại toàn bộ).
+        """
+        recreated = False
+        if self.client.collection_exists(collection_name=collection_name):
+            info = self.client.get_collection(collection_name=collection_name)
+            if info.config.params.vectors.size == dim:
+                return False
+            print(f"Kích thước vector thay đổi ({info.config.params.vectors.size} -> {dim}), tạo lại collection.")
+            self.client.delete_collection(collection_name=collection_name)
+            recreated = True
+        self._create_collection(collection_name, dim)
+        return recreated
+
+    def publish(self, collection_name):
+        """
+        Trỏ alias Config.COLLECTION_NAME tới collection_name (lần khởi động sau ingest tiếp từ collection này).
+        Config.COLLECTION_NAME đang là collection thật (dữ liệu cũ, chưa xóa) -> chưa đặt được, return False
+        """
+        alias = Config.COLLECTION_NAME
+        current = resolve_collection(self.client, alias)
+        if current == collection_name:
+            return True
+        if current == alias and self.client.collection_exists(collection_name=alias):
+            return False
+        operations = [CreateAliasOperation(create_alias=CreateAlias(collection_name=collection_name, alias_name=alias))]
+        if current != alias:
+            operations.insert(0, DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=alias)))
+        self.client.update_collection_aliases(change_aliases_operations=operations)
+        return True
+
+    def drop(self, collection_name):
+        """Xóa collection của phiên bản menu cũ"""
+        print(f"--- Xóa collection cũ {collection_name} ---")
+        return self.client.delete_collection(collection_name=collection_name)
+
+    def _drop_stale(self, keep):
+        """Xóa collection phiên bản còn sót lại (process dừng giữa lúc thay menu)"""
+        prefix = f"{Config.COLLECTION_NAME}_v"
+        for collection in self.client.get_collections().collections:
+            if collection.name.startswith(prefix) and collection.name != keep:
+                print(f"Xóa collection cũ {collection.name}.")
+                self.client.delete_collection(collection_name=collection.name)
+
+    def _load_artifact(self):
+        if not Config.EMBEDDINGS_DIR:
+            return None
+        artifact = EmbeddingArtifact.load(Config.EMBEDDINGS_DIR)
+        # Encoder đã được load (vd. model khác cùng tên) mà số chiều không khớp -> không dùng artifact
+        if artifact is not None and ModelRegistry.is_loaded("encoder") and \
+                self.encoder.get_sentence_embedding_dimension() != artifact.dim:
+            print("Embedding artifact: số chiều không khớp encoder, bỏ qua.")
+            return None
+        return artifact
+
+    def _embed(self, changed):
+        """
+        Vector cho các document [(point_id, content_hash, doc)]:
+        lấy từ embedding artifact theo content_hash, chỉ chạy encoder cho các document còn thiếu
+        """
+        embeddings = [None] * len(changed)
+        artifact = self._load_artifact()
+        if artifact is not None:
+            for i, (_, doc_hash, _) in enumerate(changed):
+                embeddings[i] = artifact.vector(doc_hash)
+
+        missing = [i for i, vector in enumerate(embeddings) if vector is None]
+        if missing:
+            encoded = self.encoder.encode([changed[i][2]['text'] for i in missing])
+            for i, vector in zip(missing, encoded):
+                embeddings[i] = vector
+        if artifact is not None:
+            print(f"--- Embedding: {len(changed) - len(missing)} từ artifact, {len(missing)} encode lại ---")
+        return embeddings
+
+    def ingest(self, collection_name=None):
+        """
+        Nạp dữ liệu vào Vector DB (incremental, sửa trực tiếp collection - dùng lúc khởi động):
+        chỉ embed document mới/đổi nội dung, xóa document không còn trong menu.
+        Mặc định ghi vào collection mà alias Config.COLLECTION_NAME đang trỏ tới
+        """
         print("--- Bắt đầu nạp dữ liệu vào Vector DB ---")
         menu_data = self.load_menu(os.path.join(Config.DATA_DIR, "menu_v2.json"))
 
         if not menu_data: 
             print("Không có dữ liệu để nạp.")
-            return
-        
-        # Tạo collection trong Qdrant
-        if self.client.collection_exists(collection_name=Config.COLLECTION_NAME):
-            self.client.delete_collection(collection_name=Config.COLLECTION_NAME)
-            
-        self.client.create_collection(
-            collection_name=Config.COLLECTION_NAME,
-            vectors_config=VectorParams(size=1024, distance=Distance.COSINE),
-        )
-        
-        # Vector hóa và upload
-        points = []
-        embeddings = self.encoder.encode([d['text'] for d in menu_data])
-        # Loop tạo PointStruct (kết hợp ID + Vector + Payload)
-        for i, doc in enumerate(menu_data):
-            points.append(PointStruct(
-                id=i,
-                vector=embeddings[i].tolist(),
-                payload=doc
-            ))
-        
-        # Client.upsert -> Đẩy lên Qdrant
-        self.client.upsert(
-            collection_name=Config.COLLECTION_NAME,
-            points=points
-        )
-        print(f"--- Đã nạp {len(points)} documents vào Qdrant ---")
\ No newline at end of file
+            return {}
+
+        collection_name = collection_name or resolve_collection(self.client)
+        self._drop_stale(collection_name)
+
+        # So sánh content hash với dữ liệu đã lưu trong Qdrant
+        existing = {}
+        if self.client.collection_exists(collection_name=collection_name):
+            existing = self._existing_hashes(collection_name)
+
+        changed = []
+        current_ids = set()
+        for doc in menu_data:
+            pid = self.point_id(doc)
+            current_ids.add(pid)
+            doc_hash = self.content_hash(doc)
+            if existing.get(pid) != doc_hash:
+                changed.append((pid, doc_hash, doc))
+        removed = [pid for pid in existing if pid not in current_ids]
+
+        stats = {
+            "added": sum(1 for pid, _, _ in changed if pid not in existing),
+            "updated": sum(1 for pid, _, _ in changed if pid in existing),
+            "deleted": len(removed),
+            "unchanged": len(menu_data) - len(changed),
+        }
+
+        if changed:
+            # Vector hóa chỉ những document thay đổi (lấy từ artifact dựng sẵn nếu có)
+            embeddings = self._embed(changed)
+            if self._ensure_collection(collection_name, len(embeddings[0])) and stats["unchanged"]:
+                # Collection vừa bị tạo lại -> các document "giữ nguyên" cũng mất, nạp lại toàn bộ
+                return self.ingest(collection_name)
+
+            # Loop tạo PointStruct (kết hợp ID + Vector + Payload)
+            points = [
+                PointStruct(id=pid, vector=embeddings[i].tolist(), payload={**doc, "content_hash": doc_hash})
+                for i, (pid, doc_hash, doc) in enumerate(changed)
+            ]
+            # Client.upsert -> Đẩy lên Qdrant
+            self.client.upsert(
+                collection_name=collection_name,
+                points=points
+            )
+
+        if removed:
+            self.client.delete(
+                collection_name=collection_name,
+                points_selector=PointIdsList(points=removed)
+            )
+        self.publish(collection_name)
+
+        print(f"--- Qdrant: {stats['added']} thêm mới, {stats['updated']} cập nhật, "
+              f"{stats['deleted']} xóa, {stats['unchanged']} giữ nguyên ---")
+
+        if changed or removed:
+            for callback in self._change_listeners:
+                callback(stats)
+        return stats
+
+    def build(self, collection_name, base=None):
+        """
+        Nạp dữ liệu menu vào collection mới `collection_name` (thay nóng menu - MenuWatcher):
+        document không đổi so với collection `base` dùng lại vector cũ, chỉ embed document mới/đổi nội dung.
+        Collection `base` (đang phục vụ truy xuất) không bị sửa; lỗi giữa chừng -> xóa collection mới rồi raise
+        """
+        print(f"--- Nạp dữ liệu vào collection mới {collection_name} ---")
+        menu_data = self.load_menu(os.path.join(Config.DATA_DIR, "menu_v2.json"))
+        if not menu_data:
+            raise ValueError("không có dữ liệu để nạp")
+
+        previous = {}
+        if base and self.client.collection_exists(collection_name=base):
+            previous = {str(point.id): point for point in self._points(base, with_vectors=True)}
+
+        points, changed = [], []
+        current_ids = set()
+        for doc in menu_data:
+            pid = self.point_id(doc)
+            current_ids.add(pid)
+            doc_hash = self.content_hash(doc)
+            point = previous.get(pid)
+            if point is not None and point.vector is not None and (point.payload or {}).get("content_hash") == doc_hash:
+                points.append(PointStruct(id=pid, vector=point.vector, payload={**doc, "content_hash": doc_hash}))
+            else:
+                changed.append((pid, doc_hash, doc))
+
+        stats = {
+            "added": sum(1 for pid, _, _ in changed if pid not in previous),
+            "updated": sum(1 for pid, _, _ in changed if pid in previous),
+            "deleted": sum(1 for pid in previous if pid not in current_ids),
+            "unchanged": len(points),
+        }
+
+        if changed:
+            embeddings = self._embed(changed)
+            points.extend(
+                PointStruct(id=pid, vector=embeddings[i].tolist(), payload={**doc, "content_hash": doc_hash})
+                for i, (pid, doc_hash, doc) in enumerate(changed)
+            )
+
+        if self.client.collection_exists(collection_name=collection_name):
+            self.client.delete_collection(collection_name=collection_name)
+        try:
+            self._create_collection(collection_name, len(points[0].vector))
+            self.client.upsert(collection_name=collection_name, points=points)
+        except Exception:
+            self.client.delete_collection(collection_name=collection_name)
+            raise
+
+        print(f"--- Qdrant {collection_name}: {stats['added']} thêm mới, {stats['updated']} cập nhật, "
+              f"{stats['deleted']} xóa, {stats['unchanged']} giữ nguyên ---")
+
+        if changed or stats["deleted"]:
+            for callback in self._change_listeners:
+                callback(stats)
+        return stats
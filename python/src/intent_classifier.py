@@ -0,0 +1,179 @@
+import json
+import re
+from collections import Counter
+from typing import Dict, Iterable, Optional, Tuple
+from config import Config
+
+class IntentClassifier:
+    """
+    Bộ phân loại intent dựa trên luật (fast path trước LLM planner):
+    - Từ khóa lấy từ block `chatbot_intents` trong menu_v2.json
+    - Từ điển tên món lấy từ OrderManager.menu_items
+    - Chỉ trả kết quả khi độ tin cậy >= threshold, còn lại để LLM quyết định
+    """
+    # Các intent mà bộ luật được phép kết luận trực tiếp
+    RULE_INTENTS = ("ORDER", "VIEW_ORDER", "CANCEL_ITEM", "CONFIRM_ORDER", "ORDER_HISTORY", "NO_SEARCH")
+
+    HISTORY_KEYWORDS = ['lịch sử', 'đã đặt', 'đã gọi', 'đã order', 'đơn cũ', 'các đơn cũ',
+                        'đơn trước', 'đơn hàng trước', 'trước đây', 'hôm qua', 'tuần trước']
+    CONFIRM_KEYWORDS = ['xác nhận', 'chốt đơn', 'chốt luôn', 'đặt luôn', 'ok đặt hàng',
+                        'xác nhận đặt hàng', 'confirm']
+    VIEW_KEYWORDS = ['xem đơn', 'xem lại đơn', 'xem giỏ', 'giỏ hàng', 'đơn hiện tại',
+                     'đơn hàng của tôi', 'đơn của tôi', 'đơn đang đặt']
+    CANCEL_VERBS = ['hủy', 'huỷ', 'xóa', 'xoá', 'bỏ', 'cancel', 'remove']
+    CANCEL_CONTEXT = ['khỏi đơn', 'ra khỏi', 'bỏ đi', 'không lấy']
+    # Phủ định động từ đặt món ('Không lấy cam ép nữa'): không phải ORDER, nhưng hủy hay chỉ nói
+    # không cần thêm thì để LLM quyết định
+    NEGATION_KEYWORDS = ['không lấy', 'không gọi', 'không đặt', 'không cần', 'không muốn', 'đừng', 'khỏi lấy']
+    # Từ đệm đầu câu ('Bỏ qua, cho tôi xem menu'): không phải động từ hủy món
+    DISCOURSE_MARKERS = re.compile(r'^(?:bỏ qua|thôi bỏ qua)(?:\s+(?:đi|nhé|nha))?\s*[,.!]?\s*')
+    ORDER_VERBS = ['đặt', 'gọi', 'thêm', 'lấy', 'cho tôi', 'cho mình', 'order']
+    CHITCHAT_KEYWORDS = ['cảm ơn', 'cám ơn', 'thank', 'thanks', 'tạm biệt', 'bye', 'khỏe không']
+    # Nhóm từ khóa trong chatbot_intents báo hiệu câu hỏi thông tin (SEARCH)
+    SEARCH_GROUPS = ['menu_inquiry', 'price_inquiry', 'recommendation', 'location', 'hours', 'contact']
+    GENERIC_KEYWORDS = ['gì', 'món nào', 'gợi ý', 'nên ăn', 'ngon', 'cay', 'ngọt', 'chua']
+
+    # Nếu có nhiều luật mạnh (>= STRONG_SCORE) cùng khớp, giảm độ tin cậy theo intent đứng thứ 2
+    STRONG_SCORE = 0.8
+    AMBIGUITY_PENALTY = 0.5
+    # Độ tin cậy tối đa khi câu có phủ định / từ đệm đầu câu (< INTENT_RULE_THRESHOLD -> LLM planner)
+    HEDGED_SCORE = 0.6
+
+    def __init__(self, menu_path: str, menu_items: Dict, threshold: Optional[float] = None):
+        self.threshold = Config.INTENT_RULE_THRESHOLD if threshold is None else threshold
+        intents = self._load_intent_keywords(menu_path)
+
+        self._greeting = self._compile(intents.get('greeting', []) + self.CHITCHAT_KEYWORDS)
+        self._reservation = self._compile(intents.get('reservation', []))
+        self._search = self._compile(
+            kw for group in self.SEARCH_GROUPS for kw in intents.get(group, [])
+            # 'order' nằm trong menu_inquiry nhưng là động từ đặt món
+            if kw not in self.ORDER_VERBS
+        )
+        self._order_verbs = self._compile(self.ORDER_VERBS + intents.get('order', []))
+        self._history = self._compile(self.HISTORY_KEYWORDS)
+        self._confirm = self._compile(self.CONFIRM_KEYWORDS)
+        self._view = self._compile(self.VIEW_KEYWORDS)
+        self._cancel_verbs = self._compile(self.CANCEL_VERBS)
+        self._cancel_context = self._compile(self.CANCEL_CONTEXT)
+        self._negation = self._compile(self.NEGATION_KEYWORDS)
+        self._generic = self._compile(self.GENERIC_KEYWORDS)
+        self._dishes = self._compile(self._dish_lexicon(menu_items))
+
+        # Bộ đếm số lần mỗi nhánh (rule / llm) quyết định intent
+        self.stats = {"rule": Counter(), "llm": Counter()}
+
+    def _load_intent_keywords(self, path):
+        """Đọc block chatbot_intents từ file menu"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return {k: [w.lower() for w in v] for k, v in data.get('chatbot_intents', {}).items()}
+        except FileNotFoundError as e:
+            print(f"Error loading chatbot intents: {e}")
+            return {}
+
+    def _dish_lexicon(self, menu_items):
+        """Tên món (VN/EN) + biến thể bỏ phần trong ngoặc, vd: 'vịt quay bắc kinh (nửa con)'"""
+        names = set()
+        for key in menu_items:
+            names.add(key)
+            short = re.sub(r'\s*\(.*?\)\s*', ' ', key).strip()
+            if short:
+                names.add(short)
+        return names
+
+    @staticmethod
+    def _compile(keywords: Iterable[str]):
+        """Gộp danh sách từ khóa thành 1 regex, khớp theo ranh giới từ"""
+        words = sorted({k for k in keywords if k}, key=len, reverse=True)
+        if not words:
+            return None
+        pattern = '|'.join(re.escape(w) for w in words)
+        return re.compile(r'(?<!\w)(?:' + pattern + r')(?!\w)')
+
+    @staticmethod
+    def _has(regex, text):
+        return regex is not None and regex.search(text) is not None
+
+    def classify(self, user_query: str) -> Tuple[Optional[str], float]:
+        """
+        Phân loại bằng luật.
+        Return (intent, confidence); intent = None nếu không luật nào khớp.
+        """
+        text = ' '.join(user_query.lower().split())
+        # 'Bỏ qua, ...' đầu câu là từ đệm: phân loại phần còn lại, không kết luận bằng luật
+        stripped = self.DISCOURSE_MARKERS.sub('', text, count=1)
+        hedged = stripped != text
+        text = stripped
+        has_dish = self._has(self._dishes, text)
+        has_search = self._has(self._search, text)
+        is_question = has_search or '?' in text
+        # Phủ định xét trước ORDER: 'không lấy' chứa động từ đặt món 'lấy'
+        negated = self._has(self._negation, text)
+        hedged = hedged or negated
+
+        scores = {}
+        if self._has(self._history, text):
+            scores['ORDER_HISTORY'] = 0.95
+        if self._has(self._confirm, text):
+            scores['CONFIRM_ORDER'] = 0.95
+        if self._has(self._view, text):
+            scores['VIEW_ORDER'] = 0.9
+        if self._has(self._cancel_verbs, text):
+            # Câu bắt đầu bằng động từ hủy ('Bỏ trà sữa đi') hoặc có tên món / ngữ cảnh 'khỏi đơn'
+            starts_with_cancel = self._cancel_verbs.match(text) is not None
+            if has_dish or starts_with_cancel or self._has(self._cancel_context, text):
+                scores['CANCEL_ITEM'] = 0.95
+            else:
+                scores['CANCEL_ITEM'] = 0.6
+        elif negated and has_dish:
+            scores['CANCEL_ITEM'] = self.HEDGED_SCORE
+        if self._has(self._order_verbs, text) and not self._has(self._reservation, text):
+            if negated:
+                scores['ORDER'] = 0.3
+            elif has_dish and not is_question and not self._has(self._generic, text):
+                scores['ORDER'] = 0.9
+            else:
+                scores['ORDER'] = 0.5
+        if self._has(self._greeting, text) and len(text.split()) <= 6:
+            scores['NO_SEARCH'] = 0.9 if not has_search and not has_dish else 0.5
+
+        if not scores:
+            return None, 0.0
+
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+        intent, confidence = ranked[0]
+        if len(ranked) > 1 and ranked[1][1] >= self.STRONG_SCORE:
+            confidence -= ranked[1][1] * self.AMBIGUITY_PENALTY
+        if hedged:
+            confidence = min(confidence, self.HEDGED_SCORE)
+        return intent, max(confidence, 0.0)
+
+    def predict(self, user_query: str) -> Optional[str]:
+        """Trả intent nếu đủ tin cậy để bỏ qua LLM, ngược lại None"""
+        intent, confidence = self.classify(user_query)
+        if intent in self.RULE_INTENTS and confidence >= self.threshold:
+            return intent
+        return None
+
+    def record(self, path: str, intent: str):
+        """Ghi nhận nhánh đã quyết định intent ('rule' hoặc 'llm')"""
+        self.stats[path][intent] += 1
+
+    @property
+    def llm_calls_avoided(self) -> int:
+        return sum(self.stats["rule"].values())
+
+    def summary(self) -> str:
+        rule_total = sum(self.stats["rule"].values())
+        llm_total = sum(self.stats["llm"].values())
+        total = rule_total + llm_total
+        ratio = rule_total / total * 100 if total else 0.0
+        lines = [f"[Planner] rule: {rule_total}, llm: {llm_total} "
+                 f"({ratio:.1f}% lượt gọi LLM được bỏ qua, threshold={self.threshold})"]
+        for path in ("rule", "llm"):
+            if self.stats[path]:
+                detail = ", ".join(f"{k}={v}" for k, v in sorted(self.stats[path].items()))
+                lines.append(f"  - {path}: {detail}")
+        return "\n".join(lines)
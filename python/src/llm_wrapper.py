@@ -1,43 +1,420 @@
+import copy
+import threading
+import time
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers import AutoTokenizer, DynamicCache, LogitsProcessor, LogitsProcessorList, TextIteratorStreamer
+from model_registry import ModelRegistry
 from config import Config
 
+class PrefillTimer(LogitsProcessor):
+    """Ghi thời điểm có logits của token đầu tiên (kết thúc prefill), không thay đổi scores"""
+    def __init__(self):
+        self.first = None
+
+    def __call__(self, input_ids, scores):
+        if self.first is None:
+            self.first = time.perf_counter()
+        return scores
+
+    def split(self, start, end):
+        """(prefill, decode) tính bằng giây"""
+        if self.first is None:
+            return end - start, 0.0
+        return self.first - start, end - self.first
+
+class ForwardCounter:
+    """Đếm số lần forward của 1 model (forward hook), dùng để tính tỉ lệ chấp nhận token nháp"""
+    def __init__(self, model):
+        self.calls = 0
+        model.register_forward_hook(self._hook)
+
+    def _hook(self, module, inputs, output):
+        self.calls += 1
+
 class LLMWrapper:
+    # Đánh dấu vị trí kết thúc prefix khi áp chat template
+    _PREFIX_MARKER = "<<<PREFIX_END>>>"
+
     def __init__(self):
-        print(f"Loading LLM: {Config.MODEL_ID}...")
-        self.tokenizer = AutoTokenizer.from_pretrained(Config.MODEL_ID)
-        
-        # Tự động chọn thiết bị (GPU nếu có, CPU nếu không)
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        
-        self.model = AutoModelForCausalLM.from_pretrained(
-            Config.MODEL_ID,
-            torch_dtype=torch.float16 if device == "cuda" else torch.float32,
-            device_map="auto" if device == "cuda" else None
-        )
-        if device == "cpu":
-            self.model.to("cpu")
+        # Tokenizer và model lấy từ registry (load 1 lần, có thể đã được preload ở thread nền)
+        self.tokenizer = ModelRegistry.get_tokenizer()
+        self.model = ModelRegistry.get_llm()
+        # Thống kê lần generate gần nhất, tách riêng theo từng thread gọi
+        self._local = threading.local()
+
+        # Speculative decoding: model nháp đề xuất token, model chính kiểm tra (None = generate thường)
+        self.draft = self._load_draft()
+        if self.draft is not None:
+            self._main_counter = ForwardCounter(self.model)
+            self._draft_counter = ForwardCounter(self.draft)
+
+        # Prefix cache: {name: (token ids của prefix, past_key_values đã tính sẵn)}
+        self._prefixes = {}
+        self.prefix_stats = {'hits': 0, 'misses': 0, 'tokens_saved': 0}
+        # Prefix chung cho mọi prompt: system message + đầu lượt user
+        self.register_prefix("system")
             
         print("LLM Loaded successfully.")
 
-    def generate(self, prompt, max_new_tokens=512):
+    def _load_draft(self):
+        """Load model nháp (Config.DRAFT_MODEL_ID), không có / lỗi / khác tokenizer -> None"""
+        try:
+            draft = ModelRegistry.get_draft()
+            if draft is None:
+                return None
+            if AutoTokenizer.from_pretrained(Config.DRAFT_MODEL_ID).get_vocab() != self.tokenizer.get_vocab():
+                print(f"Draft model {Config.DRAFT_MODEL_ID} khác tokenizer với {Config.MODEL_ID}, dùng generate thường.")
+                return None
+        except Exception as e:
+            print(f"Không load được draft model ({e}), dùng generate thường.")
+            return None
+
+        if Config.DRAFT_NUM_TOKENS:
+            draft.generation_config.num_assistant_tokens = Config.DRAFT_NUM_TOKENS
+            draft.generation_config.num_assistant_tokens_schedule = "constant"
+        print(f"Speculative decoding: draft model {Config.DRAFT_MODEL_ID}")
+        return draft
+
+    def _draft_kwargs(self):
+        return {'assistant_model': self.draft} if self.draft is not None else {}
+
+    def _draft_counts(self):
+        if self.draft is None:
+            return None
+        return self._main_counter.calls, self._draft_counter.calls
+
+    def _draft_stats(self, before, new_tokens):
+        """
+        Thống kê speculative decoding: mỗi forward của model chính chấp nhận k token nháp + sinh 1 token
+        -> accepted = new_tokens - số forward model chính; drafted = số forward model nháp
+        """
+        if before is None:
+            return {}
+        steps = self._main_counter.calls - before[0]
+        drafted = self._draft_counter.calls - before[1]
+        accepted = max(new_tokens - steps, 0)
+        return {
+            'draft_tokens': drafted,
+            'accepted_tokens': accepted,
+            'acceptance_rate': accepted / drafted if drafted else 0.0
+        }
+
+    def register_prefix(self, name, prompt_prefix=""):
+        """
+        Tính sẵn KV-cache cho phần đầu cố định của prompt (system message + prompt_prefix).
+        Các lần generate sau có cùng phần đầu chỉ cần prefill phần token còn lại.
+        """
+        if not Config.PREFIX_CACHE:
+            return
+        text = self._chat_text(prompt_prefix + self._PREFIX_MARKER)
+        prefix_text = text[:text.index(self._PREFIX_MARKER)]
+        prefix_ids = self.tokenizer(prefix_text, return_tensors="pt").input_ids.to(self.model.device)
+        # Bỏ token cuối: token này có thể bị tokenizer gộp với phần text phía sau
+        if prefix_ids.shape[1] > 1:
+            prefix_ids = prefix_ids[:, :-1]
+
+        with torch.no_grad():
+            outputs = self.model(input_ids=prefix_ids, past_key_values=DynamicCache(), use_cache=True)
+        self._prefixes[name] = (prefix_ids[0].tolist(), outputs.past_key_values)
+
+    def _match_prefix(self, input_ids):
+        """Tìm prefix dài nhất đã cache khớp với đầu input_ids"""
+        ids = input_ids.tolist()
+        best = None
+        for prefix_ids, cache in self._prefixes.values():
+            if len(prefix_ids) < len(ids) and ids[:len(prefix_ids)] == prefix_ids:
+                if best is None or len(prefix_ids) > len(best[0]):
+                    best = (prefix_ids, cache)
+        return best
+
+    def _prepare_inputs(self, prompt):
+        """
+        Tokenize prompt + gắn KV-cache của prefix (nếu khớp) vào tham số generate.
+        Return (model_inputs, kwargs cho generate, số token đã có trong cache).
+        """
+        text = self._chat_text(prompt)
+        model_inputs = self.tokenizer([text], return_tensors="pt").to(self.model.device)
+        kwargs = dict(model_inputs)
+
+        match = self._match_prefix(model_inputs.input_ids[0])
+        if match is None:
+            self.prefix_stats['misses'] += 1
+            return model_inputs, kwargs, 0
+
+        prefix_ids, cache = match
+        # generate sẽ ghi thêm vào cache -> dùng bản sao để giữ nguyên prefix
+        kwargs['past_key_values'] = copy.deepcopy(cache)
+        self.prefix_stats['hits'] += 1
+        self.prefix_stats['tokens_saved'] += len(prefix_ids)
+        return model_inputs, kwargs, len(prefix_ids)
+
+    @property
+    def last_stats(self):
+        """Thống kê lần generate gần nhất của thread hiện tại (ttft, total, ...)"""
+        return getattr(self._local, "stats", {})
+
+    def _chat_text(self, prompt):
         messages = [
             {"role": "system", "content": "Bạn là nhân viên hỗ trợ đặt món tại nhà hàng Hòa Viên."},
             {"role": "user", "content": prompt}
         ]
-        text = self.tokenizer.apply_chat_template(
+        return self.tokenizer.apply_chat_template(
             messages,
             tokenize=False,
             add_generation_prompt=True
         )
-        model_inputs = self.tokenizer([text], return_tensors="pt").to(self.model.device)
+
+    def _stop_kwargs(self, stop):
+        """Tham số dừng sinh khi gặp chuỗi trong stop (transformers cần tokenizer để so khớp)"""
+        return {'stop_strings': list(stop), 'tokenizer': self.tokenizer} if stop else {}
+
+    @staticmethod
+    def _cut_at_stop(text, stop):
+        """Cắt text tại chuỗi dừng xuất hiện sớm nhất; return (text, số ký tự bị bỏ)"""
+        cut = min((text.find(s) for s in stop or () if s in text), default=-1)
+        if cut < 0:
+            return text, 0
+        return text[:cut].rstrip(), len(text) - len(text[:cut].rstrip())
+
+    def _finish_stats(self, raw, text, new_tokens, max_new_tokens):
+        """Thống kê độ dài của 1 câu trả lời (dùng cho GenerationPolicy)"""
+        return {
+            'new_tokens': new_tokens,
+            'hit_cap': new_tokens >= max_new_tokens,
+            'raw_chars': len(raw),
+            'stop_chars': len(raw) - len(text)
+        }
+
+    def generate(self, prompt, max_new_tokens=512, stop=None):
+        """Sinh câu trả lời; stop = các chuỗi dừng (vd. 'Khách hàng:'), không có trong kết quả trả về"""
+        start = time.perf_counter()
+        model_inputs, inputs, _ = self._prepare_inputs(prompt)
+        timer = PrefillTimer()
+        counts = self._draft_counts()
 
         generated_ids = self.model.generate(
-            **model_inputs,
+            **inputs,
+            **self._draft_kwargs(),
+            **self._stop_kwargs(stop),
             max_new_tokens=max_new_tokens,
-            pad_token_id=self.tokenizer.eos_token_id
+            pad_token_id=self.tokenizer.eos_token_id,
+            logits_processor=LogitsProcessorList([timer])
         )
         generated_ids = [
             output_ids[len(input_ids):] for input_ids, output_ids in zip(model_inputs.input_ids, generated_ids)
         ]
-        return self.tokenizer.batch_decode(generated_ids, skip_special_tokens=True)[0]
\ No newline at end of file
+        raw = self.tokenizer.batch_decode(generated_ids, skip_special_tokens=True)[0]
+        text, _ = self._cut_at_stop(raw, stop)
+        end = time.perf_counter()
+        prefill, decode = timer.split(start, end)
+        self._local.stats = {
+            'total': end - start,
+            'prefill': prefill,
+            'decode': decode,
+            'prompt_tokens': model_inputs.input_ids.shape[1],
+            **self._finish_stats(raw, text, len(generated_ids[0]), max_new_tokens),
+            **self._draft_stats(counts, len(generated_ids[0]))
+        }
+        return text
+
+    def generate_batch(self, prompts, max_new_tokens=512, batch_size=None, stop=None):
+        """
+        Sinh câu trả lời cho nhiều prompt, mỗi batch là 1 lần generate (padding bên trái).
+        last_stats['rows'] chứa thống kê độ dài của từng câu trả lời.
+        Không dùng prefix cache: padding bên trái làm lệch vị trí prefix giữa các câu.
+        Không dùng draft model: transformers chỉ hỗ trợ assisted generation với batch 1.
+        """
+        batch_size = batch_size or Config.BATCH_SIZE
+        pad_token_id = self.tokenizer.pad_token_id
+        if pad_token_id is None:
+            pad_token_id = self.tokenizer.eos_token_id
+
+        results = []
+        stats = {'total': 0.0, 'prefill': 0.0, 'decode': 0.0, 'prompt_tokens': 0, 'new_tokens': 0, 'rows': []}
+        for start in range(0, len(prompts), batch_size):
+            batch_start = time.perf_counter()
+            texts = [self._chat_text(p) for p in prompts[start:start + batch_size]]
+
+            # Model decoder-only cần pad bên trái để token cuối của mọi câu thẳng hàng
+            padding_side = self.tokenizer.padding_side
+            self.tokenizer.padding_side = "left"
+            try:
+                model_inputs = self.tokenizer(texts, return_tensors="pt", padding=True).to(self.model.device)
+            finally:
+                self.tokenizer.padding_side = padding_side
+
+            timer = PrefillTimer()
+            generated_ids = self.model.generate(
+                **model_inputs,
+                **self._stop_kwargs(stop),
+                max_new_tokens=max_new_tokens,
+                pad_token_id=pad_token_id,
+                logits_processor=LogitsProcessorList([timer])
+            )
+            generated_ids = generated_ids[:, model_inputs.input_ids.shape[1]:]
+            row_tokens = (generated_ids != pad_token_id).sum(dim=1).tolist()
+            for raw, new_tokens in zip(self.tokenizer.batch_decode(generated_ids, skip_special_tokens=True), row_tokens):
+                text, _ = self._cut_at_stop(raw, stop)
+                results.append(text)
+                stats['rows'].append(self._finish_stats(raw, text, new_tokens, max_new_tokens))
+
+            # Thống kê cộng dồn các batch (token thật, không tính padding)
+            end = time.perf_counter()
+            prefill, decode = timer.split(batch_start, end)
+            stats['total'] += end - batch_start
+            stats['prefill'] += prefill
+            stats['decode'] += decode
+            stats['prompt_tokens'] += int(model_inputs.attention_mask.sum())
+            stats['new_tokens'] += sum(row_tokens)
+        self._local.stats = stats
+        return results
+
+    def generate_stream(self, prompt, max_new_tokens=512, stop=None):
+        """
+        Sinh câu trả lời dạng stream: yield từng đoạn text ngay khi token được sinh ra.
+        Phần cuối có thể là đầu của 1 chuỗi dừng được giữ lại cho tới khi chắc chắn không phải.
+        Sau khi kết thúc, last_stats chứa ttft (time-to-first-token) và total (tổng thời gian).
+        """
+        start = time.perf_counter()
+        model_inputs, inputs, _ = self._prepare_inputs(prompt)
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        timer = PrefillTimer()
+        counts = self._draft_counts()
+
+        # model.generate chạy ở thread riêng, thread hiện tại đọc streamer
+        errors = []
+        outputs = []
+        def run():
+            try:
+                outputs.append(self.model.generate(
+                    **inputs,
+                    **self._draft_kwargs(),
+                    **self._stop_kwargs(stop),
+                    max_new_tokens=max_new_tokens,
+                    pad_token_id=self.tokenizer.eos_token_id,
+                    streamer=streamer,
+                    logits_processor=LogitsProcessorList([timer])
+                ))
+            except Exception as e:
+                errors.append(e)
+                streamer.end()
+        worker = threading.Thread(target=run, daemon=True)
+        worker.start()
+
+        ttft = None
+        chunks = 0
+        raw, pending, stopped = "", "", False
+        for chunk in streamer:
+            raw += chunk
+            if stopped or not chunk:
+                continue
+            pending += chunk
+            text, removed = self._cut_at_stop(pending, stop)
+            if removed:
+                stopped = True
+            else:
+                # Giữ lại phần đuôi trùng với đầu 1 chuỗi dừng
+                hold = max((k for s in stop or () for k in range(1, len(s)) if pending.endswith(s[:k])), default=0)
+                text = pending[:len(pending) - hold]
+            pending = pending[len(text):] if not stopped else ""
+            if not text:
+                continue
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            chunks += 1
+            yield text
+        worker.join()
+        if errors:
+            raise errors[0]
+        if pending:
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            chunks += 1
+            yield pending
+
+        end = time.perf_counter()
+        prefill, decode = timer.split(start, end)
+        new_tokens = outputs[0].shape[1] - model_inputs.input_ids.shape[1]
+        self._local.stats = {
+            'ttft': ttft,
+            'total': end - start,
+            'prefill': prefill,
+            'decode': decode,
+            'chunks': chunks,
+            **self._finish_stats(raw, self._cut_at_stop(raw, stop)[0], new_tokens, max_new_tokens),
+            **self._draft_stats(counts, new_tokens)
+        }
+
+    def _label_token_ids(self, labels):
+        """Token đầu tiên của mỗi nhãn; các nhãn phải bắt đầu bằng token khác nhau"""
+        token_ids = {}
+        for label, text in labels.items():
+            ids = self.tokenizer.encode(text, add_special_tokens=False)
+            if not ids:
+                raise ValueError(f"Nhãn rỗng: {label!r}")
+            token_ids[label] = ids[0]
+        if len(set(token_ids.values())) != len(token_ids):
+            raise ValueError("Các nhãn phải bắt đầu bằng token khác nhau để phân loại bằng 1 token")
+        return token_ids
+
+    @staticmethod
+    def _label_distribution(logits, token_ids):
+        """Softmax chỉ trên các token nhãn -> {label: xác suất}"""
+        labels = list(token_ids)
+        scores = logits[[token_ids[label] for label in labels]].float()
+        probs = torch.softmax(scores, dim=-1).tolist()
+        return dict(zip(labels, probs))
+
+    def classify(self, prompt, labels):
+        """
+        Phân loại bằng 1 lần forward: chấm điểm token đầu tiên của câu trả lời,
+        chỉ xét các token của nhãn (labels = {nhãn: text trả lời, vd "1"}).
+        Return (nhãn có xác suất cao nhất, {nhãn: xác suất}).
+        """
+        token_ids = self._label_token_ids(labels)
+        model_inputs, inputs, cached = self._prepare_inputs(prompt)
+
+        if cached:
+            # Forward thủ công: chỉ đưa phần token chưa có trong KV-cache của prefix
+            total = model_inputs.input_ids.shape[1]
+            inputs['input_ids'] = model_inputs.input_ids[:, cached:]
+            inputs['cache_position'] = torch.arange(cached, total, device=self.model.device)
+        with torch.no_grad():
+            outputs = self.model(**inputs, use_cache=bool(cached))
+
+        probs = self._label_distribution(outputs.logits[0, -1], token_ids)
+        return max(probs, key=probs.get), probs
+
+    def classify_batch(self, prompts, labels, batch_size=None):
+        """classify cho nhiều prompt, mỗi batch 1 lần forward (padding bên trái)"""
+        batch_size = batch_size or Config.BATCH_SIZE
+        token_ids = self._label_token_ids(labels)
+
+        results = []
+        stats = {'total': 0.0, 'prefill': 0.0, 'decode': 0.0, 'prompt_tokens': 0, 'new_tokens': 0}
+        for start in range(0, len(prompts), batch_size):
+            batch_start = time.perf_counter()
+            texts = [self._chat_text(p) for p in prompts[start:start + batch_size]]
+            padding_side = self.tokenizer.padding_side
+            self.tokenizer.padding_side = "left"
+            try:
+                model_inputs = self.tokenizer(texts, return_tensors="pt", padding=True).to(self.model.device)
+            finally:
+                self.tokenizer.padding_side = padding_side
+
+            # Vị trí token tính theo attention_mask (giống generate) để padding trái không làm lệch
+            position_ids = model_inputs.attention_mask.long().cumsum(-1) - 1
+            position_ids.masked_fill_(model_inputs.attention_mask == 0, 1)
+            with torch.no_grad():
+                logits = self.model(**model_inputs, position_ids=position_ids, use_cache=False).logits[:, -1]
+            for row in logits:
+                probs = self._label_distribution(row, token_ids)
+                results.append((max(probs, key=probs.get), probs))
+
+            # Chỉ 1 lần forward, không sinh token -> toàn bộ thời gian là prefill
+            elapsed = time.perf_counter() - batch_start
+            stats['total'] += elapsed
+            stats['prefill'] += elapsed
+            stats['prompt_tokens'] += int(model_inputs.attention_mask.sum())
+        self._local.stats = stats
+        return results
@@ -1,18 +1,22 @@
 import os
-from qdrant_client import QdrantClient
-from ingest import DataIngestor
+from ingest import DataIngestor, create_qdrant_client
 from llm_wrapper import LLMWrapper
+from model_registry import ModelRegistry
 from rag_engine import UniMSRAG
 from config import Config
 
-def main():
-    print("="*60)
-    print("CHATBOT ĐẶT MÓN ĂN - HÒA VIÊN RESTAURANT")
-    print("="*60)
-    
+def load_shared():
+    """
+    Phần nặng dùng chung: Qdrant + ingest dữ liệu + LLM (server nhiều worker load 1 lần ở process cha,
+    các worker fork ra dùng chung trọng số). Return (client, ingestor, llm) hoặc None nếu lỗi load LLM
+    """
     # 1. Khởi tạo Qdrant (Local)
     print("\n[1/4] Connecting to Qdrant...")
-    client = QdrantClient(Config.QDRANT_PATH)
+    client = create_qdrant_client()
+
+    # Load tokenizer + LLM song song (thread nền) trong lúc ingest dùng encoder
+    if Config.PARALLEL_MODEL_LOADING:
+        ModelRegistry.preload(["tokenizer", "llm", "draft"])
     
     # 2. Ingest dữ liệu
     print("[2/4] Ingesting data...")
@@ -25,14 +29,36 @@ def main():
         llm = LLMWrapper()
     except Exception as e:
         print(f"Error loading LLM: {e}")
-        return
+        return None
+    return client, ingestor, llm
+
+def build_bot(shared=None):
+    """Khởi tạo Qdrant, ingest dữ liệu, load LLM và RAG Engine (dùng chung cho main và server)"""
+    shared = shared or load_shared()
+    if shared is None:
+        return None
+    client, ingestor, llm = shared
     
     # 4. Khởi tạo RAG Engine với Order Management
     print("[4/4] Initializing RAG Engine with Order Management...")
     bot = UniMSRAG(llm, client)
+    # Dữ liệu menu thay đổi -> bỏ các câu trả lời SEARCH đã cache (BM25 mới đi kèm snapshot menu mới)
+    ingestor.on_change(lambda stats: bot.answer_cache.clear())
+    # Theo dõi menu_v2.json: đổi giá / món tạm hết -> cập nhật trong thread nền, không cần khởi động lại
+    bot.menu.start(ingestor)
     
     print("\n✅ System Ready!")
     print("="*60)
+    return bot
+
+def main():
+    print("="*60)
+    print("CHATBOT ĐẶT MÓN ĂN - HÒA VIÊN RESTAURANT")
+    print("="*60)
+    
+    bot = build_bot()
+    if bot is None:
+        return
     
     # 5. Xử lý Input/Output
     input_file = os.path.join(Config.INPUT_DIR, "sentences.txt")
@@ -55,16 +81,23 @@ def main():
         while True:
             query = input("👤 Bạn: ")
             if query.lower() in ["exit", "quit"]:
+                bot.query_cache.save()
+                bot.order_manager.close()
                 print("Cảm ơn bạn đã sử dụng dịch vụ! 👋")
                 break
             
             if not query.strip():
                 continue
                 
-            print("🤖 Bot: ", end="")
+            print("🤖 Bot: ", end="", flush=True)
             try:
-                response = bot.process(query)
-                print(response)
+                # In từng đoạn ngay khi LLM sinh ra thay vì chờ hết câu trả lời
+                for chunk in bot.process_stream(Config.DEFAULT_USER_ID, query):
+                    print(chunk, end="", flush=True)
+                print()
+                stats = bot.last_stream_stats
+                if stats.get('ttft') is not None:
+                    print(f"   ⏱  TTFT: {stats['ttft']:.2f}s | Tổng: {stats['total']:.2f}s")
             except Exception as e:
                 print(f"Lỗi: {e}")
             print()
@@ -80,27 +113,62 @@ def main():
     print("PROCESSING QUERIES")
     print("="*60 + "\n")
     
-    for i, q in enumerate(queries, 1):
-        q = q.strip()
-        if not q:
-            continue
-        
+    items = [(i, q.strip()) for i, q in enumerate(queries, 1) if q.strip()]
+    
+    def record(i, q, response=None, error=None):
         print(f"[{i}] User: {q}")
-        try:
-            response = bot.process(q)
+        if error is None:
             print(f"Response: {response[:100]}..." if len(response) > 100 else f"Response: {response}")
             results.append(f"Q: {q}\nA: {response}\n{'-'*60}\n")
-        except Exception as e:
-            error_msg = f"Error: {str(e)}"
+        else:
+            error_msg = f"Error: {str(error)}"
             print(error_msg)
             results.append(f"Q: {q}\nA: {error_msg}\n{'-'*60}\n")
         print()
     
+    if Config.BATCH_MODE:
+        # Xử lý theo batch; nếu bước phân loại intent của cả batch lỗi (chưa thao tác giỏ hàng)
+        # thì chạy lại từng câu
+        for start in range(0, len(items), Config.BATCH_SIZE):
+            chunk = items[start:start + Config.BATCH_SIZE]
+            try:
+                responses = bot.process_batch([(Config.DEFAULT_USER_ID, q) for _, q in chunk])
+            except Exception as e:
+                print(f"Batch error ({e}), chuyển sang xử lý từng câu...")
+                responses = None
+            
+            for j, (i, q) in enumerate(chunk):
+                if responses is not None:
+                    if isinstance(responses[j], Exception):
+                        record(i, q, error=responses[j])
+                    else:
+                        record(i, q, responses[j])
+                    continue
+                try:
+                    record(i, q, bot.process(Config.DEFAULT_USER_ID, q))
+                except Exception as e:
+                    record(i, q, error=e)
+    else:
+        for i, q in items:
+            try:
+                record(i, q, bot.process(Config.DEFAULT_USER_ID, q))
+            except Exception as e:
+                record(i, q, error=e)
+    
     # Ghi kết quả
     os.makedirs(Config.OUTPUT_DIR, exist_ok=True)
     with open(output_file, 'w', encoding='utf-8') as f:
         f.writelines(results)
     
+    bot.query_cache.save()
+    bot.order_manager.close()
+    print(bot.intent_classifier.summary())
+    print(f"[Query cache] {bot.query_cache.stats()}")
+    print(f"[Answer cache] {bot.answer_cache.stats()}")
+    print(bot.generation_policy.summary())
+    print(bot.context_builder.summary())
+    if bot.tracer.enabled:
+        print(bot.tracer.summary())
     print("="*60)
     print(f"✅ Done! Results saved to: {output_file}")
     print("="*60)
@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from config import Config
+from fast_answer import FastAnswerer
+from hybrid_retriever import RetrievalIndex
+from ingest import resolve_collection
+from intent_classifier import IntentClassifier
+from order_manager import MenuCatalog
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+class MenuSnapshot:
+    """
+    1 phiên bản dữ liệu suy ra từ menu_v2.json: tra cứu món (MenuCatalog), IntentClassifier, FastAnswerer,
+    collection Qdrant + BM25 (RetrievalIndex). Không sửa sau khi dựng; thống kê của IntentClassifier /
+    FastAnswerer được cộng dồn qua các phiên bản
+    """
+    def __init__(self, menu_path, version=1, digest=None, previous=None, index=None):
+        self.menu_path = menu_path
+        self.version = version
+        self.digest = digest
+        # Không dựng lại Vector DB (MenuWatcher không có ingestor) -> dùng chung index của phiên bản trước
+        self.index = index if index is not None or previous is None else previous.index
+        # Số lượt đang ghim snapshot này (MenuWatcher.pinned), chỉ đổi khi giữ MenuWatcher._lock
+        self.pins = 0
+        self.catalog = MenuCatalog.load(menu_path)
+        self.intent_classifier = IntentClassifier(menu_path, self.catalog.menu_items)
+        self.fast_answer = FastAnswerer(menu_path, self.catalog)
+        if previous is not None:
+            self.intent_classifier.stats = previous.intent_classifier.stats
+            self.fast_answer.hits = previous.fast_answer.hits
+            self.fast_answer.misses = previous.fast_answer.misses
+
+    @property
+    def dish_count(self):
+        return len({item['id'] for item in self.catalog.menu_items.values()})
+
+class MenuWatcher:
+    """
+    Thay nóng dữ liệu menu khi menu_v2.json thay đổi (đổi giá, món tạm hết...), không khởi động lại process:
+    - Thread nền kiểm tra mtime/size mỗi interval giây, đổi thì so sha256 nội dung file
+    - Dựng MenuSnapshot mới trong thread nền: Vector DB nạp vào collection Qdrant mới theo phiên bản
+      (chỉ embed document thay đổi) + BM25 mới; collection đang phục vụ không bị sửa
+    - Xong mới thay snapshot (gán 1 tham chiếu); file lỗi (JSON dở dang...) / ingest lỗi -> giữ snapshot cũ
+    - pinned(): ghim snapshot cho cả lượt đang xử lý của thread hiện tại, lượt đang chạy
+      không bị đổi menu (kể cả vector / BM25) giữa chừng
+    - Collection của snapshot cũ bị xóa khi không còn lượt nào ghim
+    """
+    def __init__(self, menu_path, interval=None, client=None):
+        """client: QdrantClient chứa dữ liệu truy xuất (None = snapshot không kèm RetrievalIndex)"""
+        self.menu_path = menu_path
+        self.interval = Config.MENU_WATCH_INTERVAL if interval is None else interval
+        self.client = client
+        self._signature = self._stat()
+        digest = file_digest(menu_path) if self._signature else None
+        index = RetrievalIndex.load(client, resolve_collection(client)) if client is not None else None
+        self._current = MenuSnapshot(menu_path, digest=digest, index=index)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._retired = []  # snapshot đã bị thay, chờ hết lượt ghim để xóa collection
+        self._listeners = []
+        self._ingestor = None
+        self._thread = None
+        self._stop = threading.Event()
+        self.reloads = 0
+        self.errors = 0
+
+    @property
+    def current(self):
+        """Snapshot ghim cho lượt hiện tại của thread (nếu có), không thì snapshot mới nhất"""
+        return getattr(self._local, 'snapshot', None) or self._current
+
+    @contextmanager
+    def pinned(self):
+        snapshot = getattr(self._local, 'snapshot', None)
+        if snapshot is not None:
+            # Đã ghim ở lượt ngoài (vd. process_stream gọi lại process)
+            yield snapshot
+            return
+        with self._lock:
+            snapshot = self._current
+            snapshot.pins += 1
+        self._local.snapshot = snapshot
+        try:
+            yield snapshot
+        finally:
+            self._local.snapshot = None
+            with self._lock:
+                snapshot.pins -= 1
+
+    def on_reload(self, callback):
+        """Đăng ký callback(snapshot) được gọi sau khi thay snapshot mới"""
+        self._listeners.append(callback)
+
+    def _stat(self):
+        try:
+            st = os.stat(self.menu_path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def check(self):
+        """Kiểm tra file menu, thay đổi thì reload (đồng bộ); return True nếu đã thay snapshot mới"""
+        signature = self._stat()
+        if signature is None or signature == self._signature:
+            return False
+        with open(self.menu_path, 'rb') as f:
+            raw = f.read()
+        self._signature = signature
+        digest = hashlib.sha256(raw).hexdigest()
+        if digest == self._current.digest:
+            return False
+        try:
+            json.loads(raw.decode('utf-8'))
+        except ValueError as e:
+            # File đang ghi dở / sai cú pháp: giữ menu cũ, lần ghi sau đổi mtime sẽ được kiểm tra lại
+            self.errors += 1
+            print(f"[Menu] {self.menu_path} không hợp lệ ({e}), giữ phiên bản v{self._current.version}.")
+            return False
+        if not self.reload(digest):
+            # Lỗi khi dựng (ingest...) -> thử lại ở lần kiểm tra sau dù file không đổi
+            self._signature = None
+            return False
+        return True
+
+    def reload(self, digest=None):
+        """Dựng snapshot mới từ file menu (kèm collection Qdrant + BM25 mới) rồi thay snapshot"""
+        with self._reload_lock:
+            start = time.perf_counter()
+            previous = self._current
+            version = previous.version + 1
+            digest = digest or file_digest(self.menu_path)
+            collection, stats = None, {}
+            try:
+                index = None
+                if self._ingestor is not None and previous.index is not None:
+                    # Collection mới theo phiên bản: chỉ embed document đổi nội dung, lượt đang ghim
+                    # snapshot cũ vẫn truy xuất trên collection + BM25 cũ
+                    collection = f"{Config.COLLECTION_NAME}_v{version}_{digest[:8]}"
+                    stats = self._ingestor.build(collection, base=previous.index.collection_name)
+                    index = RetrievalIndex.load(self.client, collection)
+                snapshot = MenuSnapshot(self.menu_path, version, digest, previous, index)
+            except Exception as e:
+                self.errors += 1
+                if collection is not None and self.client.collection_exists(collection_name=collection):
+                    self.client.delete_collection(collection_name=collection)
+                print(f"[Menu] Lỗi reload menu ({e}), giữ phiên bản v{previous.version}.")
+                return False
+            with self._lock:
+                self._current = snapshot
+                self._retired.append(previous)
+            self.reloads += 1
+        self.collect()
+        print(f"[Menu] v{snapshot.version}: {snapshot.dish_count} món, Qdrant {stats or 'không đổi'} "
+              f"({(time.perf_counter() - start) * 1000:.0f} ms)")
+        for callback in self._listeners:
+            callback(snapshot)
+        return True
+
+    def collect(self):
+        """Xóa collection của các snapshot cũ không còn lượt nào ghim, trỏ alias tới collection đang dùng"""
+        with self._lock:
+            done = [snapshot for snapshot in self._retired if snapshot.pins == 0]
+            self._retired = [snapshot for snapshot in self._retired if snapshot.pins]
+            current = self._current
+            in_use = {snapshot.index.collection_name for snapshot in self._retired + [current]
+                      if snapshot.index is not None}
+        if self._ingestor is None or current.index is None:
+            return
+        # Trỏ alias trước khi xóa; Config.COLLECTION_NAME còn là collection thật (dữ liệu cũ) thì đặt sau khi xóa
+        published = self._ingestor.publish(current.index.collection_name)
+        for snapshot in done:
+            if snapshot.index is not None and snapshot.index.collection_name not in in_use:
+                self._ingestor.drop(snapshot.index.collection_name)
+        if not published:
+            self._ingestor.publish(current.index.collection_name)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+                if self._retired:
+                    self.collect()
+            except Exception as e:
+                self.errors += 1
+                print(f"[Menu] Lỗi kiểm tra menu: {e}")
+
+    def start(self, ingestor=None):
+        """Bắt đầu theo dõi file menu trong thread nền (ingestor: DataIngestor để cập nhật Vector DB)"""
+        self._ingestor = ingestor
+        if ingestor is not None and self.client is None:
+            self.client = ingestor.client
+        if self._thread is None and self.interval:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="menu-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,140 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+
+def _load_encoder():
+    from sentence_transformers import SentenceTransformer
+    print(f"Loading encoder: {Config.EMBEDDING_MODEL}...")
+    return SentenceTransformer(Config.EMBEDDING_MODEL)
+
+def _load_tokenizer():
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(Config.MODEL_ID)
+
+def configure_torch_threads(num_threads=None):
+    """Đặt số thread cho torch (None = dùng Config.TORCH_NUM_THREADS, vẫn None thì để mặc định)"""
+    import torch
+    num_threads = num_threads or Config.TORCH_NUM_THREADS
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    return torch.get_num_threads()
+
+def _load_llm(model_id=None):
+    import torch
+    from transformers import AutoModelForCausalLM
+
+    model_id = model_id or Config.MODEL_ID
+    # Tự động chọn thiết bị (GPU nếu có, CPU nếu không)
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    backend = Config.INFERENCE_BACKEND if device == "cpu" else "fp16"
+    if backend not in ("fp32", "bf16", "int8", "fp16"):
+        raise ValueError(f"INFERENCE_BACKEND không hợp lệ: {backend}")
+    print(f"Loading LLM: {model_id} ({device}, {backend})...")
+
+    if device == "cpu":
+        threads = configure_torch_threads()
+        print(f"CPU threads: {threads}")
+
+    dtypes = {"fp16": torch.float16, "bf16": torch.bfloat16, "fp32": torch.float32, "int8": torch.float32}
+    model = AutoModelForCausalLM.from_pretrained(
+        model_id,
+        torch_dtype=dtypes[backend],
+        device_map="auto" if device == "cuda" else None
+    )
+    if device == "cpu":
+        model.to("cpu")
+
+    if backend == "int8":
+        # Dynamic quantization: trọng số Linear lưu int8, activation lượng tử hóa lúc chạy
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    model.eval()
+    return model
+
+def _load_draft():
+    """Model nháp cho speculative decoding (None nếu không cấu hình DRAFT_MODEL_ID)"""
+    if not Config.DRAFT_MODEL_ID:
+        return None
+    return _load_llm(Config.DRAFT_MODEL_ID)
+
+_LOADERS = {
+    "encoder": _load_encoder,
+    "tokenizer": _load_tokenizer,
+    "llm": _load_llm,
+    "draft": _load_draft,
+}
+
+class ModelRegistry:
+    """
+    Registry dùng chung cho cả process (encoder, tokenizer, LLM):
+    - Mỗi model chỉ được load 1 lần, lần gọi đầu tiên mới load (lazy)
+    - Có thể load song song nhiều model bằng thread trong lúc khởi động
+    """
+    _models = {}
+    _locks = {}
+    _registry_lock = threading.Lock()
+    _executor = None
+
+    @classmethod
+    def _lock_for(cls, name):
+        with cls._registry_lock:
+            return cls._locks.setdefault(name, threading.Lock())
+
+    @classmethod
+    def _get(cls, name):
+        if name in cls._models:
+            return cls._models[name]
+        # Lock riêng cho từng model: các thread cùng xin 1 model sẽ chờ nhau,
+        # còn các model khác nhau vẫn load song song được
+        with cls._lock_for(name):
+            if name not in cls._models:
+                cls._models[name] = _LOADERS[name]()
+        return cls._models[name]
+
+    @classmethod
+    def get_encoder(cls):
+        """SentenceTransformer dùng chung cho DataIngestor và UniMSRAG"""
+        return cls._get("encoder")
+
+    @classmethod
+    def get_tokenizer(cls):
+        return cls._get("tokenizer")
+
+    @classmethod
+    def get_llm(cls):
+        return cls._get("llm")
+
+    @classmethod
+    def get_draft(cls):
+        """Model nháp (cùng tokenizer với LLM) hoặc None"""
+        return cls._get("draft")
+
+    @classmethod
+    def register(cls, name, model):
+        """Gán sẵn 1 model (vd: model giả lập khi test/benchmark)"""
+        with cls._lock_for(name):
+            cls._models[name] = model
+
+    @classmethod
+    def is_loaded(cls, name):
+        return name in cls._models
+
+    @classmethod
+    def preload(cls, names=("encoder", "tokenizer", "llm"), parallel=None):
+        """
+        Bắt đầu load các model.
+        - parallel=True: load trong thread nền, trả về dict {name: Future}
+        - parallel=False: load tuần tự ngay tại chỗ
+        """
+        if parallel is None:
+            parallel = Config.PARALLEL_MODEL_LOADING
+
+        if not parallel:
+            for name in names:
+                cls._get(name)
+            return {}
+
+        with cls._registry_lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(max_workers=len(_LOADERS),
+                                                   thread_name_prefix="model-loader")
+        return {name: cls._executor.submit(cls._get, name) for name in names}
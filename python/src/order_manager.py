@@ -1,55 +1,127 @@
 import json
 import os
+import re
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Callable, Dict, List, Optional, Tuple
+from dish_index import DishIndex, fold_accents
+from order_store import OrderStore
+from order_writer import OrderWriter, next_order_id
+from session_store import SessionStore
+from config import Config
 
-class OrderManager:
+class MenuCatalog:
     """
-    Quản lý đơn hàng: thêm, xóa, sửa món, xem đơn hàng
+    Dữ liệu tra cứu món của 1 phiên bản menu: dict tên món, chỉ mục tên món, thông tin nhà hàng.
+    Không sửa sau khi dựng - menu thay đổi thì dựng catalog mới và thay cả object (MenuWatcher)
     """
-    def __init__(self, menu_path: str):
-        self.orders = {}  # {user_id: [list of order items]}
-        self.menu_items = self._load_menu(menu_path)
-    
-    def _load_menu(self, path):
-        """Load menu từ file JSON và tạo dict tra cứu nhanh"""
+    def __init__(self, menu_items: Optional[Dict] = None, dish_index: Optional[DishIndex] = None,
+                 restaurant: Optional[Dict] = None):
+        self.menu_items = menu_items or {}
+        self.dish_index = dish_index or DishIndex()
+        self.restaurant = restaurant or {}  # Thông tin nhà hàng (giờ mở cửa, liên hệ...) từ menu
+
+    @classmethod
+    def load(cls, path: str) -> "MenuCatalog":
+        """Load menu từ file JSON, tạo dict tra cứu nhanh và chỉ mục tên món"""
         try:
             with open(path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
-            
-            # Tạo dict để tra cứu nhanh món ăn
-            items_dict = {}
-            for category in data.get("menu", {}).get('categories', []):
-                for item in category.get("items", []):
-                    # Lưu cả tên tiếng Việt và tiếng Anh
-                    items_dict[item['name_vn'].lower()] = {
-                        'id': item['id'],
-                        'name_vn': item['name_vn'],
-                        'name_en': item['name_en'],
-                        'price': item['price'],
-                        'category': category['name_vn']
-                    }
-                    items_dict[item['name_en'].lower()] = items_dict[item['name_vn'].lower()]
-            
-            return items_dict
         except FileNotFoundError as e:
             print(f"Error loading menu: {e}")
-            return {}
-    
+            return cls()
+
+        # Tạo dict để tra cứu nhanh món ăn
+        items_dict = {}
+        dish_index = DishIndex()
+        for category in data.get("menu", {}).get('categories', []):
+            for item in category.get("items", []):
+                # Lưu cả tên tiếng Việt và tiếng Anh
+                items_dict[item['name_vn'].lower()] = {
+                    'id': item['id'],
+                    'name_vn': item['name_vn'],
+                    'name_en': item['name_en'],
+                    'price': item['price'],
+                    'category': category['name_vn'],
+                    'available': item.get('available', True)
+                }
+                items_dict[item['name_en'].lower()] = items_dict[item['name_vn'].lower()]
+                dish_index.add(
+                    items_dict[item['name_vn'].lower()],
+                    [item['name_vn'], item['name_en']] + item.get('aliases', [])
+                )
+        return cls(items_dict, dish_index, data.get('restaurant', {}))
+
     def find_dish(self, dish_name: str) -> Optional[Dict]:
-        """Tìm món ăn trong menu (fuzzy matching)"""
+        """Tìm món ăn trong menu (fuzzy matching qua DishIndex)"""
         dish_name_lower = dish_name.lower().strip()
         
         # Exact match
         if dish_name_lower in self.menu_items:
             return self.menu_items[dish_name_lower]
         
-        # Fuzzy match - tìm món có chứa từ khóa
-        for key, item in self.menu_items.items():
-            if dish_name_lower in key or key in dish_name_lower:
-                return item
-    
-        return None
+        # Fuzzy match - món có điểm cao nhất (bỏ dấu, n-gram, chứa tên / 1 phần tên)
+        return self.dish_index.best(dish_name_lower, Config.DISH_MATCH_THRESHOLD)
+
+    def find_dish_candidates(self, dish_name: str, limit: int = 5) -> List[Tuple[Dict, float]]:
+        """Danh sách món gần đúng kèm điểm (dùng để gợi ý khi không tìm thấy món)"""
+        return self.dish_index.search(dish_name, limit=limit)
+
+    def mentioned_dishes(self, text: str) -> List[Dict]:
+        """
+        Các món được nhắc tới trong câu hỏi (tên / phần đầu tên món, hoặc fuzzy >= DISH_MATCH_THRESHOLD).
+        Tên nhà hàng không tính: 'Hòa Viên mở cửa mấy giờ' không phải hỏi về 'Bò tay cầm Hòa Viên'
+        """
+        folded = fold_accents(text)
+        for name in (self.restaurant.get('name'), self.restaurant.get('name_en')):
+            if name:
+                folded = re.sub(r'\b' + re.escape(fold_accents(name)) + r'\b', ' ', folded)
+        dishes = self.dish_index.mentions(folded)
+        if dishes:
+            return dishes
+        dish = self.dish_index.best(folded, Config.DISH_MATCH_THRESHOLD)
+        return [dish] if dish else []
+
+class OrderManager:
+    """
+    Quản lý đơn hàng: thêm, xóa, sửa món, xem đơn hàng
+    """
+    def __init__(self, menu_path: str, log_path: Optional[str] = None,
+                 catalog: Optional[Callable[[], MenuCatalog]] = None):
+        """catalog: hàm trả về MenuCatalog đang dùng (menu thay nóng); None = load 1 lần từ menu_path"""
+        self.orders = SessionStore()  # {user_id: [list of order items]}, tự xóa giỏ hàng bị bỏ dở
+        if catalog is None:
+            static_catalog = MenuCatalog.load(menu_path)
+            catalog = lambda: static_catalog
+        self._catalog = catalog
+        # File log đơn hàng + chỉ mục theo user_id
+        self.log_path = log_path or Config.ORDER_LOG_PATH or \
+            os.path.join(os.path.dirname(__file__), '../data/orders_log.jsonl')
+        self.order_store = OrderStore(self.log_path, max_bytes=Config.ORDER_LOG_MAX_BYTES)
+        self.order_writer = OrderWriter(self.order_store)
+
+    @property
+    def catalog(self) -> MenuCatalog:
+        return self._catalog()
+
+    @property
+    def menu_items(self) -> Dict:
+        return self.catalog.menu_items
+
+    @property
+    def restaurant(self) -> Dict:
+        return self.catalog.restaurant
+
+    def find_dish(self, dish_name: str) -> Optional[Dict]:
+        """Tìm món ăn trong menu (fuzzy matching qua DishIndex)"""
+        return self.catalog.find_dish(dish_name)
+
+    def find_dish_candidates(self, dish_name: str, limit: int = 5) -> List[Tuple[Dict, float]]:
+        """Danh sách món gần đúng kèm điểm (dùng để gợi ý khi không tìm thấy món)"""
+        return self.catalog.find_dish_candidates(dish_name, limit)
+
+    def mentioned_dishes(self, text: str) -> List[Dict]:
+        """Các món được nhắc tới trong câu hỏi"""
+        return self.catalog.mentioned_dishes(text)
 
     def add_item(self, user_id: str, dish_name: str, quantity: int = 1):
         """Thêm món ăn vào đơn hàng"""
@@ -61,6 +133,12 @@ class OrderManager:
                 'message': f"Xin lỗi, không tìm thấy món '{dish_name}' trong menu."
             }
         
+        if not dish.get('available', True):
+            return {
+                'success': False,
+                'message': f"Xin lỗi, món {dish['name_vn']} hiện đang tạm hết."
+            }
+        
         if user_id not in self.orders:
             self.orders[user_id] = []
         
@@ -68,7 +146,7 @@ class OrderManager:
         existing_item = None
         for item in self.orders[user_id]:
             if item['id'] == dish['id']:
-                existing_item = dish
+                existing_item = item
                 break
         
         if existing_item:
@@ -203,12 +281,9 @@ class OrderManager:
     
     def _save_to_file(self, user_id, order_info):
         """Lưu đơn hàng đã xác nhận vào file log"""
-        # Đường dẫn file lưu (nên để trong folder data)
-        save_path = os.path.join(os.path.dirname(__file__), '../data/orders_log.jsonl')
-        
         # Tạo bản ghi đơn hàng
         order_record = {
-            "order_id": f"{user_id}_{int(datetime.now().timestamp())}",
+            "order_id": next_order_id(user_id),
             "user_id": user_id,
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "items": order_info['items'],
@@ -217,12 +292,13 @@ class OrderManager:
         }
 
         try:
-            # Mode 'a' (append) để viết tiếp vào cuối file, không ghi đè đơn cũ
-            with open(save_path, 'a', encoding='utf-8') as f:
-                f.write(json.dumps(order_record, ensure_ascii=False) + "\n")
+            # Append vào cuối file log (ghi theo lô cùng các đơn khác), chờ tới khi đã lưu xong
+            self.order_writer.write(order_record)
             print(f"Đã lưu đơn hàng")
+            return True
         except Exception as e:
             print(f"Lỗi khi lưu file đơn hàng: {e}")
+            return False
     
     def confirm_order(self, user_id: str, delivery_time: str = None) -> Dict:
         """Xác nhận đặt hàng"""
@@ -233,6 +309,13 @@ class OrderManager:
             }
         
         order_info = self.view_order(user_id)
+
+        # Lưu đơn hàng trước, lỗi thì giữ nguyên giỏ hàng để khách xác nhận lại
+        if not self._save_to_file(user_id, order_info):
+            return {
+                'success': False,
+                'message': "Xin lỗi, hệ thống chưa lưu được đơn hàng. Vui lòng xác nhận lại sau ít phút."
+            }
         
         message = f"✅ Đã xác nhận đơn hàng!\n\n{order_info['message']}"
         
@@ -243,9 +326,6 @@ class OrderManager:
         
         message += "\n\nCảm ơn quý khách đã đặt hàng tại Hòa Viên! 🎉"
         
-        # Lưu đơn hàng (có thể lưu vào file hoặc database)
-        self._save_to_file(user_id, order_info)
-        
         # Sau đó clear đơn hàng hiện tại
         self.clear_order(user_id)
         
@@ -255,39 +335,22 @@ class OrderManager:
             'order': order_info
         }
 
-    def get_order_history(self, user_id: str, limit: int = 3) -> Dict:
-        """Lấy lịch sử đơn hàng đã đặt từ file log"""
-        # Đường dẫn file log (giống hàm _save_to_file)
-        save_path = os.path.join(os.path.dirname(__file__), '../data/orders_log.jsonl')
-        
-        if not os.path.exists(save_path):
-            return {'success': False, 'message': "Bạn chưa có lịch sử đặt hàng nào."}
+    def close(self):
+        """Ghi nốt các đơn đang chờ và đóng file log / chỉ mục"""
+        self.order_writer.close()
+        self.order_store.close()
 
-        user_history = []
+    def get_order_history(self, user_id: str, limit: int = 3) -> Dict:
+        """Lấy lịch sử đơn hàng đã đặt từ file log (qua chỉ mục, không quét cả file)"""
         try:
-            with open(save_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    try:
-                        if not line.strip(): continue
-                        record = json.loads(line.strip())
-                        # Lọc theo user_id
-                        if record.get('user_id') == user_id:
-                            user_history.append(record)
-                    except json.JSONDecodeError:
-                        continue
+            # Mới nhất lên đầu
+            recent_orders = self.order_store.recent(user_id, limit)
         except Exception as e:
             return {'success': False, 'message': f"Không thể đọc lịch sử đơn hàng: {e}"}
 
-        if not user_history:
+        if not recent_orders:
             return {'success': False, 'message': "Bạn chưa có đơn hàng nào trong lịch sử."}
 
-        # Sắp xếp giảm dần theo thời gian (mới nhất lên đầu)
-        # Giả định timestamp string format chuẩn sort được, hoặc parse ra datetime
-        user_history.sort(key=lambda x: x['timestamp'], reverse=True)
-        
-        # Lấy top 3
-        recent_orders = user_history[:limit]
-
         # Format hiển thị
         message = f"📋 DANH SÁCH {len(recent_orders)} ĐƠN HÀNG GẦN NHẤT CỦA BẠN:\n"
 
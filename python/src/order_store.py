@@ -0,0 +1,293 @@
+import fcntl
+import glob
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+class OrderStore:
+    """
+    Lưu đơn hàng đã xác nhận:
+    - Dữ liệu vẫn là file orders_log.jsonl append-only (mỗi dòng 1 đơn)
+    - Kèm chỉ mục SQLite (user_id, timestamp) -> (segment, offset, length) của dòng trong file log
+    - Lấy N đơn gần nhất của 1 user = 1 truy vấn chỉ mục + N lần seek, không quét cả file
+    - Dòng được ghi thêm vào log từ bên ngoài sẽ được index bù khi đọc (catch-up phần đuôi file)
+    - Ghi/đồng bộ chỉ mục giữ file lock (orders_log.jsonl.lock) nên an toàn khi nhiều process cùng ghi
+    - File log vượt quá max_bytes được đổi tên thành segment lưu trữ (orders_log.<thời điểm>.jsonl)
+    """
+    # Đổi khi thay đổi cấu trúc bảng -> chỉ mục cũ được dựng lại
+    SCHEMA_VERSION = "2"
+    # Segment '' = file log đang ghi
+    ACTIVE = ""
+
+    def __init__(self, log_path: str, index_path: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.log_path = log_path
+        self.index_path = index_path or log_path + ".idx"
+        self.lock_path = log_path + ".lock"
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+        self._conn = sqlite3.connect(self.index_path, timeout=30, check_same_thread=False)
+        with self._locked():
+            self._create_schema()
+            self._sync()
+
+    def _create_schema(self):
+        row = self._conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'meta'").fetchone()
+        if row and self._get_meta('schema') != self.SCHEMA_VERSION:
+            self._conn.executescript("DROP TABLE IF EXISTS orders; DROP TABLE IF EXISTS meta;")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS orders (
+                segment TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                user_id TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                order_id TEXT,
+                PRIMARY KEY (segment, offset)
+            );
+            CREATE INDEX IF NOT EXISTS idx_orders_user_time ON orders (user_id, timestamp);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        self._set_meta('schema', self.SCHEMA_VERSION)
+        self._conn.commit()
+
+    @contextmanager
+    def _locked(self):
+        """Lock trong process (thread) + file lock giữa các process"""
+        with self._lock:
+            with open(self.lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _get_meta(self, key, default=None):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, key, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _segment_path(self, segment):
+        if segment == self.ACTIVE:
+            return self.log_path
+        return os.path.join(os.path.dirname(self.log_path), segment)
+
+    def segments(self) -> List[str]:
+        """Các segment đã rotate (cũ -> mới)"""
+        root, ext = os.path.splitext(self.log_path)
+        return sorted(os.path.basename(p) for p in glob.glob(f"{glob.escape(root)}.*{ext}"))
+
+    def _log_signature(self):
+        """Chữ ký dòng đầu file log - dùng để phát hiện file log bị thay thế/ghi lại"""
+        try:
+            with open(self.log_path, 'rb') as f:
+                return f.readline().hex()[:256]
+        except FileNotFoundError:
+            return ""
+
+    @staticmethod
+    def _index_row(segment, offset, line):
+        record = json.loads(line)
+        return (segment, offset, len(line), record['user_id'], record.get('timestamp', ''),
+                record.get('order_id'))
+
+    def _index_lines(self, start, segment=ACTIVE):
+        """Index các dòng từ byte `start` tới cuối segment, trả về offset đã index tới"""
+        rows = []
+        offset = start
+        with open(self._segment_path(segment), 'rb') as f:
+            f.seek(start)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # dòng đang ghi dở, để lần sau
+                try:
+                    rows.append(self._index_row(segment, offset, line))
+                except (ValueError, KeyError, TypeError):
+                    pass  # dòng hỏng: bỏ qua như cách đọc cũ
+                offset += len(line)
+
+        self._conn.executemany("INSERT OR REPLACE INTO orders VALUES (?, ?, ?, ?, ?, ?)", rows)
+        if segment == self.ACTIVE:
+            self._set_meta('indexed_size', offset)
+        return offset
+
+    def _sync(self):
+        """Đồng bộ chỉ mục với file log (gọi khi đang giữ lock)"""
+        size = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+        indexed = int(self._get_meta('indexed_size', 0))
+        signature = self._log_signature()
+
+        if size < indexed or (indexed and signature != self._get_meta('signature')):
+            # File log bị cắt ngắn hoặc bị thay thế -> dựng lại toàn bộ
+            self._rebuild(signature)
+        elif size > indexed:
+            self._index_lines(indexed)
+            if not indexed:
+                self._set_meta('signature', signature)
+        self._conn.commit()
+
+    def _rebuild(self, signature):
+        self._conn.execute("DELETE FROM orders")
+        self._set_meta('indexed_size', 0)
+        self._set_meta('signature', signature)
+        for segment in self.segments():
+            self._index_lines(0, segment)
+        if os.path.exists(self.log_path):
+            self._index_lines(0)
+
+    def rebuild(self) -> int:
+        """Dựng lại chỉ mục từ các file log hiện có (migration 1 lần), trả về số đơn đã index"""
+        with self._locked():
+            self._rebuild(self._log_signature())
+            self._conn.commit()
+            return self._conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+
+    def _repair_tail(self, f):
+        """Cắt bỏ dòng ghi dở ở cuối file (process trước bị dừng giữa chừng) để dòng mới không dính vào"""
+        end = f.seek(0, os.SEEK_END)
+        if end == 0:
+            return 0
+        f.seek(end - 1)
+        if f.read(1) == b"\n":
+            return end
+        f.seek(0)
+        data = f.read()
+        keep = data.rfind(b"\n") + 1
+        f.truncate(keep)
+        print(f"Đã cắt {end - keep} byte ghi dở ở cuối {self.log_path}")
+        return keep
+
+    def append_many(self, records: List[Dict], fsync: bool = True):
+        """Ghi 1 lô đơn vào cuối file log bằng 1 lần write (+ fsync) và cập nhật chỉ mục"""
+        if not records:
+            return
+        lines = [(json.dumps(record, ensure_ascii=False) + "\n").encode('utf-8') for record in records]
+        with self._locked():
+            with open(self.log_path, 'a+b') as f:
+                start = offset = self._repair_tail(f)
+                self._sync()  # index các dòng ghi từ process khác trước, để offset liên tục
+                f.seek(0, os.SEEK_END)
+                f.write(b"".join(lines))
+                f.flush()
+                if fsync:
+                    os.fsync(f.fileno())
+
+            rows = []
+            for line in lines:
+                rows.append(self._index_row(self.ACTIVE, offset, line))
+                offset += len(line)
+            self._conn.executemany("INSERT OR REPLACE INTO orders VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._set_meta('indexed_size', offset)
+            if start == 0:
+                self._set_meta('signature', self._log_signature())
+            self._conn.commit()
+
+            if self.max_bytes and offset >= self.max_bytes:
+                self._rotate()
+
+    def append(self, record: Dict, fsync: bool = True):
+        """Ghi thêm 1 đơn vào cuối file log và cập nhật chỉ mục"""
+        self.append_many([record], fsync=fsync)
+
+    def _rotate(self):
+        """Đổi tên file log hiện tại thành segment lưu trữ (gọi khi đang giữ lock)"""
+        if not os.path.exists(self.log_path) or os.path.getsize(self.log_path) == 0:
+            return None
+        root, ext = os.path.splitext(os.path.basename(self.log_path))
+        segment = f"{root}.{datetime.now().strftime('%Y%m%d%H%M%S%f')}{ext}"
+        os.replace(self.log_path, self._segment_path(segment))
+        self._conn.execute("UPDATE orders SET segment = ? WHERE segment = ?", (segment, self.ACTIVE))
+        self._set_meta('indexed_size', 0)
+        self._set_meta('signature', "")
+        self._conn.commit()
+        print(f"Đã rotate file log đơn hàng -> {segment}")
+        return segment
+
+    def rotate(self) -> Optional[str]:
+        """Rotate file log ngay (không cần chờ đạt max_bytes)"""
+        with self._locked():
+            self._sync()
+            return self._rotate()
+
+    def compact(self) -> int:
+        """
+        Ghi lại file log đang dùng, bỏ các dòng hỏng/trùng order_id (giữ bản ghi đầu tiên),
+        trả về số dòng đã bỏ
+        """
+        with self._locked():
+            if not os.path.exists(self.log_path):
+                return 0
+            kept, seen, dropped = [], set(), 0
+            with open(self.log_path, 'rb') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        record = None
+                    if not isinstance(record, dict) or 'user_id' not in record:
+                        dropped += 1
+                        continue
+                    key = record.get('order_id') or line
+                    if key in seen:
+                        dropped += 1
+                        continue
+                    seen.add(key)
+                    kept.append(line if line.endswith(b"\n") else line + b"\n")
+
+            if dropped:
+                tmp_path = self.log_path + ".tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(b"".join(kept))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.log_path)
+                self._conn.execute("DELETE FROM orders WHERE segment = ?", (self.ACTIVE,))
+                self._set_meta('indexed_size', 0)
+                self._set_meta('signature', self._log_signature())
+                self._index_lines(0)
+                self._conn.commit()
+            return dropped
+
+    def recent(self, user_id: str, limit: int = 3) -> List[Dict]:
+        """N đơn gần nhất của user (mới nhất lên đầu)"""
+        with self._locked():
+            self._sync()
+            rows = self._conn.execute(
+                "SELECT segment, offset, length FROM orders WHERE user_id = ? "
+                "ORDER BY timestamp DESC, segment = '' DESC, segment DESC, offset DESC LIMIT ?",
+                (user_id, limit)
+            ).fetchall()
+
+            # Đọc khi vẫn giữ lock: rotate / compact (kể cả từ process khác) không thể đổi tên
+            # hay ghi lại segment giữa lúc truy vấn chỉ mục và lúc seek
+            records = []
+            for segment, offset, length in rows:
+                with open(self._segment_path(segment), 'rb') as f:
+                    f.seek(offset)
+                    records.append(json.loads(f.read(length)))
+            return records
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+if __name__ == "__main__":
+    # Migration / bảo trì file log có sẵn:
+    # python order_store.py [đường dẫn orders_log.jsonl] [--compact] [--rotate]
+    import sys
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../data/orders_log.jsonl')
+    store = OrderStore(args[0] if args else default_path)
+    if '--compact' in sys.argv:
+        print(f"Đã bỏ {store.compact()} dòng hỏng/trùng")
+    if '--rotate' in sys.argv:
+        print(f"Segment mới: {store.rotate()}")
+    print(f"Đã index {store.rebuild()} đơn hàng -> {store.index_path}")
+    store.close()
@@ -0,0 +1,105 @@
+import itertools
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Optional
+from config import Config
+
+_id_lock = threading.Lock()
+_id_counter = itertools.count()
+_last_ms = 0
+
+def next_order_id(user_id: str) -> str:
+    """
+    order_id duy nhất, tăng dần trong 1 process: {user_id}_{epoch ms}_{pid}_{seq}
+    (epoch ms không lùi khi đồng hồ hệ thống bị chỉnh, pid phân biệt các worker)
+    """
+    global _last_ms
+    with _id_lock:
+        _last_ms = max(_last_ms, int(time.time() * 1000))
+        return f"{user_id}_{_last_ms}_{os.getpid()}_{next(_id_counter)}"
+
+class OrderWriter:
+    """
+    Group commit cho file log đơn hàng:
+    - confirm_order đưa bản ghi vào hàng đợi và chờ tới khi bản ghi đã được ghi (và fsync)
+    - Thread nền gom các bản ghi đến trong flush_interval_ms (tối đa max_batch)
+      rồi ghi 1 lần qua OrderStore.append_many -> 1 lần write + 1 lần fsync cho cả lô
+    """
+    def __init__(self, store, flush_interval_ms=None, max_batch=None, fsync=None):
+        self.store = store
+        self.flush_interval = (Config.ORDER_FLUSH_INTERVAL_MS if flush_interval_ms is None else flush_interval_ms) / 1000
+        self.max_batch = Config.ORDER_MAX_BATCH if max_batch is None else max_batch
+        self.fsync = Config.ORDER_FSYNC if fsync is None else fsync
+        self._queue = queue.Queue()
+        # Giữ khi kiểm tra _closed + đưa vào hàng đợi: không có bản ghi nào vào sau lệnh dừng của close()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.batches = 0
+        self.written = 0
+        self._thread = threading.Thread(target=self._run, name="order-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, record: Dict) -> Future:
+        """Đưa bản ghi vào hàng đợi, trả về Future (kết quả = order_id khi đã ghi xong)"""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("OrderWriter đã đóng")
+            self._queue.put((record, future))
+        return future
+
+    def write(self, record: Dict, timeout: Optional[float] = None) -> str:
+        """Ghi bản ghi và chờ tới khi đã lưu bền vững"""
+        return self.submit(record).result(timeout)
+
+    def _collect(self, first):
+        """Gom thêm bản ghi trong khoảng flush_interval, trả về (batch, có lệnh dừng không)"""
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stop = False
+        while not stop:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch, stop = self._collect(first)
+            try:
+                self.store.append_many([record for record, _ in batch], fsync=self.fsync)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.written += len(batch)
+            for record, future in batch:
+                future.set_result(record.get('order_id'))
+
+    def close(self):
+        """Ghi nốt các bản ghi còn trong hàng đợi rồi dừng thread nền"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+
+    def stats(self):
+        return {
+            'written': self.written,
+            'batches': self.batches,
+            'avg_batch': self.written / self.batches if self.batches else 0.0
+        }
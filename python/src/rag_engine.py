@@ -1,7 +1,15 @@
 import os
 import re
-from sentence_transformers import SentenceTransformer
+import time
 from order_manager import OrderManager
+from model_registry import ModelRegistry
+from embedding_cache import QueryEmbeddingCache
+from answer_cache import SemanticAnswerCache
+from hybrid_retriever import HybridRetriever
+from menu_watcher import MenuWatcher
+from generation_policy import GenerationPolicy
+from context_builder import ContextBuilder
+from tracing import Tracer
 from config import Config
 
 class UniMSRAG:
@@ -12,60 +20,134 @@ class UniMSRAG:
     - Response Generation (Reader): Sinh câu trả lời
     - Order Management: Quản lý đơn hàng
     """
+    # Các intent được xử lý trực tiếp bởi OrderManager
+    ORDER_INTENTS = ("ORDER", "VIEW_ORDER", "ORDER_HISTORY", "CANCEL_ITEM", "UPDATE_QUANTITY", "CONFIRM_ORDER")
+    NOT_FOUND_MESSAGE = "Xin lỗi, tôi không tìm thấy thông tin phù hợp."
+
+    # Phần hướng dẫn cố định của planner (đặt trước câu hỏi để dùng chung KV-cache prefix)
+    PLANNER_INSTRUCTIONS = (
+        "Nhiệm vụ: Phân loại ý định (intent) của khách hàng.\n\n"
+        "CÁC INTENT:\n"
+        "1. [ORDER] - Đặt món, thêm món vào đơn\n"
+        "   Ví dụ: 'Tôi muốn đặt 2 phần phở', 'Cho tôi thêm trà sữa', 'Đặt vịt quay'\n"
+        "   QUAN TRỌNG: Phải có TÊN MÓN CỤ THỂ, không phải mô tả chung chung\n"
+        "2. [VIEW_ORDER] - Xem đơn hàng HIỆN TẠI (đang soạn, chưa xác nhận)\n"
+        "   Ví dụ: 'Xem đơn hàng', 'Đơn hiện tại', 'Giỏ hàng của tôi', 'Xem lại đơn'\n"
+        "   Từ khóa: 'xem', 'đơn', 'giỏ', 'hiện tại', 'đang đặt'\n"
+        "   KHÔNG có từ 'đã', 'lịch sử', 'trước', 'cũ'\n\n"
+        "3. [ORDER_HISTORY] - Xem LỊCH SỬ đơn hàng ĐÃ ĐẶT (quá khứ, đã hoàn thành)\n"
+        "   Ví dụ: 'Tôi đã đặt gì?', 'Lịch sử đơn hàng', 'Đơn hàng trước đây', 'Các đơn cũ'\n"
+        "   Từ khóa: 'ĐÃ', 'lịch sử', 'trước', 'cũ', 'hôm qua', 'tuần trước'\n"
+        "   QUAN TRỌNG: Có từ 'ĐÃ' hoặc ám chỉ quá khứ → ORDER_HISTORY\n\n"
+        "4. [CANCEL_ITEM] - Hủy/xóa món khỏi đơn\n"
+        "   Ví dụ: 'Hủy món gà rán', 'Xóa phở bò', 'Bỏ trà sữa đi'\n"
+        "5. [UPDATE_QUANTITY] - Thay đổi số lượng món\n"
+        "   Ví dụ: 'Đổi thành 3 phần', 'Tăng lên 5 ly', 'Giảm còn 1'\n"
+        "6. [CONFIRM_ORDER] - Xác nhận đặt hàng\n"
+        "   Ví dụ: 'Xác nhận đơn', 'Đặt luôn', 'OK đặt hàng'\n"
+        "7. [SEARCH] - Hỏi thông tin menu, giá cả, giờ mở cửa\n"
+        "   Ví dụ: 'Giá phở bò?', 'Có món chay không?', 'Mở cửa lúc mấy giờ?'\n"
+        "   'Tôi muốn ăn gì đó cay cay', 'Gợi ý món ngon', 'Món nào đặc sản?'\n"
+        "   QUAN TRỌNG: Câu hỏi gợi ý/tìm món theo khẩu vị là SEARCH, không phải ORDER\n"
+        "8. [NO_SEARCH] - Chào hỏi, cảm ơn\n"
+        "   Ví dụ: 'Xin chào', 'Cảm ơn', 'Tạm biệt'\n\n"
+        "Output CHỈ chứa 1 trong các intent trên: [ORDER], [VIEW_ORDER], [ORDER_HISTORY], "
+        "[CANCEL_ITEM], [UPDATE_QUANTITY], [CONFIRM_ORDER], [SEARCH], hoặc [NO_SEARCH]"
+    )
+
+    # Nhãn cho planner dạng classify: mỗi intent ứng với số thứ tự (1 token) trong PLANNER_INSTRUCTIONS
+    INTENT_LABELS = {
+        "ORDER": "1", "VIEW_ORDER": "2", "ORDER_HISTORY": "3", "CANCEL_ITEM": "4",
+        "UPDATE_QUANTITY": "5", "CONFIRM_ORDER": "6", "SEARCH": "7", "NO_SEARCH": "8"
+    }
+    INTENT_TAG_PATTERN = re.compile(r'\[(' + '|'.join(INTENT_LABELS) + r')\]')
+
     def __init__(self, llm, qdrant_client):
         self.llm = llm
         self.client = qdrant_client
-        self.encoder = SentenceTransformer(Config.EMBEDDING_MODEL)
-        self.order_manager = OrderManager(os.path.join(Config.DATA_DIR, 'menu_v2.json'))
-        self.current_user_id = "demo_user"
+        self.encoder = ModelRegistry.get_encoder()
+        self.query_cache = QueryEmbeddingCache(self.encoder, persist_path=Config.QUERY_CACHE_PATH)
+        self.answer_cache = SemanticAnswerCache()
+        menu_path = os.path.join(Config.DATA_DIR, 'menu_v2.json')
+        # Dữ liệu menu (tra cứu món, bộ luật intent, trả lời theo mẫu), thay nóng khi menu_v2.json đổi
+        self.menu = MenuWatcher(menu_path, client=qdrant_client)
+        # BM25 + vector + payload filter trên collection / BM25 của snapshot menu đang dùng
+        self.hybrid_retriever = HybridRetriever(qdrant_client, catalog=lambda: self.menu.current.catalog,
+                                                index=lambda: self.menu.current.index)
+        self.order_manager = OrderManager(menu_path, catalog=lambda: self.menu.current.catalog)
+        # Giỏ hàng theo phiên (TTL/LRU) + lock riêng cho từng phiên
+        self.sessions = self.order_manager.orders
+        self.last_stream_stats = {}
+        # Ngân sách token / chuỗi dừng / cap thích ứng cho từng loại câu trả lời
+        self.generation_policy = GenerationPolicy()
+        # Ngữ cảnh cho reader: chỉ các trường liên quan tới câu hỏi, trong ngân sách token
+        self.context_builder = ContextBuilder(getattr(llm, 'tokenizer', None))
+        # Đo thời gian từng bước của mỗi lượt (Config.TRACE_ENABLED)
+        self.tracer = Tracer()
+        # Phân phối xác suất intent của lần planner (classify) gần nhất
+        self.last_intent_probs = {}
+        # Tính sẵn KV-cache cho phần hướng dẫn cố định của planner
+        self.llm.register_prefix("planner", self.PLANNER_INSTRUCTIONS)
     
+    @property
+    def intent_classifier(self):
+        return self.menu.current.intent_classifier
+
+    @property
+    def fast_answer(self):
+        """Câu hỏi tra cứu giá / giờ mở cửa / liên hệ -> trả lời theo mẫu"""
+        return self.menu.current.fast_answer
+
     def planner(self, user_query):
         """
         Step 1: Knowledge Source Selection & Intent Classification
         Phân loại intent: ORDER, VIEW_ORDER, CANCEL_ITEM, INFO, ...
         """
-        prompt = (
-            f'Câu hỏi người dùng: "{user_query}"\n\n'
-            "Nhiệm vụ: Phân loại ý định (intent) của khách hàng.\n\n"
-            "CÁC INTENT:\n"
-            "1. [ORDER] - Đặt món, thêm món vào đơn\n"
-            "   Ví dụ: 'Tôi muốn đặt 2 phần phở', 'Cho tôi thêm trà sữa', 'Đặt vịt quay'\n"
-            "   QUAN TRỌNG: Phải có TÊN MÓN CỤ THỂ, không phải mô tả chung chung\n"
-            "2. [VIEW_ORDER] - Xem đơn hàng HIỆN TẠI (đang soạn, chưa xác nhận)\n"
-            "   Ví dụ: 'Xem đơn hàng', 'Đơn hiện tại', 'Giỏ hàng của tôi', 'Xem lại đơn'\n"
-            "   Từ khóa: 'xem', 'đơn', 'giỏ', 'hiện tại', 'đang đặt'\n"
-            "   KHÔNG có từ 'đã', 'lịch sử', 'trước', 'cũ'\n\n"
-            "3. [ORDER_HISTORY] - Xem LỊCH SỬ đơn hàng ĐÃ ĐẶT (quá khứ, đã hoàn thành)\n"
-            "   Ví dụ: 'Tôi đã đặt gì?', 'Lịch sử đơn hàng', 'Đơn hàng trước đây', 'Các đơn cũ'\n"
-            "   Từ khóa: 'ĐÃ', 'lịch sử', 'trước', 'cũ', 'hôm qua', 'tuần trước'\n"
-            "   QUAN TRỌNG: Có từ 'ĐÃ' hoặc ám chỉ quá khứ → ORDER_HISTORY\n\n"
-            "4. [CANCEL_ITEM] - Hủy/xóa món khỏi đơn\n"
-            "   Ví dụ: 'Hủy món gà rán', 'Xóa phở bò', 'Bỏ trà sữa đi'\n"
-            "5. [UPDATE_QUANTITY] - Thay đổi số lượng món\n"
-            "   Ví dụ: 'Đổi thành 3 phần', 'Tăng lên 5 ly', 'Giảm còn 1'\n"
-            "6. [CONFIRM_ORDER] - Xác nhận đặt hàng\n"
-            "   Ví dụ: 'Xác nhận đơn', 'Đặt luôn', 'OK đặt hàng'\n"
-            "7. [SEARCH] - Hỏi thông tin menu, giá cả, giờ mở cửa\n"
-            "   Ví dụ: 'Giá phở bò?', 'Có món chay không?', 'Mở cửa lúc mấy giờ?'\n"
-            "   'Tôi muốn ăn gì đó cay cay', 'Gợi ý món ngon', 'Món nào đặc sản?'\n"
-            "   QUAN TRỌNG: Câu hỏi gợi ý/tìm món theo khẩu vị là SEARCH, không phải ORDER\n"
-            "8. [NO_SEARCH] - Chào hỏi, cảm ơn\n"
-            "   Ví dụ: 'Xin chào', 'Cảm ơn', 'Tạm biệt'\n\n"
-            "Output CHỈ chứa 1 trong các intent trên: [ORDER], [VIEW_ORDER], [ORDER_HISTORY], "
-            "[CANCEL_ITEM], [UPDATE_QUANTITY], [CONFIRM_ORDER], [SEARCH], hoặc [NO_SEARCH]"
-        )
-        
-        response = self.llm.generate(prompt, max_new_tokens=30)
-        
-        # Parse intent
-        if   "[ORDER]" in response: return "ORDER"
-        elif "[VIEW_ORDER]" in response: return "VIEW_ORDER"
-        elif "[CANCEL_ITEM]" in response: return "CANCEL_ITEM"
-        elif "[ORDER_HISTORY]" in response: return "ORDER_HISTORY"
-        elif "[UPDATE_QUANTITY]" in response: return "UPDATE_QUANTITY"
-        elif "[CONFIRM_ORDER]" in response: return "CONFIRM_ORDER"
-        elif "[SEARCH]" in response: return "SEARCH"
-        else: return "NO_SEARCH"
+        # Fast path: bộ luật đủ tin cậy thì không cần gọi LLM
+        intent = self.intent_classifier.predict(user_query)
+        if intent:
+            self.intent_classifier.record("rule", intent)
+            self.tracer.add(planner="rule")
+            return intent
+
+        intent = self.llm_planner(user_query)
+        self.intent_classifier.record("llm", intent)
+        self.tracer.add(planner="llm")
+        return intent
+
+    def llm_planner(self, user_query):
+        """Phân loại intent bằng LLM (dùng khi bộ luật không chắc chắn)"""
+        if Config.PLANNER_MODE == "classify":
+            # 1 lần forward, chỉ chấm điểm 8 token nhãn -> intent + phân phối xác suất
+            intent, self.last_intent_probs = self.llm.classify(
+                self.planner_prompt(user_query, numbered=True), self.INTENT_LABELS
+            )
+            return intent
+
+        response = self.generate("planner", self.planner_prompt(user_query))
+        return self.parse_intent(response)
+
+    def llm_planner_batch(self, queries):
+        """llm_planner cho nhiều câu (1 lần forward/generate cho cả batch)"""
+        if Config.PLANNER_MODE == "classify":
+            results = self.llm.classify_batch(
+                [self.planner_prompt(q, numbered=True) for q in queries], self.INTENT_LABELS
+            )
+            return [intent for intent, _ in results]
+
+        outputs = self.generate_batch(["planner"] * len(queries), [self.planner_prompt(q) for q in queries])
+        return [self.parse_intent(output) for output in outputs]
+
+    def planner_prompt(self, user_query, numbered=False):
+        prompt = self.PLANNER_INSTRUCTIONS + f'\n\nCâu hỏi người dùng: "{user_query}"'
+        if numbered:
+            prompt += "\nChỉ trả lời bằng 1 chữ số (1-8) là số thứ tự của intent."
+        return prompt
+
+    def parse_intent(self, response):
+        """Parse intent từ output của LLM planner (lấy tag hợp lệ xuất hiện đầu tiên)"""
+        match = self.INTENT_TAG_PATTERN.search(response)
+        return match.group(1) if match else "NO_SEARCH"
         
     def is_specific_dish_order(self, user_query):
         """
@@ -139,14 +221,14 @@ class UniMSRAG:
         
         return dish_name.strip(), quantity
 
-    def handle_order(self, user_query):
+    def handle_order(self, user_id, user_query):
         """Xử lý đặt món"""
         dish_name, quantity = self.extract_order_info(user_query)
         
         if not dish_name:
             return "Xin lỗi, tôi chưa hiểu bạn muốn đặt món gì. Bạn có thể nói rõ hơn được không?"
         
-        result = self.order_manager.add_item(self.current_user_id, dish_name, quantity)
+        result = self.order_manager.add_item(user_id, dish_name, quantity)
         
         if result['success']:
             # Thêm thông tin món vừa đặt
@@ -158,19 +240,19 @@ class UniMSRAG:
             # Nếu không tìm thấy món, suggest
             return result['message'] + "\n\nBạn có thể hỏi 'Có những món nào?' để xem menu đầy đủ."
     
-    def handle_view_order(self):
+    def handle_view_order(self, user_id):
         """Xử lý xem đơn hàng"""
-        result = self.order_manager.view_order(self.current_user_id)
+        result = self.order_manager.view_order(user_id)
         if "đang trống" not in result['message']:
             result['message'] += "\n\n🔔 Bạn có muốn chốt đơn ngay không? Hãy gõ 'Xác nhận' hoặc 'Đặt hàng' để nhà hàng lên món nhé!"
         return result['message']
     
-    def handle_order_history(self):
+    def handle_order_history(self, user_id):
         """Xử lý xem lịch sử đơn hàng"""
-        result = self.order_manager.get_order_history(self.current_user_id)
+        result = self.order_manager.get_order_history(user_id)
         return result['message']
     
-    def handle_update_quantity(self, user_query):
+    def handle_update_quantity(self, user_id, user_query):
         """Xử lý cập nhật số lượng (Thêm hoặc Đổi)"""
         dish_name, quantity = self.extract_order_info(user_query)
         
@@ -182,11 +264,11 @@ class UniMSRAG:
         
         # Trường hợp 1: Dùng từ "thêm" -> Gọi add_item để cộng dồn
         if "thêm" in query_lower:
-            result = self.order_manager.add_item(self.current_user_id, dish_name, quantity)
+            result = self.order_manager.add_item(user_id, dish_name, quantity)
         
         # Trường hợp 2: Các từ khác ("đổi", "thành", "sửa", "lấy") -> Gọi update_quantity để set lại
         else:
-            result = self.order_manager.update_quantity(self.current_user_id, dish_name, quantity)
+            result = self.order_manager.update_quantity(user_id, dish_name, quantity)
             
         if result['success']:
             # Thêm thông tin món vừa đặt
@@ -198,7 +280,7 @@ class UniMSRAG:
             # Nếu không tìm thấy món, suggest
             return result['message'] + "\n\nBạn có thể hỏi 'Có những món nào?' để xem menu đầy đủ."
     
-    def handle_cancel_item(self, user_query):
+    def handle_cancel_item(self, user_id, user_query):
         """Xử lý hủy món"""
         # Trích xuất tên món cần hủy
         cancel_words = ['hủy', 'xóa', 'bỏ', 'cancel', 'remove']
@@ -211,10 +293,10 @@ class UniMSRAG:
         if not dish_name:
             return "Bạn muốn hủy món nào? Vui lòng cho tôi biết tên món."
         
-        result = self.order_manager.remove_item(self.current_user_id, dish_name)
+        result = self.order_manager.remove_item(user_id, dish_name)
         return result['message']
     
-    def handle_confirm_order(self, user_query):
+    def handle_confirm_order(self, user_id, user_query):
         """Xử lý xác nhận đơn hàng"""
         # Trích xuất thời gian giao hàng nếu có
         delivery_time = None
@@ -224,7 +306,7 @@ class UniMSRAG:
             minute = time_match.group(2) or "00"
             delivery_time = f"{hour}:{minute}"
         
-        result = self.order_manager.confirm_order(self.current_user_id, delivery_time)
+        result = self.order_manager.confirm_order(user_id, delivery_time)
         return result['message']
 
     def retriever(self, user_query, top_k=3):
@@ -232,29 +314,49 @@ class UniMSRAG:
         Step 2: Knowledge Retrieval [cite: 40, 141]
         Tìm kiếm các đoạn văn bản liên quan trong Qdrant.
         """
-        query_vector = self.encoder.encode(user_query).tolist()
-        hits = self.client.search(
-            collection_name=Config.COLLECTION_NAME,
-            query_vector=query_vector,
-            limit=top_k
-        )
+        query_vector = self.query_cache.encode(user_query)
+        hits = self.search(user_query, query_vector, top_k)
         results = [hit.payload['text'] for hit in hits]
         return results
 
+    def search(self, user_query, query_vector, top_k=3):
+        """Tìm các document liên quan nhất (hybrid BM25 + vector, có lọc; trả về cả id + payload)"""
+        return self.hybrid_retriever.search(user_query, query_vector, top_k)
+
+    def build_contexts(self, user_query, hits):
+        """Ngữ cảnh cho reader từ kết quả search (ContextBuilder: chọn trường, bỏ trùng, giới hạn token)"""
+        contexts = self.context_builder.build(user_query, [hit.payload or {} for hit in hits])
+        stats = self.context_builder.last_stats
+        if stats:
+            self.tracer.add(context_tokens=stats['context_tokens'], context_saved_tokens=stats['saved_tokens'])
+        return contexts
+
     def reader(self, user_query, retrieved_contexts):
         """
         Step 3: Response Generation [cite: 41, 143]
         Sinh câu trả lời dựa trên ngữ cảnh đã tìm được.
         """
+        return self.generate(self.reader_kind(user_query), self.reader_prompt(user_query, retrieved_contexts))
+
+    @staticmethod
+    def is_recommendation(user_query):
+        """Câu hỏi gợi ý món ăn (theo khẩu vị, đặc sản...)"""
+        return any(keyword in user_query.lower() for keyword in
+                   ['gợi ý', 'nên ăn', 'muốn ăn', 'ăn gì', 'món nào',
+                    'cay', 'ngọt', 'chua', 'đặc sản', 'signature'])
+
+    def reader_kind(self, user_query):
+        """Loại câu trả lời của reader cho GenerationPolicy"""
+        return "recommend" if self.is_recommendation(user_query) else "reader"
+
+    @classmethod
+    def reader_prompt(cls, user_query, retrieved_contexts):
+        """Tạo prompt cho reader từ ngữ cảnh đã truy xuất (không dùng trạng thái của instance)"""
         context_str = "\n".join([f"- {c}" for c in retrieved_contexts])
         
         # Kiểm tra xem có phải câu hỏi gợi ý món ăn không
-        is_recommendation = any(keyword in user_query.lower() for keyword in 
-                               ['gợi ý', 'nên ăn', 'muốn ăn', 'ăn gì', 'món nào', 
-                                'cay', 'ngọt', 'chua', 'đặc sản', 'signature'])
-        
-        if is_recommendation:
-            prompt = (
+        if cls.is_recommendation(user_query):
+            return (
                 "Dưới đây là thông tin từ cơ sở dữ liệu của nhà hàng Hòa Viên:\n"
                 f"{context_str}\n\n"
                 "Hãy đóng vai là nhân viên tư vấn nhiệt tình của Hòa Viên. "
@@ -265,7 +367,7 @@ class UniMSRAG:
                 "Trả lời:"
             )
         else:
-            prompt = (
+            return (
                 "Dưới đây là thông tin từ cơ sở dữ liệu của nhà hàng Hòa Viên:\n"
                 f"{context_str}\n\n"
                 "Hãy đóng vai là nhân viên phục vụ thân thiện của Hòa Viên. "
@@ -273,55 +375,289 @@ class UniMSRAG:
                 f"Khách hàng: {user_query}\n"
                 "Trả lời:"
             )
-        return self.llm.generate(prompt, max_new_tokens=300)
 
-    def process(self, user_query):
-        """
-        Xử lý query chính
-        """
+    def generate(self, kind, prompt):
+        """llm.generate với ngân sách token + chuỗi dừng theo loại câu trả lời (GenerationPolicy)"""
+        answer = self.llm.generate(prompt, **self.generation_policy.params(kind))
+        return self.generation_policy.finish(kind, answer, self.llm.last_stats)
+
+    def generate_batch(self, kinds, prompts):
+        """llm.generate_batch cho nhiều prompt (kinds[i] = loại câu trả lời của prompts[i])"""
+        answers = self.llm.generate_batch(prompts, **self.generation_policy.params(*set(kinds)))
+        rows = self.llm.last_stats.get('rows') or [{}] * len(answers)
+        return [self.generation_policy.finish(k, a, r) for k, a, r in zip(kinds, answers, rows)]
+
+    def generate_stream(self, kind, prompt):
+        """llm.generate_stream theo GenerationPolicy (đoạn đã gửi đi thì không cắt về cuối câu được)"""
+        chunks = []
+        for chunk in self.llm.generate_stream(prompt, **self.generation_policy.params(kind)):
+            chunks.append(chunk)
+            yield chunk
+        self.generation_policy.finish(kind, "".join(chunks), self.llm.last_stats, trim=False)
+
+    def fast_answer_for(self, user_query):
+        """Câu trả lời theo mẫu (giá món, giờ mở cửa, địa chỉ, liên hệ) hoặc None nếu cần retriever + reader"""
+        if not Config.FAST_ANSWERS:
+            return None
+        with self.tracer.span("fast_answer"):
+            answer = self.fast_answer.answer(user_query)
+        self.tracer.add(fast_answer=answer is not None)
+        return answer
+
+    def chitchat_prompt(self, user_query):
+        return (
+            "Bạn là nhân viên thân thiện của nhà hàng Hòa Viên. "
+            f'Khách hàng nói: "{user_query}". '
+            "Hãy phản hồi một cách lịch sự, ngắn gọn (1-2 câu)."
+        )
+
+    def resolve_intent(self, user_query, intent=None):
+        """Phân loại intent (nếu chưa có) và chuyển ORDER chung chung sang SEARCH"""
         # 1. Phân loại intent
-        intent = self.planner(user_query)
+        if intent is None:
+            with self.tracer.span("planner"):
+                intent = self.planner(user_query)
         print(f"[Intent]: {intent}")
         
         # 2. Kiểm tra lại nếu intent là ORDER
         if intent == "ORDER":
             # Kiểm tra xem có phải đặt món cụ thể không
-            if not self.is_specific_dish_order(user_query):
+            with self.tracer.span("override"):
+                specific = self.is_specific_dish_order(user_query)
+            if not specific:
                 # Nếu không phải đặt món cụ thể → chuyển sang SEARCH để gợi ý
                 # print("[Override]: Chuyển từ ORDER sang SEARCH (câu hỏi gợi ý)")
                 intent = "SEARCH"
+        return intent
+
+    def handle_order_intent(self, intent, user_id, user_query):
+        """Xử lý các intent thao tác trên đơn hàng (không cần LLM), tuần tự trong từng phiên"""
+        with self.sessions.session(user_id), self.tracer.span("order"):
+            if intent == "ORDER":
+                return self.handle_order(user_id, user_query)
+            
+            elif intent == "VIEW_ORDER":
+                return self.handle_view_order(user_id)
+            
+            elif intent == "ORDER_HISTORY":
+                return self.handle_order_history(user_id)
+            
+            elif intent == "CANCEL_ITEM":
+                return self.handle_cancel_item(user_id, user_query)
+            
+            elif intent == "UPDATE_QUANTITY":
+                return self.handle_update_quantity(user_id, user_query)
+            
+            elif intent == "CONFIRM_ORDER":
+                return self.handle_confirm_order(user_id, user_query)
+
+    def process(self, user_id, user_query):
+        """
+        Xử lý query chính của khách hàng user_id
+        """
+        with self.tracer.turn(mode="process", user_id=user_id), self.menu.pinned():
+            return self._process(user_id, user_query)
+
+    def _process(self, user_id, user_query):
+        intent = self.resolve_intent(user_query)
+        self.tracer.add(intent=intent)
                 
         # 3. Xử lý theo intent
-        if intent == "ORDER":
-            return self.handle_order(user_query)
-        
-        elif intent == "VIEW_ORDER":
-            return self.handle_view_order()
-        
-        elif intent == "ORDER_HISTORY":
-            return self.handle_order_history()
-        
-        elif intent == "CANCEL_ITEM":
-            return self.handle_cancel_item(user_query)
-        
-        elif intent == "UPDATE_QUANTITY":
-            return self.handle_update_quantity(user_query)
-        
-        elif intent == "CONFIRM_ORDER":
-            return self.handle_confirm_order(user_query)
+        if intent in self.ORDER_INTENTS:
+            return self.handle_order_intent(intent, user_id, user_query)
         
         elif intent == "SEARCH":
+            # Câu hỏi tra cứu 1 trường dữ liệu -> trả lời theo mẫu, không cần reader
+            answer = self.fast_answer_for(user_query)
+            if answer is not None:
+                return answer
+
             # Tìm kiếm thông tin từ database
-            contexts = self.retriever(user_query)
-            if contexts:
-                return self.reader(user_query, contexts)
-            else:
-                return "Xin lỗi, tôi không tìm thấy thông tin phù hợp."
+            with self.tracer.span("embed"):
+                query_vector = self.query_cache.encode(user_query)
+            with self.tracer.span("search"):
+                hits = self.search(user_query, query_vector)
+            contexts = self.build_contexts(user_query, hits)
+            if not contexts:
+                return self.NOT_FOUND_MESSAGE
+
+            # Câu hỏi tương đương + cùng ngữ cảnh đã được trả lời -> dùng lại, bỏ qua reader
+            context_key = self.answer_cache.context_key(hits)
+            with self.tracer.span("answer_cache"):
+                answer = self.answer_cache.lookup(query_vector, context_key)
+            self.tracer.add(answer_cache_hit=answer is not None)
+            if answer is None:
+                with self.tracer.span("reader"):
+                    answer = self.reader(user_query, contexts)
+                self.tracer.add_llm_stats("reader", self.llm.last_stats)
+                self.answer_cache.store(query_vector, context_key, answer)
+            return answer
         
         else:  # NO_SEARCH - chitchat
-            prompt = (
-                "Bạn là nhân viên thân thiện của nhà hàng Hòa Viên. "
-                f'Khách hàng nói: "{user_query}". '
-                "Hãy phản hồi một cách lịch sự, ngắn gọn (1-2 câu)."
-            )
-            return self.llm.generate(prompt, max_new_tokens=30)
\ No newline at end of file
+            with self.tracer.span("chitchat"):
+                answer = self.generate("chitchat", self.chitchat_prompt(user_query))
+            self.tracer.add_llm_stats("chitchat", self.llm.last_stats)
+            return answer
+
+    def process_stream(self, user_id, user_query):
+        """
+        Giống process nhưng yield câu trả lời theo từng đoạn (stream) cho reader và chitchat.
+        Sau khi kết thúc, last_stream_stats chứa ttft (tính từ lúc nhận câu hỏi) và total.
+        """
+        with self.tracer.turn(mode="stream", user_id=user_id), self.menu.pinned():
+            start = time.perf_counter()
+            ttft = None
+            for chunk in self._process_stream(user_id, user_query):
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                    self.tracer.add(ttft_ms=ttft * 1000)
+                yield chunk
+            self.last_stream_stats = {'ttft': ttft, 'total': time.perf_counter() - start}
+
+    def _process_stream(self, user_id, user_query):
+        intent = self.resolve_intent(user_query)
+        self.tracer.add(intent=intent)
+
+        if intent in self.ORDER_INTENTS:
+            yield self.handle_order_intent(intent, user_id, user_query)
+
+        elif intent == "SEARCH":
+            answer = self.fast_answer_for(user_query)
+            if answer is not None:
+                yield answer
+                return
+
+            with self.tracer.span("embed"):
+                query_vector = self.query_cache.encode(user_query)
+            with self.tracer.span("search"):
+                hits = self.search(user_query, query_vector)
+            contexts = self.build_contexts(user_query, hits)
+            if not contexts:
+                yield self.NOT_FOUND_MESSAGE
+                return
+
+            context_key = self.answer_cache.context_key(hits)
+            with self.tracer.span("answer_cache"):
+                answer = self.answer_cache.lookup(query_vector, context_key)
+            self.tracer.add(answer_cache_hit=answer is not None)
+            if answer is not None:
+                yield answer
+                return
+
+            chunks = []
+            for chunk in self.generate_stream(self.reader_kind(user_query), self.reader_prompt(user_query, contexts)):
+                chunks.append(chunk)
+                yield chunk
+            self.tracer.add_llm_stats("reader", self.llm.last_stats)
+            self.answer_cache.store(query_vector, context_key, "".join(chunks))
+
+        else:  # NO_SEARCH - chitchat
+            yield from self.generate_stream("chitchat", self.chitchat_prompt(user_query))
+            self.tracer.add_llm_stats("chitchat", self.llm.last_stats)
+
+    def process_batch(self, requests, top_k=3):
+        """
+        Xử lý nhiều query [(user_id, query)] cùng lúc (chế độ file input):
+        - Intent: bộ luật trước, các câu còn lại phân loại bằng LLM theo batch
+        - Các intent đơn hàng chạy tuần tự đúng thứ tự câu để giữ trạng thái giỏ hàng
+        - SEARCH: encode 1 batch, search_batch Qdrant 1 lần, reader generate theo batch
+        - NO_SEARCH: chitchat generate theo batch
+        Trạng thái giỏ hàng không ảnh hưởng câu trả lời SEARCH/NO_SEARCH nên có thể gom lại xử lý sau.
+        Câu bị lỗi nhận về Exception tại vị trí tương ứng (không làm hỏng các câu khác trong batch).
+        """
+        with self.tracer.turn(mode="batch", batch_size=len(requests)), self.menu.pinned():
+            return self._process_batch(requests, top_k)
+
+    def _process_batch(self, requests, top_k=3):
+        user_ids = [user_id for user_id, _ in requests]
+        queries = [query for _, query in requests]
+        responses = [None] * len(queries)
+
+        # 1. Phân loại intent
+        with self.tracer.span("planner"):
+            intents = [self.intent_classifier.predict(q) for q in queries]
+            for intent in intents:
+                if intent:
+                    self.intent_classifier.record("rule", intent)
+            pending = [i for i, intent in enumerate(intents) if intent is None]
+            if pending:
+                for i, intent in zip(pending, self.llm_planner_batch([queries[i] for i in pending])):
+                    intents[i] = intent
+                    self.intent_classifier.record("llm", intent)
+        intents = [self.resolve_intent(q, intent) for q, intent in zip(queries, intents)]
+        self.tracer.add(intents=intents, llm_planner=len(pending))
+
+        # 2. Intent đơn hàng: tuần tự theo thứ tự câu
+        for i, intent in enumerate(intents):
+            if intent in self.ORDER_INTENTS:
+                try:
+                    responses[i] = self.handle_order_intent(intent, user_ids[i], queries[i])
+                except Exception as e:
+                    responses[i] = e
+
+        # 3. SEARCH: câu tra cứu đơn giản trả lời theo mẫu; còn lại encode + search theo batch,
+        #    chỉ gọi reader cho các câu chưa có trong answer cache
+        search_idx = [i for i, intent in enumerate(intents) if intent == "SEARCH"]
+        if Config.FAST_ANSWERS and search_idx:
+            with self.tracer.span("fast_answer"):
+                for i in search_idx:
+                    responses[i] = self.fast_answer.answer(queries[i])
+            search_idx = [i for i in search_idx if responses[i] is None]
+            self.tracer.add(fast_answers=sum(intent == "SEARCH" for intent in intents) - len(search_idx))
+        try:
+            pending = []
+            context_tokens = context_saved = 0
+            for i, vector, hits in self.search_batch([queries[i] for i in search_idx], search_idx, top_k):
+                # Giống _process: dựng ngữ cảnh trước, không còn ngữ cảnh nào -> NOT_FOUND_MESSAGE
+                contexts = self.context_builder.build(queries[i], [hit.payload or {} for hit in hits])
+                stats = self.context_builder.last_stats
+                context_tokens += stats.get('context_tokens', 0)
+                context_saved += stats.get('saved_tokens', 0)
+                if not contexts:
+                    responses[i] = self.NOT_FOUND_MESSAGE
+                    continue
+                context_key = self.answer_cache.context_key(hits)
+                with self.tracer.span("answer_cache"):
+                    responses[i] = self.answer_cache.lookup(vector, context_key)
+                if responses[i] is None:
+                    pending.append((i, vector, context_key, self.reader_prompt(queries[i], contexts)))
+            # Cả batch là 1 turn của tracer -> cộng dồn thống kê ngữ cảnh
+            self.tracer.add(context_tokens=context_tokens, context_saved_tokens=context_saved)
+
+            if pending:
+                with self.tracer.span("reader"):
+                    answers = self.generate_batch([self.reader_kind(queries[i]) for i, *_ in pending],
+                                                  [prompt for *_, prompt in pending])
+                self.tracer.add_llm_stats("reader", self.llm.last_stats)
+                for (i, vector, context_key, _), answer in zip(pending, answers):
+                    responses[i] = answer
+                    self.answer_cache.store(vector, context_key, answer)
+        except Exception as e:
+            for i in search_idx:
+                if responses[i] is None:
+                    responses[i] = e
+
+        # 4. NO_SEARCH: chitchat theo batch
+        chat_idx = [i for i, intent in enumerate(intents) if intent == "NO_SEARCH"]
+        if chat_idx:
+            try:
+                with self.tracer.span("chitchat"):
+                    answers = self.generate_batch(["chitchat"] * len(chat_idx),
+                                                  [self.chitchat_prompt(queries[i]) for i in chat_idx])
+                self.tracer.add_llm_stats("chitchat", self.llm.last_stats)
+            except Exception as e:
+                answers = [e] * len(chat_idx)
+            for i, answer in zip(chat_idx, answers):
+                responses[i] = answer
+
+        return responses
+
+    def search_batch(self, queries, ids, top_k=3):
+        """Encode nhiều câu 1 lần + 1 request search_batch Qdrant (hybrid); trả về [(id, vector, hits)]"""
+        if not queries:
+            return []
+        with self.tracer.span("embed"):
+            vectors = self.query_cache.encode_batch(queries)
+        with self.tracer.span("search"):
+            all_hits = self.hybrid_retriever.search_batch(queries, vectors, top_k)
+        return list(zip(ids, vectors, all_hits))
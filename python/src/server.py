@@ -0,0 +1,244 @@
+"""
+Server HTTP + WebSocket cho chatbot (nhiều bàn / tablet dùng chung 1 model trên 1 máy CPU).
+
+    POST /chat   {"user_id": "ban_12", "query": "Cho tôi 2 phần há cảo"} -> {"answer": "..."}
+    GET  /ws     WebSocket: gửi {"user_id", "query"}, nhận {"type": "chunk", "text"} ... {"type": "done"}
+    GET  /health Trạng thái hàng đợi / batch
+
+Chạy: python src/server.py [--host 0.0.0.0] [--port 8080] [--workers 4 --threads 2]
+
+Nhiều worker: model được load 1 lần rồi fork (xem worker_pool.py), các worker cùng accept trên 1 socket.
+Giỏ hàng nằm trong bộ nhớ của từng worker nên câu hỏi của 1 user_id luôn được chuyển tới cùng 1 worker
+(owner_of) qua unix socket riêng của worker đó.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import tempfile
+from aiohttp import web, WSMsgType, ClientSession, UnixConnector
+from batch_scheduler import MicroBatchScheduler, QueueFullError
+from config import Config
+from main import build_bot, load_shared
+from model_registry import ModelRegistry
+from worker_pool import WorkerPool, owner_of
+
+def parse_request(data):
+    """Lấy (user_id, query) từ JSON request, sai định dạng -> ValueError"""
+    if not isinstance(data, dict):
+        raise ValueError("Request phải là JSON object")
+    query = data.get('query')
+    if not isinstance(query, str) or not query.strip():
+        raise ValueError("Thiếu 'query'")
+    user_id = str(data.get('user_id') or Config.DEFAULT_USER_ID)
+    return user_id, query.strip()
+
+def peer_for(app, user_id):
+    """ClientSession tới worker giữ phiên của user_id, None nếu là worker hiện tại (hoặc chỉ có 1 worker)"""
+    worker = app['worker']
+    if worker is None:
+        return None
+    worker_id, paths = worker
+    owner = owner_of(user_id, len(paths))
+    if owner == worker_id:
+        return None
+    if owner not in app['peers']:
+        app['peers'][owner] = ClientSession(connector=UnixConnector(path=paths[owner]))
+    return app['peers'][owner]
+
+async def chat(request):
+    try:
+        user_id, query = parse_request(await request.json())
+    except ValueError as e:
+        return web.json_response({'error': str(e)}, status=400)
+
+    peer = peer_for(request.app, user_id)
+    if peer is not None:
+        try:
+            async with peer.post("http://worker/chat", json={'user_id': user_id, 'query': query}) as resp:
+                return web.json_response(await resp.json(), status=resp.status,
+                                         headers={k: v for k, v in resp.headers.items() if k == 'Retry-After'})
+        except Exception as e:
+            return web.json_response({'error': f"Lỗi chuyển tiếp: {e}"}, status=502)
+
+    try:
+        answer = await request.app['scheduler'].submit(user_id, query)
+    except QueueFullError as e:
+        return web.json_response({'error': str(e)}, status=503, headers={'Retry-After': '1'})
+    except Exception as e:
+        return web.json_response({'error': f"Lỗi xử lý: {e}"}, status=500)
+    return web.json_response({'answer': answer})
+
+async def relay(ws, peer, relays, user_id, query):
+    """Chuyển 1 câu hỏi WebSocket sang worker giữ phiên, gửi lại các đoạn trả lời (giữ kết nối để dùng lại)"""
+    try:
+        if peer not in relays or relays[peer].closed:
+            relays[peer] = await peer.ws_connect("http://worker/ws")
+        peer_ws = relays[peer]
+        await peer_ws.send_json({'user_id': user_id, 'query': query})
+        async for msg in peer_ws:
+            if msg.type != WSMsgType.TEXT:
+                break
+            data = json.loads(msg.data)
+            await ws.send_json(data)
+            if data.get('type') in ('done', 'error'):
+                return
+    except Exception as e:
+        await ws.send_json({'type': 'error', 'message': f"Lỗi chuyển tiếp: {e}"})
+        return
+    await ws.send_json({'type': 'error', 'message': "Worker đóng kết nối."})
+
+async def stream(request):
+    """WebSocket: mỗi message là 1 câu hỏi, câu trả lời được gửi về theo từng đoạn"""
+    app = request.app
+    bot, scheduler = app['bot'], app['scheduler']
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+    loop = asyncio.get_event_loop()
+    relays = {}  # {ClientSession của worker khác: WebSocket tới worker đó}
+
+    try:
+        await serve_stream(ws, app, bot, scheduler, loop, relays)
+    finally:
+        for peer_ws in relays.values():
+            await peer_ws.close()
+    return ws
+
+async def serve_stream(ws, app, bot, scheduler, loop, relays):
+    async for msg in ws:
+        if msg.type != WSMsgType.TEXT:
+            continue
+        try:
+            user_id, query = parse_request(json.loads(msg.data))
+        except ValueError as e:
+            await ws.send_json({'type': 'error', 'message': str(e)})
+            continue
+        peer = peer_for(app, user_id)
+        if peer is not None:
+            await relay(ws, peer, relays, user_id, query)
+            continue
+        if app['streams'] >= Config.SERVER_MAX_STREAMS or scheduler.depth >= scheduler.max_queue:
+            await ws.send_json({'type': 'error', 'message': "Server đang bận, vui lòng thử lại sau."})
+            continue
+
+        # Thread model đẩy từng đoạn sang event loop qua queue
+        chunks = asyncio.Queue()
+        def produce():
+            try:
+                for chunk in bot.process_stream(user_id, query):
+                    loop.call_soon_threadsafe(chunks.put_nowait, ('chunk', chunk))
+                loop.call_soon_threadsafe(chunks.put_nowait, ('done', dict(bot.last_stream_stats)))
+            except Exception as e:
+                loop.call_soon_threadsafe(chunks.put_nowait, ('error', str(e)))
+
+        app['streams'] += 1
+        try:
+            task = asyncio.ensure_future(scheduler.run_exclusive(produce))
+            while True:
+                kind, payload = await chunks.get()
+                if kind == 'chunk':
+                    await ws.send_json({'type': 'chunk', 'text': payload})
+                elif kind == 'done':
+                    await ws.send_json({'type': 'done', **payload})
+                    break
+                else:
+                    await ws.send_json({'type': 'error', 'message': payload})
+                    break
+            await task
+        finally:
+            app['streams'] -= 1
+
+async def health(request):
+    app = request.app
+    result = {'status': 'ok', 'streams': app['streams'], **app['scheduler'].stats()}
+    result['menu_version'] = app['bot'].menu.current.version
+    if app['worker'] is not None:
+        result.update(worker=app['worker'][0], pid=os.getpid())
+    if app['bot'].tracer.enabled:
+        result['latency_ms'] = app['bot'].tracer.percentiles()
+    return web.json_response(result)
+
+def create_app(bot, worker=None):
+    """worker = (worker_id, [unix socket của từng worker]) khi chạy nhiều worker"""
+    app = web.Application()
+    app['bot'] = bot
+    app['scheduler'] = MicroBatchScheduler(bot)
+    app['streams'] = 0
+    app['worker'] = worker
+    app['peers'] = {}  # {worker_id: ClientSession qua unix socket}
+
+    async def on_startup(app):
+        await app['scheduler'].start()
+
+    async def on_cleanup(app):
+        await app['scheduler'].stop()
+        for peer in app['peers'].values():
+            await peer.close()
+        bot.query_cache.save()
+        bot.order_manager.close()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_post('/chat', chat)
+    app.router.add_get('/ws', stream)
+    app.router.add_get('/health', health)
+    return app
+
+def serve_workers(host, port, workers, threads=None):
+    """Load model 1 lần, mở socket rồi fork các worker; process này chỉ giám sát worker"""
+    # Mỗi worker giữ bản Qdrant riêng (copy khi fork) và tự cập nhật khi menu đổi (MenuWatcher)
+    # -> không để nhiều process cùng ghi 1 thư mục Qdrant local
+    if Config.MENU_WATCH_INTERVAL and Config.QDRANT_PATH != ":memory:":
+        Config.QDRANT_PATH = ":memory:"
+    shared = load_shared()
+    if shared is None:
+        return
+    # Encoder cũng load trước khi fork (ingest từ embedding artifact có thể chưa cần tới)
+    ModelRegistry.get_encoder()
+
+    listener = socket.create_server((host, port), backlog=512)
+    route_dir = tempfile.mkdtemp(prefix="chatbot-workers-")
+    paths = [os.path.join(route_dir, f"worker-{i}.sock") for i in range(workers)]
+    # Unix socket của từng worker mở ở process cha -> worker đang khởi động lại vẫn nhận kết nối (chờ trong backlog)
+    routes = []
+    for path in paths:
+        route = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        route.bind(path)
+        route.listen(512)
+        routes.append(route)
+
+    def serve(worker_id):
+        bot = build_bot(shared)
+        web.run_app(create_app(bot, (worker_id, paths)), sock=[listener, routes[worker_id]], print=None)
+
+    print(f"Server: http://{host}:{port}, {workers} worker")
+    try:
+        WorkerPool(serve, workers=workers, threads=threads).run()
+    finally:
+        listener.close()
+        for route in routes:
+            route.close()
+        shutil.rmtree(route_dir, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=Config.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=Config.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=Config.SERVER_WORKERS)
+    parser.add_argument("--threads", type=int, default=Config.SERVER_WORKER_THREADS,
+                        help="Số thread torch mỗi worker (mặc định: số CPU / số worker)")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        serve_workers(args.host, args.port, args.workers, args.threads)
+        return
+
+    bot = build_bot()
+    if bot is None:
+        return
+    web.run_app(create_app(bot), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from collections.abc import MutableMapping
+from config import Config
+
+class _Session:
+    __slots__ = ('cart', 'lock', 'last_active', 'pins')
+
+    def __init__(self, cart):
+        self.cart = cart
+        self.lock = threading.Lock()
+        self.last_active = time.monotonic()
+        # Số lượt đang dùng phiên (SessionStore.session), chỉ đổi khi giữ SessionStore._lock
+        self.pins = 0
+
+class SessionStore(MutableMapping):
+    """
+    Giỏ hàng theo phiên khách hàng, dùng như dict {user_id: [list of order items]}:
+    - Phiên không hoạt động quá ttl giây bị loại bỏ (giỏ hàng bị bỏ dở)
+    - Tối đa max_sessions phiên, vượt quá thì loại phiên ít dùng nhất (LRU)
+    - Mỗi phiên có 1 lock riêng (session(user_id)) để các phiên khác nhau xử lý song song;
+      phiên đang được dùng (kể cả đang chờ lock) không bị loại
+    """
+    def __init__(self, ttl=None, max_sessions=None):
+        self.ttl = Config.SESSION_TTL if ttl is None else ttl
+        self.max_sessions = Config.MAX_SESSIONS if max_sessions is None else max_sessions
+        self._sessions = OrderedDict()  # {user_id: _Session}, phiên dùng gần nhất ở cuối
+        self._lock = threading.Lock()
+        self.expired = 0
+        self.evicted = 0
+
+    def _evict(self):
+        """Loại phiên hết hạn + phiên LRU vượt max_sessions (gọi khi đang giữ lock); bỏ qua phiên đang được ghim"""
+        now = time.monotonic()
+        for user_id in list(self._sessions):
+            session = self._sessions[user_id]
+            if now - session.last_active < self.ttl:
+                break
+            if not session.pins:
+                del self._sessions[user_id]
+                self.expired += 1
+
+        for user_id in list(self._sessions):
+            if len(self._sessions) <= self.max_sessions:
+                break
+            if not self._sessions[user_id].pins:
+                del self._sessions[user_id]
+                self.evicted += 1
+
+    def _touch(self, user_id, create=False):
+        session = self._sessions.get(user_id)
+        if session is None:
+            if not create:
+                return None
+            session = self._sessions[user_id] = _Session([])
+        session.last_active = time.monotonic()
+        self._sessions.move_to_end(user_id)
+        return session
+
+    @contextmanager
+    def session(self, user_id):
+        """
+        Giữ lock của phiên trong khối with (tạo phiên rỗng nếu chưa có). Phiên được ghim từ trước khi
+        chờ lock tới khi nhả lock, _evict không loại được giỏ hàng đang sửa
+        """
+        with self._lock:
+            session = self._touch(user_id, create=True)
+            session.pins += 1
+            self._evict()
+        try:
+            with session.lock:
+                yield session
+        finally:
+            with self._lock:
+                session.pins -= 1
+
+    def __getitem__(self, user_id):
+        with self._lock:
+            session = self._touch(user_id)
+            if session is None:
+                raise KeyError(user_id)
+            return session.cart
+
+    def __setitem__(self, user_id, cart):
+        with self._lock:
+            self._touch(user_id, create=True).cart = cart
+            self._evict()
+
+    def __delitem__(self, user_id):
+        with self._lock:
+            del self._sessions[user_id]
+
+    def __contains__(self, user_id):
+        with self._lock:
+            return user_id in self._sessions
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._sessions))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def stats(self):
+        with self._lock:
+            self._evict()
+            return {
+                'sessions': len(self._sessions),
+                'max_sessions': self.max_sessions,
+                'expired': self.expired,
+                'evicted': self.evicted
+            }
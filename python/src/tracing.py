@@ -0,0 +1,155 @@
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from config import Config
+
+_NULL = nullcontext()
+
+class Tracer:
+    """
+    Đo thời gian từng bước của 1 lượt hỏi-đáp (turn):
+    - turn(): bao cả lượt, span(name): bao từng bước (planner, embed, search, reader...)
+    - Kết thúc turn -> 1 dòng JSON {thời gian từng span (ms), số token, intent...} ghi ra file/stderr
+    - Gom thời gian theo từng span để tính p50/p95/p99 (summary())
+    - Turn chậm hơn profile_slow_ms -> lưu kết quả cProfile vào profile_dir
+    Trạng thái turn lưu theo thread nên dùng được khi nhiều phiên chạy song song.
+    """
+    # Số mẫu gần nhất giữ lại cho mỗi span để tính percentile
+    MAX_SAMPLES = 10000
+
+    def __init__(self, enabled=None, path=None, profile_slow_ms=None, profile_dir=None):
+        self.enabled = Config.TRACE_ENABLED if enabled is None else enabled
+        self.path = Config.TRACE_PATH if path is None else path
+        self.profile_slow_ms = Config.PROFILE_SLOW_TURN_MS if profile_slow_ms is None else profile_slow_ms
+        self.profile_dir = profile_dir or Config.PROFILE_DIR
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=self.MAX_SAMPLES))  # {span: deque[ms]}
+        # Chỉ 1 profiler hoạt động tại 1 thời điểm (cProfile không chạy song song được)
+        self._profiler_lock = threading.Lock()
+
+    @property
+    def last_turn(self):
+        """Dict của turn vừa kết thúc trên thread hiện tại"""
+        return getattr(self._local, "last", None)
+
+    @property
+    def current(self):
+        """Dict của turn đang chạy trên thread hiện tại (None nếu không có)"""
+        return getattr(self._local, "turn", None)
+
+    def turn(self, **fields):
+        if not self.enabled or self.current is not None:
+            return _NULL
+        return self._turn(fields)
+
+    @contextmanager
+    def _turn(self, fields):
+        record = {'time': datetime.now().strftime("%Y-%m-%d %H:%M:%S"), **fields, 'spans': {}}
+        self._local.turn = record
+
+        profiler = None
+        if self.profile_slow_ms is not None and self._profiler_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+        start = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            record['error'] = repr(e)
+            raise
+        finally:
+            record['total_ms'] = (time.perf_counter() - start) * 1000
+            self._local.turn = None
+            self._local.last = record
+            if profiler is not None:
+                profiler.disable()
+                if record['total_ms'] >= self.profile_slow_ms:
+                    record['profile'] = self._dump_profile(profiler)
+                self._profiler_lock.release()
+            self._emit(record)
+
+    def span(self, name):
+        if self.current is None:
+            return _NULL
+        return self._span(name)
+
+    @contextmanager
+    def _span(self, name):
+        spans = self.current['spans']
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            # Span lặp lại trong 1 turn được cộng dồn
+            spans[name] = spans.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    def add(self, **fields):
+        """Gắn thêm thông tin vào turn hiện tại (intent, số token...)"""
+        if self.current is not None:
+            self.current.update(fields)
+
+    def add_llm_stats(self, prefix, stats):
+        """Gắn thống kê của LLMWrapper.last_stats (prefill/decode ms, số token) vào turn hiện tại"""
+        if self.current is None or not stats:
+            return
+        for key in ('prefill', 'decode'):
+            if stats.get(key) is not None:
+                self.current['spans'][f"{prefix}_{key}"] = stats[key] * 1000
+        for key in ('prompt_tokens', 'new_tokens'):
+            if key in stats:
+                self.current[f"{prefix}_{key}"] = stats[key]
+
+    def _dump_profile(self, profiler):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir, f"turn_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.prof")
+        profiler.dump_stats(path)
+        return path
+
+    def _emit(self, record):
+        with self._lock:
+            self._samples['total'].append(record['total_ms'])
+            for name, ms in record['spans'].items():
+                self._samples[name].append(ms)
+
+            line = json.dumps(record, ensure_ascii=False, default=str)
+            if self.path:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(line + "\n")
+            else:
+                print(f"[Trace] {line}", file=sys.stderr)
+
+    @staticmethod
+    def _percentile(values, q):
+        index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+        return values[index]
+
+    def percentiles(self):
+        """{span: {'count', 'p50', 'p95', 'p99'}} (ms)"""
+        with self._lock:
+            samples = {name: sorted(values) for name, values in self._samples.items() if values}
+        return {
+            name: {
+                'count': len(values),
+                'p50': self._percentile(values, 50),
+                'p95': self._percentile(values, 95),
+                'p99': self._percentile(values, 99),
+            }
+            for name, values in samples.items()
+        }
+
+    def summary(self):
+        stats = self.percentiles()
+        if not stats:
+            return "[Trace] Chưa có dữ liệu."
+        lines = [f"[Trace] {'span':<18} {'count':>6} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10}"]
+        for name, s in sorted(stats.items(), key=lambda kv: -kv[1]['p50']):
+            lines.append(f"[Trace] {name:<18} {s['count']:>6} {s['p50']:>10.1f} {s['p95']:>10.1f} {s['p99']:>10.1f}")
+        return "\n".join(lines)
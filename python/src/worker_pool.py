@@ -0,0 +1,126 @@
+import gc
+import os
+import signal
+import sys
+import time
+import traceback
+import zlib
+from config import Config
+from model_registry import configure_torch_threads
+
+def available_cpus():
+    """Các CPU process được phép chạy (theo affinity / cgroup cpuset nếu có)"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def plan_cpus(workers, threads=None):
+    """
+    Chia CPU cho các worker -> (threads, [[cpu, ...] của worker 0, ...]).
+    threads = số thread torch mỗi worker (None = chia đều số CPU). Không đủ CPU cho
+    workers x threads thì không ghim CPU (list rỗng) để các worker không chồng lên nhau.
+    """
+    cpus = available_cpus()
+    threads = threads or max(1, len(cpus) // workers)
+    if workers * threads > len(cpus):
+        return threads, [[] for _ in range(workers)]
+    return threads, [cpus[i * threads:(i + 1) * threads] for i in range(workers)]
+
+def owner_of(user_id, workers):
+    """Worker giữ phiên (giỏ hàng) của user_id: hash ổn định, giống nhau ở mọi process"""
+    return zlib.crc32(str(user_id).encode('utf-8')) % workers
+
+class WorkerPool:
+    """
+    Pre-fork: process cha load model 1 lần rồi fork ra N worker dùng chung trọng số (copy-on-write):
+    - gc.freeze() trước khi fork: GC không duyệt / ghi vào các object có sẵn -> trang nhớ không bị copy
+    - Mỗi worker đặt số thread torch riêng và ghim vào nhóm CPU riêng (N x T thread vừa đủ số core)
+    - Process cha chỉ giám sát: worker chết bất thường thì fork lại (cùng worker_id), SIGTERM/SIGINT
+      được chuyển cho các worker rồi chờ chúng thoát
+    target(worker_id) chạy trong worker (vd. server aiohttp), return là worker kết thúc.
+    """
+    # Worker chết trong vòng MIN_UPTIME giây sau khi khởi động -> chờ RESPAWN_DELAY rồi mới fork lại
+    MIN_UPTIME = 5.0
+    RESPAWN_DELAY = 1.0
+
+    def __init__(self, target, workers=None, threads=None, pin_cpus=None):
+        self.target = target
+        self.workers = workers or Config.SERVER_WORKERS
+        self.threads, self.cpus = plan_cpus(self.workers, threads or Config.SERVER_WORKER_THREADS)
+        self.pin_cpus = Config.SERVER_PIN_CPUS if pin_cpus is None else pin_cpus
+        self._children = {}  # {pid: (worker_id, thời điểm fork)}
+        self._stopping = False
+        self.restarts = 0
+
+    def _spawn(self, worker_id):
+        # Không để worker in lại phần output còn trong buffer của process cha
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            self._run_worker(worker_id)
+        self._children[pid] = (worker_id, time.monotonic())
+        cpus = f", CPU {self.cpus[worker_id]}" if self.pin_cpus and self.cpus[worker_id] else ""
+        print(f"[Worker {worker_id}] pid {pid}, {self.threads} thread{cpus}")
+
+    def _run_worker(self, worker_id):
+        """Chạy trong process con, không bao giờ return (os._exit)"""
+        code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            if self.pin_cpus and self.cpus[worker_id] and hasattr(os, 'sched_setaffinity'):
+                os.sched_setaffinity(0, self.cpus[worker_id])
+            configure_torch_threads(self.threads)
+            self.target(worker_id)
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else 1
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    def stop(self, signum=None, frame=None):
+        """Dừng pool: gửi SIGTERM cho các worker, run() return khi tất cả đã thoát"""
+        self._stopping = True
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    @staticmethod
+    def _describe(status):
+        if os.WIFSIGNALED(status):
+            return f"signal {os.WTERMSIG(status)}"
+        return f"exit code {os.WEXITSTATUS(status)}"
+
+    def run(self):
+        """Fork các worker rồi giám sát tới khi stop() (hoặc SIGTERM/SIGINT)"""
+        # Object tạo tới giờ (model, menu, index...) không bao giờ bị GC duyệt lại trong worker
+        gc.collect()
+        gc.freeze()
+        # Tokenizer (Rust) đã dùng thread ở process cha, trong worker chạy tuần tự để tránh deadlock sau fork
+        os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for worker_id in range(self.workers):
+            self._spawn(worker_id)
+
+        while self._children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            worker_id, started = self._children.pop(pid, (None, 0))
+            if worker_id is None or self._stopping:
+                continue
+            print(f"[Worker {worker_id}] pid {pid} dừng ({self._describe(status)}), khởi động lại...")
+            if time.monotonic() - started < self.MIN_UPTIME:
+                time.sleep(self.RESPAWN_DELAY)
+            if not self._stopping:
+                self.restarts += 1
+                self._spawn(worker_id)